@@ -0,0 +1,333 @@
+# bulk.py
+"""
+Set-based Postgres helpers for the GoHighLevel syncs.
+
+These bypass the ORM's per-object machinery (bulk_create + bulk_update with
+their SELECT-then-diff round-trips and large CASE statements) and talk to
+Postgres directly with one statement per batch. ``copy_upsert`` goes one
+step further for initial loads and full resyncs: rows are streamed through
+``COPY`` into a temporary staging table and merged with one statement.
+"""
+import datetime
+import json
+import logging
+import re
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.postgres.fields import ArrayField
+from django.db import connection, models, transaction
+
+logger = logging.getLogger(__name__)
+
+
+def _batches(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _cast_type(field):
+    """
+    Column type of ``field`` without its length or precision (``varchar(50)``
+    becomes ``varchar``). An explicit cast to ``varchar(n)`` silently cuts
+    longer strings, so parameters are cast to the base type and lengths are
+    enforced by ``_clip_to_max_length``.
+    """
+    return re.sub(r'\([^)]*\)', '', field.db_type(connection))
+
+
+def _clip_to_max_length(model, instances, fields, conflict_field):
+    """
+    Cut string values (and string array items) longer than their field's
+    ``max_length``, logging a warning for each. Postgres would reject them,
+    failing the whole batch for one overlong upstream value.
+    """
+    limits = []
+    for field in fields:
+        base_field = field.base_field if isinstance(field, ArrayField) else field
+        if isinstance(base_field, models.CharField) and base_field.max_length:
+            limits.append((field, base_field.max_length))
+
+    def clip(instance, field, value, max_length):
+        if isinstance(value, str) and len(value) > max_length:
+            logger.warning(
+                f"Truncating {model._meta.label}.{field.name} of {getattr(instance, conflict_field)} "
+                f"from {len(value)} to {max_length} characters"
+            )
+            return value[:max_length]
+        return value
+
+    for instance in instances:
+        for field, max_length in limits:
+            value = getattr(instance, field.attname)
+            if isinstance(field, ArrayField) and isinstance(value, list):
+                value = [clip(instance, field, item, max_length) for item in value]
+            else:
+                value = clip(instance, field, value, max_length)
+            setattr(instance, field.attname, value)
+
+
+def _conflict_condition(meta, hash_field, newer_field=None):
+    """``ON CONFLICT DO UPDATE ... WHERE`` clause: content changed and, with ``newer_field``, not older"""
+    qn = connection.ops.quote_name
+    hash_column = qn(meta.get_field(hash_field).column)
+    condition = f"t.{hash_column} IS DISTINCT FROM EXCLUDED.{hash_column}"
+    if newer_field:
+        column = qn(meta.get_field(newer_field).column)
+        condition += f" AND (t.{column} IS NULL OR EXCLUDED.{column} IS NULL OR t.{column} <= EXCLUDED.{column})"
+    return condition
+
+
+def upsert(model, instances, conflict_field, update_fields, hash_field='content_hash',
+           stamp_field='sync_generation', batch_size=None, newer_field=None):
+    """
+    Insert or update model instances with ``INSERT ... ON CONFLICT DO UPDATE``.
+
+    Existing rows are never read into Python. A conflicting row is only
+    rewritten when its ``hash_field`` differs from the incoming one; rows
+    whose content is unchanged just get ``stamp_field`` set to the incoming
+    generation by a narrow follow-up UPDATE, so ``sweep`` keeps them.
+
+    With ``newer_field`` a conflicting row is also left alone when its stored
+    value is newer than the incoming one, so an event delivered out of order
+    cannot overwrite fresher data; such rows are counted as skipped.
+
+    String values longer than their field's ``max_length`` are cut to fit,
+    with a warning, instead of failing the batch.
+
+    Args:
+        model: Django model class.
+        instances (list): Unsaved instances carrying the values to write
+            (including ``hash_field`` and ``stamp_field``).
+        conflict_field (str): Unique field identifying a row (e.g. ``id``,
+            ``contact_id``).
+        update_fields (list): Fields written on insert and on update.
+        batch_size (int, optional): Rows per statement, defaults to
+            ``GHL_SYNC_CHUNK_SIZE``.
+        newer_field (str, optional): Upstream modification time (e.g.
+            ``updated_at``); rows are only overwritten by values at least
+            as new. NULL on either side does not block the write.
+
+    Returns:
+        Counter: ``created``, ``updated`` and ``skipped`` row counts.
+    """
+    report = Counter(created=0, updated=0, skipped=0)
+    if not instances:
+        return report
+
+    # The same key twice in one INSERT ... ON CONFLICT is an error in
+    # Postgres; keep the last occurrence (pages can overlap).
+    unique = {}
+    for instance in instances:
+        unique[getattr(instance, conflict_field)] = instance
+    instances = list(unique.values())
+
+    meta = model._meta
+    qn = connection.ops.quote_name
+    table = qn(meta.db_table)
+    fields = [meta.get_field(conflict_field)] + [
+        meta.get_field(name) for name in update_fields if name != conflict_field
+    ]
+    _clip_to_max_length(model, instances, fields, conflict_field)
+    conflict_column = qn(meta.get_field(conflict_field).column)
+    columns = ", ".join(qn(field.column) for field in fields)
+    row_sql = "(" + ", ".join(f"%s::{_cast_type(field)}" for field in fields) + ")"
+    assignments = ", ".join(
+        f"{qn(field.column)} = EXCLUDED.{qn(field.column)}" for field in fields[1:]
+    )
+    stamp_column = qn(meta.get_field(stamp_field).column)
+    stamp_value = getattr(instances[0], stamp_field)
+    condition = _conflict_condition(meta, hash_field, newer_field)
+
+    batch_size = batch_size or getattr(settings, 'GHL_SYNC_CHUNK_SIZE', 500)
+    with transaction.atomic(), connection.cursor() as cursor:
+        for batch in _batches(instances, batch_size):
+            params = []
+            for instance in batch:
+                for field in fields:
+                    params.append(field.get_db_prep_save(getattr(instance, field.attname), connection))
+
+            cursor.execute(
+                f"INSERT INTO {table} AS t ({columns}) VALUES {', '.join([row_sql] * len(batch))} "
+                f"ON CONFLICT ({conflict_column}) DO UPDATE SET {assignments} "
+                f"WHERE {condition} "
+                f"RETURNING t.{conflict_column}, (t.xmax = 0) AS inserted",
+                params,
+            )
+            written = cursor.fetchall()
+            created = sum(1 for _, inserted in written if inserted)
+            report['created'] += created
+            report['updated'] += len(written) - created
+
+            written_keys = {key for key, _ in written}
+            unchanged = [getattr(i, conflict_field) for i in batch if getattr(i, conflict_field) not in written_keys]
+            if unchanged:
+                cursor.execute(
+                    f"UPDATE {table} SET {stamp_column} = %s WHERE {conflict_column} = ANY(%s)",
+                    [stamp_value, unchanged],
+                )
+                report['skipped'] += len(unchanged)
+
+    logger.info(f"Upserted {meta.label}: created={report['created']}, updated={report['updated']}, skipped={report['skipped']}")
+    return report
+
+
+def sweep(model, generation, generation_field='sync_generation', **scope):
+    """
+    Delete the rows of a scope that the sync run ``generation`` did not touch.
+
+    Runs one ``DELETE ... WHERE <scope> AND (generation IS NULL OR generation < %s)``,
+    so no ID list is ever built in Python.
+
+    Args:
+        model: Django model class.
+        generation (int): ID of the completed SyncRun.
+        **scope: Field/value pairs limiting the sweep (e.g. ``location_id``);
+            at least one is required.
+
+    Returns:
+        int: Number of deleted rows.
+    """
+    if not scope or not all(scope.values()):
+        raise ValueError(f"Refusing to sweep {model._meta.label} without a complete scope: {scope}")
+
+    meta = model._meta
+    qn = connection.ops.quote_name
+    conditions = [f"{qn(meta.get_field(name).column)} = %s" for name in scope]
+    generation_column = qn(meta.get_field(generation_field).column)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {qn(meta.db_table)} WHERE {' AND '.join(conditions)} "
+            f"AND ({generation_column} IS NULL OR {generation_column} < %s)",
+            list(scope.values()) + [generation],
+        )
+        return cursor.rowcount
+
+
+def _array_literal(values):
+    """Postgres array literal (``{"a","b"}``) for a list of scalars"""
+    items = []
+    for item in values:
+        if item is None:
+            items.append('NULL')
+        else:
+            items.append('"' + str(item).replace('\\', '\\\\').replace('"', '\\"') + '"')
+    return '{' + ','.join(items) + '}'
+
+
+def _copy_text(field, value):
+    """Render one value in the ``COPY ... FROM STDIN`` text format"""
+    if value is None:
+        return '\\N'
+    if isinstance(field, models.JSONField):
+        value = json.dumps(value, cls=field.encoder)
+    elif isinstance(field, ArrayField):
+        value = _array_literal(value)
+    else:
+        value = field.get_db_prep_save(value, connection)
+        if value is None:
+            return '\\N'
+        if isinstance(value, bool):
+            return 't' if value else 'f'
+        if isinstance(value, (datetime.datetime, datetime.date)):
+            value = value.isoformat()
+    return (
+        str(value)
+        .replace('\\', '\\\\')
+        .replace('\t', '\\t')
+        .replace('\n', '\\n')
+        .replace('\r', '\\r')
+    )
+
+
+class _CopyStream:
+    """File-like object feeding rows to ``copy_expert`` without building the whole payload"""
+
+    def __init__(self, instances, fields):
+        self._lines = (
+            '\t'.join(_copy_text(field, getattr(instance, field.attname)) for field in fields) + '\n'
+            for instance in instances
+        )
+        self._buffer = ''
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            line = next(self._lines, None)
+            if line is None:
+                break
+            self._buffer += line
+        if size < 0:
+            data, self._buffer = self._buffer, ''
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def copy_upsert(model, instances, conflict_field, update_fields, hash_field='content_hash',
+                stamp_field='sync_generation', newer_field=None):
+    """
+    Bulk-load variant of ``upsert`` for initial imports and full resyncs.
+
+    All rows are streamed with ``COPY`` into a temporary staging table (only
+    the written columns, no constraints or indexes) and merged into the model
+    table with a single ``INSERT ... SELECT ... ON CONFLICT DO UPDATE``; the
+    unchanged rows are then re-stamped with one joined UPDATE. Nothing is
+    returned to Python per row, so the cost stays in Postgres.
+
+    Takes the same arguments and returns the same ``Counter`` as ``upsert``.
+    """
+    report = Counter(created=0, updated=0, skipped=0)
+    if not instances:
+        return report
+
+    unique = {}
+    for instance in instances:
+        unique[getattr(instance, conflict_field)] = instance
+    instances = list(unique.values())
+
+    meta = model._meta
+    qn = connection.ops.quote_name
+    table = qn(meta.db_table)
+    staging = qn(f"{meta.db_table}_staging")
+    fields = [meta.get_field(conflict_field)] + [
+        meta.get_field(name) for name in update_fields if name != conflict_field
+    ]
+    _clip_to_max_length(model, instances, fields, conflict_field)
+    conflict_column = qn(meta.get_field(conflict_field).column)
+    columns = ", ".join(qn(field.column) for field in fields)
+    assignments = ", ".join(
+        f"{qn(field.column)} = EXCLUDED.{qn(field.column)}" for field in fields[1:]
+    )
+    stamp_column = qn(meta.get_field(stamp_field).column)
+    stamp_value = getattr(instances[0], stamp_field)
+    condition = _conflict_condition(meta, hash_field, newer_field)
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {staging}")
+        cursor.execute(f"CREATE TEMPORARY TABLE {staging} ON COMMIT DROP AS SELECT {columns} FROM {table} WITH NO DATA")
+        cursor.copy_expert(f"COPY {staging} ({columns}) FROM STDIN", _CopyStream(instances, fields))
+
+        cursor.execute(
+            f"WITH merged AS ("
+            f"INSERT INTO {table} AS t ({columns}) SELECT {columns} FROM {staging} "
+            f"ON CONFLICT ({conflict_column}) DO UPDATE SET {assignments} "
+            f"WHERE {condition} "
+            f"RETURNING (t.xmax = 0) AS inserted"
+            f") SELECT count(*) FILTER (WHERE inserted), count(*) FROM merged"
+        )
+        created, written = cursor.fetchone()
+        report['created'] = created
+        report['updated'] = written - created
+        report['skipped'] = len(instances) - written
+
+        if report['skipped']:
+            cursor.execute(
+                f"UPDATE {table} AS t SET {stamp_column} = %s FROM {staging} AS s "
+                f"WHERE t.{conflict_column} = s.{conflict_column} "
+                f"AND t.{stamp_column} IS DISTINCT FROM %s",
+                [stamp_value, stamp_value],
+            )
+
+    logger.info(f"Bulk-loaded {meta.label}: created={report['created']}, updated={report['updated']}, skipped={report['skipped']}")
+    return report
@@ -0,0 +1,370 @@
+# dashboard.py
+"""
+Read-side queries behind the dashboard JSON endpoints.
+
+Opportunity lists use keyset pagination on ``(updated_at, id)``: the cursor
+carries the sort key of the last row returned and the next page starts right
+after it, so every page is a bounded index range scan (see the indexes on
+``Opportunity``) no matter how deep the client pages.
+
+KPI tiles read ``OpportunitySummary``, a rollup that the syncs rebuild per
+pipeline and webhook events adjust by one row, so they cost O(groups)
+rather than O(opportunities).
+
+Responses are cached under a per-location version number that writers bump
+after committing (``bump_dashboard_version``); a bump makes every cached
+response of the location unreachable, so stale data is never served.
+"""
+import base64
+import hashlib
+import json
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Max, Q, Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from accounts.models import Opportunity, OpportunitySummary
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+OPPORTUNITY_FILTERS = ['location_id', 'pipeline_id', 'pipeline_stage_id', 'assigned_to', 'status']
+
+# Internal sync bookkeeping is never exposed
+OPPORTUNITY_FIELDS = [
+    field.name for field in Opportunity._meta.concrete_fields
+    if field.name not in ('content_hash', 'sync_generation')
+]
+
+
+class QueryError(ValueError):
+    """Invalid client-supplied query parameters (reported as HTTP 400)"""
+
+
+def encode_cursor(updated_at, pk):
+    raw = json.dumps([updated_at.isoformat(), pk]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        updated_at, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        updated_at = parse_datetime(updated_at)
+    except (ValueError, TypeError):
+        raise QueryError("Invalid cursor")
+    if updated_at is None:
+        raise QueryError("Invalid cursor")
+    return updated_at, pk
+
+
+def _parse_fields(value):
+    if not value:
+        return list(OPPORTUNITY_FIELDS)
+    fields = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = sorted(set(fields) - set(OPPORTUNITY_FIELDS))
+    if unknown:
+        raise QueryError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+
+def _parse_limit(value):
+    if not value:
+        return DEFAULT_PAGE_SIZE
+    try:
+        limit = int(value)
+    except ValueError:
+        raise QueryError("limit must be an integer")
+    if limit < 1:
+        raise QueryError("limit must be positive")
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def _parse_datetime_param(params, name):
+    value = params.get(name)
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise QueryError(f"{name} must be an ISO 8601 datetime")
+    return parsed
+
+
+def _require_location(params):
+    # Every dashboard index leads with location_id; without it a query is a sequential scan
+    if not params.get('location_id'):
+        raise QueryError("location_id is required")
+
+
+def list_opportunities(params):
+    """
+    One page of opportunities, newest update first.
+
+    Args:
+        params (QueryDict | dict): ``location_id`` (required), equality filters
+            (``OPPORTUNITY_FILTERS``), ``updated_after``/``updated_before``,
+            ``fields`` (comma separated subset of ``OPPORTUNITY_FIELDS``),
+            ``limit`` and the ``cursor`` returned by the previous page.
+
+    Returns:
+        dict: ``{"results": [...], "next_cursor": str | None}``
+
+    Raises:
+        QueryError: on invalid parameters.
+    """
+    _require_location(params)
+    fields = _parse_fields(params.get('fields'))
+    limit = _parse_limit(params.get('limit'))
+
+    queryset = Opportunity.objects.filter(
+        **{name: params[name] for name in OPPORTUNITY_FILTERS if params.get(name)}
+    )
+    updated_after = _parse_datetime_param(params, 'updated_after')
+    if updated_after:
+        queryset = queryset.filter(updated_at__gt=updated_after)
+    updated_before = _parse_datetime_param(params, 'updated_before')
+    if updated_before:
+        queryset = queryset.filter(updated_at__lt=updated_before)
+
+    if params.get('cursor'):
+        updated_at, pk = decode_cursor(params['cursor'])
+        # (updated_at, id) < cursor, spelled with a leading range condition the index can seek on
+        queryset = queryset.filter(
+            Q(updated_at__lte=updated_at) & (Q(updated_at__lt=updated_at) | Q(id__lt=pk))
+        )
+
+    # The sort key is always selected so the cursor can be built from the last row
+    columns = list(dict.fromkeys(fields + ['updated_at', 'id']))
+    rows = list(queryset.order_by('-updated_at', '-id').values(*columns)[:limit + 1])
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]['updated_at'], rows[-1]['id'])
+
+    return {
+        'results': [{name: row[name] for name in fields} for row in rows],
+        'next_cursor': next_cursor,
+    }
+
+
+SUMMARY_DIMENSIONS = ['pipeline_id', 'pipeline_stage_id', 'status', 'assigned_to']
+# Display name carried along with each dimension that has one
+SUMMARY_LABELS = {
+    'pipeline_id': 'pipeline_name',
+    'pipeline_stage_id': 'pipeline_stage_name',
+    'assigned_to': 'assigned_user_name',
+}
+
+
+def refresh_pipeline_summary(location_id, pipeline_id):
+    """
+    Rebuild the OpportunitySummary rows of one pipeline from the Opportunity table.
+
+    A single ``DELETE`` + ``INSERT ... SELECT ... GROUP BY`` in one
+    transaction, reading only the pipeline's rows through the
+    ``opp_pipeline_stage_idx`` index. Concurrent refreshes of the same
+    pipeline are serialised with a transaction-level advisory lock.
+
+    Returns:
+        int: Number of summary rows written.
+    """
+    qn = connection.ops.quote_name
+    summary = qn(OpportunitySummary._meta.db_table)
+    opportunities = qn(Opportunity._meta.db_table)
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        lock_pipeline_summaries(location_id, [pipeline_id])
+        cursor.execute(
+            f"DELETE FROM {summary} WHERE location_id = %s AND pipeline_id = %s",
+            [location_id, pipeline_id],
+        )
+        cursor.execute(
+            f"INSERT INTO {summary} (location_id, pipeline_id, pipeline_stage_id, status, assigned_to, "
+            f"pipeline_name, pipeline_stage_name, assigned_user_name, opportunity_count, total_value, refreshed_at) "
+            f"SELECT location_id, pipeline_id, pipeline_stage_id, status, COALESCE(assigned_to, ''), "
+            f"MAX(pipeline_name), MAX(pipeline_stage_name), MAX(assigned_user_name), "
+            f"COUNT(*), COALESCE(SUM(monetary_value), 0), %s "
+            f"FROM {opportunities} WHERE location_id = %s AND pipeline_id = %s "
+            f"GROUP BY location_id, pipeline_id, pipeline_stage_id, status, COALESCE(assigned_to, '')",
+            [timezone.now(), location_id, pipeline_id],
+        )
+        return cursor.rowcount
+
+
+def lock_pipeline_summaries(location_id, pipeline_ids):
+    """
+    Take the transaction-level advisory locks guarding the OpportunitySummary
+    rows of the given pipelines. Locks are taken in sorted order so two
+    writers locking overlapping pipelines cannot deadlock.
+    """
+    with connection.cursor() as cursor:
+        for pipeline_id in sorted(set(pipeline_ids) - {None, ''}):
+            cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", [f"summary:{location_id}:{pipeline_id}"])
+
+
+def apply_summary_delta(old, new):
+    """
+    Move one opportunity between OpportunitySummary groups without a rebuild.
+
+    Subtracts ``old`` (the row before the write, None if it was created) from
+    its group and adds ``new`` (the row after, None if it was deleted) to its
+    group, one ``INSERT ... ON CONFLICT`` each; groups left empty are deleted.
+    Run inside the writing transaction, holding ``lock_pipeline_summaries``
+    for both pipelines.
+    """
+    qn = connection.ops.quote_name
+    summary = qn(OpportunitySummary._meta.db_table)
+    group = "location_id, pipeline_id, pipeline_stage_id, status, assigned_to"
+    now = timezone.now()
+
+    with connection.cursor() as cursor:
+        for opportunity, sign in ((old, -1), (new, 1)):
+            if opportunity is None:
+                continue
+            # The added row carries the current labels; a removal keeps the group's
+            labels = (
+                "pipeline_name = EXCLUDED.pipeline_name, pipeline_stage_name = EXCLUDED.pipeline_stage_name, "
+                "assigned_user_name = EXCLUDED.assigned_user_name, "
+            ) if sign > 0 else ""
+            key = [
+                opportunity.location_id, opportunity.pipeline_id, opportunity.pipeline_stage_id,
+                opportunity.status, opportunity.assigned_to or '',
+            ]
+            cursor.execute(
+                f"INSERT INTO {summary} AS s ({group}, pipeline_name, pipeline_stage_name, assigned_user_name, "
+                f"opportunity_count, total_value, refreshed_at) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) "
+                f"ON CONFLICT ({group}) DO UPDATE SET {labels}"
+                f"opportunity_count = s.opportunity_count + EXCLUDED.opportunity_count, "
+                f"total_value = s.total_value + EXCLUDED.total_value, refreshed_at = EXCLUDED.refreshed_at",
+                key + [
+                    opportunity.pipeline_name, opportunity.pipeline_stage_name, opportunity.assigned_user_name,
+                    sign, sign * (opportunity.monetary_value or 0), now,
+                ],
+            )
+            if sign < 0:
+                cursor.execute(
+                    f"DELETE FROM {summary} WHERE ({group}) = (%s, %s, %s, %s, %s) AND opportunity_count <= 0",
+                    key,
+                )
+
+
+def _parse_group_by(value):
+    if not value:
+        return list(SUMMARY_DIMENSIONS)
+    dimensions = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = sorted(set(dimensions) - set(SUMMARY_DIMENSIONS))
+    if unknown:
+        raise QueryError(f"Unknown group_by dimensions: {', '.join(unknown)}")
+    return dimensions
+
+
+def pipeline_summary(params):
+    """
+    Opportunity counts and values for the dashboard tiles.
+
+    Args:
+        params (QueryDict | dict): ``location_id`` (required), equality filters
+            (``OPPORTUNITY_FILTERS``) and ``group_by``, a comma separated
+            subset of ``SUMMARY_DIMENSIONS`` (all of them by default).
+
+    Returns:
+        dict: ``{"groups": [...], "totals": {"opportunity_count", "total_value"}}``
+
+    Raises:
+        QueryError: on invalid parameters.
+    """
+    _require_location(params)
+    dimensions = _parse_group_by(params.get('group_by'))
+    queryset = OpportunitySummary.objects.filter(
+        **{name: params[name] for name in OPPORTUNITY_FILTERS if params.get(name)}
+    )
+
+    # Annotations may not reuse a model field name, so labels are renamed afterwards
+    labels = {f"{SUMMARY_LABELS[name]}__max": Max(SUMMARY_LABELS[name]) for name in dimensions if name in SUMMARY_LABELS}
+    groups = [
+        {key.removesuffix('__max'): value for key, value in row.items()}
+        for row in queryset.values(*dimensions)
+        .annotate(**labels, opportunity_count=Sum('opportunity_count'), total_value=Sum('total_value'))
+        .order_by(*dimensions)
+    ]
+    totals = queryset.aggregate(opportunity_count=Sum('opportunity_count'), total_value=Sum('total_value'))
+
+    return {
+        'groups': groups,
+        'totals': {
+            'opportunity_count': totals['opportunity_count'] or 0,
+            'total_value': totals['total_value'] or 0,
+        },
+    }
+
+
+DASHBOARD_VERSION_KEY = "dashboard:version:{location_id}"
+DASHBOARD_RESPONSE_KEY = "dashboard:{kind}:{location_id}:v{version}:{digest}"
+# Version of responses that are not filtered by location (bumped with every location)
+ALL_LOCATIONS = "all"
+
+
+def get_dashboard_version(location_id):
+    key = DASHBOARD_VERSION_KEY.format(location_id=location_id or ALL_LOCATIONS)
+    cache.add(key, 1, None)
+    return cache.get(key, 1)
+
+
+def bump_dashboard_version(location_id):
+    """Invalidate every cached dashboard response of a location; call after committing writes"""
+    for scope in {location_id or ALL_LOCATIONS, ALL_LOCATIONS}:
+        key = DASHBOARD_VERSION_KEY.format(location_id=scope)
+        cache.add(key, 1, None)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Evicted between add and incr
+            cache.set(key, 1, None)
+
+
+def cached_query(kind, params, query):
+    """
+    Return ``query(params)`` from the cache, computing and storing it on a miss.
+
+    The key covers the endpoint ``kind``, the normalised query params and the
+    current version of the location the params filter on.
+    """
+    params = dict(params.items())
+    location_id = params.get('location_id')
+    digest = hashlib.sha1(json.dumps(sorted(params.items())).encode()).hexdigest()
+    key = DASHBOARD_RESPONSE_KEY.format(
+        kind=kind,
+        location_id=location_id or ALL_LOCATIONS,
+        version=get_dashboard_version(location_id),
+        digest=digest,
+    )
+
+    result = cache.get(key)
+    if result is None:
+        result = query(params)
+        cache.set(key, result, getattr(settings, 'DASHBOARD_CACHE_TTL', 60 * 60))
+    return result
+
+
+# Default views of the dashboard, precomputed right after a sync
+WARM_QUERIES = [
+    ('opportunities', list_opportunities, {}),
+    ('summary', pipeline_summary, {}),
+    ('summary', pipeline_summary, {'group_by': 'pipeline_id'}),
+    ('summary', pipeline_summary, {'group_by': 'pipeline_id,pipeline_stage_id'}),
+]
+
+
+def warm_dashboard_cache(location_id):
+    """Populate the cache for the location's default dashboard views at the current version"""
+    for kind, query, params in WARM_QUERIES:
+        try:
+            cached_query(kind, {'location_id': location_id, **params}, query)
+        except Exception as e:
+            logger.error(f"Failed to warm {kind} {params} for location {location_id}: {e}")
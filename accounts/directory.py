@@ -0,0 +1,253 @@
+# directory.py
+"""
+Lookup tables for GoHighLevel metadata that the syncs need for every row but
+that rarely changes upstream (users assigned to opportunities, pipelines and
+their stages).
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.utils import timezone
+
+from accounts import http_client
+from accounts.models import GHLUser
+
+logger = logging.getLogger(__name__)
+
+EMPTY_USER = {'name': '', 'email': '', 'firstName': '', 'lastName': ''}
+
+PIPELINE_CACHE_KEY = "ghl:pipelines:{location_id}"
+
+
+class UserDirectory:
+    """
+    GoHighLevel users of one location, backed by the GHLUser table.
+
+    Users are served from the table while they are younger than
+    ``GHL_USER_CACHE_TTL``. Missing or expired users are refreshed in one
+    ``/users/?locationId=`` request, and any IDs that call did not return are
+    fetched concurrently from ``/users/{id}``. A sync that finds every
+    assignee in the table makes no user requests at all.
+    """
+
+    def __init__(self, location_id, headers, ttl=None, max_workers=None):
+        self.location_id = location_id
+        self.headers = headers
+        self.ttl = ttl or getattr(settings, 'GHL_USER_CACHE_TTL', timedelta(hours=24))
+        self.max_workers = max_workers or getattr(settings, 'GHL_SYNC_MAX_WORKERS', 3)
+        self._users = {}
+        self._lock = threading.Lock()
+        self._location_listed = False
+        self._listing = None  # Event set when the /users/ request in flight ends
+
+    def get(self, user_id):
+        """Return name/email/firstName/lastName for a user, fetching it if needed"""
+        if not user_id:
+            return dict(EMPTY_USER)
+        with self._lock:
+            user = self._users.get(user_id)
+        if user is None:
+            self.prefetch([user_id])
+            with self._lock:
+                user = self._users.get(user_id)
+        return user or dict(EMPTY_USER)
+
+    def prefetch(self, user_ids):
+        """
+        Make sure all given users are loaded, using as few API requests as possible.
+
+        The lock only guards the in-memory map; the table and API are read
+        without it, so workers reading cached users never wait on another
+        worker's requests.
+        """
+        with self._lock:
+            wanted = {user_id for user_id in user_ids if user_id and user_id not in self._users}
+        if not wanted:
+            return
+
+        fresh_after = timezone.now() - self.ttl
+        stored = {user.id: user.as_dict() for user in GHLUser.objects.filter(id__in=wanted, fetched_at__gte=fresh_after)}
+        missing = wanted - stored.keys()
+
+        fetched = {}
+        if missing:
+            fetched.update(self._list_location())
+            with self._lock:
+                # Users listed by another worker are already in the map
+                leftover = {user_id for user_id in missing - fetched.keys() if user_id not in self._users}
+            if leftover:
+                fetched.update(self._fetch_users_by_id(leftover))
+
+            if fetched:
+                self._store(fetched)
+
+        with self._lock:
+            self._users.update(stored)
+            self._users.update(fetched)
+            for user_id in missing - fetched.keys():
+                # Remember failures for this run so they are not requested again per row
+                self._users.setdefault(user_id, dict(EMPTY_USER))
+
+    def _list_location(self):
+        """
+        Load every user of the location with one request, once per directory.
+
+        Returns the listed users to the worker that made the request (which
+        stores them) and ``{}`` to everyone else. Workers arriving while the
+        request runs wait for it rather than fetching users one by one. The
+        location only counts as listed once the request succeeds, so a failed
+        listing is retried by the next worker that misses a user.
+        """
+        with self._lock:
+            if self._location_listed:
+                return {}
+            listing = self._listing
+            if listing is None:
+                listing = self._listing = threading.Event()
+                owner = True
+            else:
+                owner = False
+        if not owner:
+            listing.wait()
+            return {}
+
+        users = None
+        try:
+            users = self._fetch_location_users()
+        finally:
+            with self._lock:
+                if users is not None:
+                    self._users.update(users)
+                    self._location_listed = True
+                self._listing = None
+            listing.set()
+        return users or {}
+
+    def _fetch_location_users(self):
+        """Every user of the location, or None if the request failed"""
+        try:
+            response = http_client.ghl_get(
+                f"{http_client.GHL_BASE_URL}/users/",
+                self.location_id,
+                headers=self.headers,
+                params={'locationId': self.location_id},
+            )
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Error fetching users for location {self.location_id}: {e}")
+            return None
+
+        users = {user['id']: _user_info(user) for user in response.json().get('users', []) if user.get('id')}
+        logger.info(f"Fetched {len(users)} users for location {self.location_id}")
+        return users
+
+    def _fetch_user(self, user_id):
+        try:
+            response = http_client.ghl_get(
+                f"{http_client.GHL_BASE_URL}/users/{user_id}",
+                self.location_id,
+                headers=self.headers,
+                endpoint="GET /users/{id}",
+            )
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Error fetching user data for {user_id}: {e}")
+            return user_id, None
+        return user_id, _user_info(response.json())
+
+    def _fetch_user_in_worker(self, user_id):
+        """Run _fetch_user in a pool thread and release its DB connection afterwards"""
+        try:
+            return self._fetch_user(user_id)
+        finally:
+            # ghl_get may read the token table, which opens a connection for
+            # this thread; the pool threads die with the executor, so close it.
+            connection.close()
+
+    def _fetch_users_by_id(self, user_ids):
+        workers = min(self.max_workers, len(user_ids))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ghl-user") as executor:
+            results = executor.map(self._fetch_user_in_worker, user_ids)
+            return {user_id: info for user_id, info in results if info is not None}
+
+    def _store(self, users):
+        now = timezone.now()
+        GHLUser.objects.bulk_create(
+            [
+                GHLUser(
+                    id=user_id,
+                    location_id=self.location_id,
+                    name=info['name'],
+                    email=info['email'],
+                    first_name=info['firstName'],
+                    last_name=info['lastName'],
+                    fetched_at=now,
+                )
+                for user_id, info in users.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['id'],
+            update_fields=['location_id', 'name', 'email', 'first_name', 'last_name', 'fetched_at'],
+        )
+
+
+def _user_info(user_data):
+    return {
+        'name': user_data.get('name') or '',
+        'email': user_data.get('email') or '',
+        'firstName': user_data.get('firstName') or '',
+        'lastName': user_data.get('lastName') or '',
+    }
+
+
+def get_pipelines(location_id, headers, refresh=False):
+    """
+    Pipeline and stage metadata of a location, shared by all processes.
+
+    The result is kept in the Django cache for ``GHL_PIPELINE_CACHE_TTL``
+    seconds and looks like ``{pipeline_id: {'name': ..., 'stages': {stage_id: name}}}``.
+
+    Args:
+        location_id (str): GoHighLevel location ID.
+        headers (dict): Authenticated GoHighLevel request headers.
+        refresh (bool): Skip the cache and refetch from the API.
+
+    Raises:
+        requests.exceptions.RequestException: if the API call fails.
+    """
+    key = PIPELINE_CACHE_KEY.format(location_id=location_id)
+    if not refresh:
+        pipelines = cache.get(key)
+        if pipelines is not None:
+            return pipelines
+
+    response = http_client.ghl_get(
+        f"{http_client.GHL_BASE_URL}/opportunities/pipelines",
+        location_id,
+        headers=headers,
+        params={'locationId': location_id},
+    )
+    response.raise_for_status()
+
+    pipelines = {
+        pipeline['id']: {
+            'name': pipeline['name'],
+            'stages': {stage['id']: stage['name'] for stage in pipeline.get('stages', [])},
+        }
+        for pipeline in response.json().get('pipelines', [])
+    }
+    cache.set(key, pipelines, getattr(settings, 'GHL_PIPELINE_CACHE_TTL', 6 * 60 * 60))
+    logger.info(f"Cached {len(pipelines)} pipelines for location {location_id}")
+    return pipelines
+
+
+def invalidate_pipelines(location_id):
+    """Drop the cached pipeline metadata of a location so the next reader refetches it"""
+    cache.delete(PIPELINE_CACHE_KEY.format(location_id=location_id))
+
@@ -0,0 +1,214 @@
+# ghl_tokens.py
+"""
+GoHighLevel OAuth tokens, one set per location (GHLAuthCredentials).
+
+Callers ask ``token_manager`` for a location's access token instead of reading
+GHLAuthCredentials. Tokens are kept in process memory for a short TTL and in
+the Django cache (Redis) until they expire, so the table is only read on a
+miss. A token is refreshed once it is within ``GHL_TOKEN_REFRESH_AHEAD`` of
+the expiry derived from ``updated_at + expires_in``, and again whenever
+GoHighLevel answers 401. Refreshes are single-flight per location under a
+Redis lock: GoHighLevel refresh tokens are single-use, so two workers
+refreshing at once would invalidate each other.
+"""
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from decouple import config
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from accounts import http_client
+from accounts.locks import RedisLock
+from accounts.models import GHLAuthCredentials
+
+logger = logging.getLogger(__name__)
+
+TOKEN_URL = f"{http_client.GHL_BASE_URL}/oauth/token"
+TOKEN_CACHE_KEY = "ghl:token:{location_id}"
+REFRESH_LOCK_KEY = "lock:ghl:token-refresh:{location_id}"
+# (connect, read) timeout of the refresh POST
+REFRESH_TIMEOUT = http_client.DEFAULT_TIMEOUT
+# The refresh lock outlives the slowest refresh (POST plus saving and
+# publishing the new tokens), so it never expires under a live holder
+REFRESH_LOCK_TTL = sum(REFRESH_TIMEOUT) + 30
+
+
+class GHLTokenError(Exception):
+    """No stored credentials for a location, or the token endpoint refused the refresh"""
+
+
+def _entry(credentials):
+    return {
+        'location_id': credentials.location_id,
+        'access_token': credentials.access_token,
+        'expires_at': credentials.updated_at + timedelta(seconds=credentials.expires_in or 0),
+    }
+
+
+class GHLTokenManager:
+    def __init__(self, ttl=None, refresh_ahead=None):
+        self.ttl = ttl or getattr(settings, 'GHL_TOKEN_CACHE_TTL', 60)
+        self.refresh_ahead = refresh_ahead or getattr(settings, 'GHL_TOKEN_REFRESH_AHEAD', timedelta(minutes=30))
+        self._lock = threading.Lock()
+        self._entries = {}  # location_id -> (entry, trusted until (monotonic))
+        self._default_location_id = None
+
+    def default_location_id(self):
+        """Location of the first stored credentials (single-location deployments)"""
+        if self._default_location_id is None:
+            location_id = GHLAuthCredentials.objects.values_list('location_id', flat=True).first()
+            if not location_id:
+                raise GHLTokenError("No GHL credentials found in database")
+            self._default_location_id = location_id
+        return self._default_location_id
+
+    def get_credentials(self, location_id=None):
+        """
+        ``{'location_id', 'access_token', 'expires_at'}`` for a location
+        (the default location when omitted), refreshed if it is due.
+
+        Raises:
+            GHLTokenError: if the location has no credentials or an expired
+                token cannot be refreshed.
+        """
+        location_id = location_id or self.default_location_id()
+        with self._lock:
+            cached = self._entries.get(location_id)
+            if cached and time.monotonic() < cached[1]:
+                return cached[0]
+
+        entry = cache.get(TOKEN_CACHE_KEY.format(location_id=location_id))
+        if entry is None:
+            entry = self._load(location_id)
+
+        remaining = entry['expires_at'] - timezone.now()
+        if remaining <= timedelta(seconds=60):
+            # Unusable: wait for whoever is refreshing (or refresh ourselves)
+            entry = self.refresh(location_id, stale_token=entry['access_token'])
+        elif remaining <= self.refresh_ahead:
+            # Still valid: refresh if nobody else is, otherwise keep using it
+            entry = self.refresh(location_id, stale_token=entry['access_token'], wait=0)
+
+        remaining = entry['expires_at'] - timezone.now()
+        with self._lock:
+            until_due = max((remaining - self.refresh_ahead).total_seconds(), 1)
+            self._entries[location_id] = (entry, time.monotonic() + min(self.ttl, until_due))
+        return entry
+
+    def get_access_token(self, location_id=None):
+        return self.get_credentials(location_id)['access_token']
+
+    def refresh(self, location_id, stale_token=None, wait=REFRESH_LOCK_TTL):
+        """
+        Refresh a location's token unless another worker already did.
+
+        Args:
+            stale_token (str, optional): The token the caller found unusable.
+                If the stored token differs, it was already rotated and is
+                returned as is. Without it the token is only refreshed when due.
+            wait (float): Seconds to wait for a refresh running elsewhere.
+                The default outlasts any refresh, so the caller gets the
+                token that refresh stored.
+
+        Returns:
+            dict: The current credentials entry.
+
+        Raises:
+            GHLTokenError: if ``stale_token`` is still the stored token after
+                waiting ``wait`` seconds for another worker's refresh.
+        """
+        lock = RedisLock(REFRESH_LOCK_KEY.format(location_id=location_id), ttl=REFRESH_LOCK_TTL)
+        if not lock.acquire(wait=wait):
+            # Someone else is refreshing. Read the table, not the cache, which
+            # holds the old token until the holder publishes; a caller that
+            # did not wait still has a valid token and keeps using it.
+            entry = self._load(location_id)
+            if wait and stale_token is not None and entry['access_token'] == stale_token:
+                raise GHLTokenError(f"Token refresh for location {location_id} is still running elsewhere")
+            return entry
+
+        try:
+            credentials = self._credentials(location_id)
+            entry = _entry(credentials)
+            if stale_token is not None and credentials.access_token != stale_token:
+                return self.publish(credentials)
+            if stale_token is None and entry['expires_at'] - timezone.now() > self.refresh_ahead:
+                return self.publish(credentials)
+
+            response = http_client.post(TOKEN_URL, data={
+                'grant_type': 'refresh_token',
+                'client_id': config("GHL_CLIENT_ID"),
+                'client_secret': config("GHL_CLIENT_SECRET"),
+                'refresh_token': credentials.refresh_token,
+            }, timeout=REFRESH_TIMEOUT)
+            data = response.json() if response.content else {}
+            if response.status_code != 200 or not data.get('access_token'):
+                raise GHLTokenError(f"Token refresh for location {location_id} failed ({response.status_code}): {response.text[:500]}")
+
+            data.setdefault('locationId', location_id)
+            credentials = self.save_tokens(data)
+            logger.info(f"Refreshed GHL token for location {location_id}, valid for {credentials.expires_in}s")
+            return _entry(credentials)
+        finally:
+            lock.release()
+
+    def refresh_due(self):
+        """Refresh every location whose token is within the refresh window (for the beat task)"""
+        refreshed = []
+        for credentials in GHLAuthCredentials.objects.exclude(location_id__isnull=True):
+            if _entry(credentials)['expires_at'] - timezone.now() > self.refresh_ahead:
+                continue
+            try:
+                self.refresh(credentials.location_id, wait=0)
+                refreshed.append(credentials.location_id)
+            except Exception as e:
+                logger.error(f"Could not refresh GHL token for location {credentials.location_id}: {e}")
+        return refreshed
+
+    def save_tokens(self, data):
+        """Store a token response from /oauth/token and publish it to every process"""
+        fields = {
+            "access_token": "access_token",
+            "refresh_token": "refresh_token",
+            "expires_in": "expires_in",
+            "scope": "scope",
+            "user_type": "userType",
+            "company_id": "companyId",
+            "user_id": "userId",
+        }
+        credentials, created = GHLAuthCredentials.objects.update_or_create(
+            location_id=data.get("locationId"),
+            # Keep stored values for fields a refresh response leaves out
+            defaults={field: data[key] for field, key in fields.items() if data.get(key) is not None},
+        )
+        self.publish(credentials)
+        return credentials
+
+    def publish(self, credentials):
+        entry = _entry(credentials)
+        timeout = max(int((entry['expires_at'] - timezone.now()).total_seconds()), 1)
+        cache.set(TOKEN_CACHE_KEY.format(location_id=credentials.location_id), entry, timeout)
+        with self._lock:
+            self._entries.pop(credentials.location_id, None)
+        return entry
+
+    def invalidate(self, location_id):
+        cache.delete(TOKEN_CACHE_KEY.format(location_id=location_id))
+        with self._lock:
+            self._entries.pop(location_id, None)
+
+    def _credentials(self, location_id):
+        credentials = GHLAuthCredentials.objects.filter(location_id=location_id).first()
+        if credentials is None:
+            raise GHLTokenError(f"No GHL credentials for location {location_id}")
+        return credentials
+
+    def _load(self, location_id):
+        return self.publish(self._credentials(location_id))
+
+
+token_manager = GHLTokenManager()
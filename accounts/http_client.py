@@ -0,0 +1,255 @@
+# http_client.py
+"""
+Shared HTTP client for the GoHighLevel and SmartVault APIs.
+
+Every outbound call goes through one pooled ``requests.Session`` per upstream
+host, so TCP/TLS connections are kept alive and reused across pages, tasks and
+worker threads. The module also applies default timeouts and keeps simple
+per-endpoint latency statistics.
+
+GoHighLevel calls made with ``ghl_get``/``ghl_post`` additionally go through
+the per-location token bucket, are retried with jittered exponential
+backoff on 429s, 5xx responses and connection errors, and carry the
+location's current OAuth token (refreshed and replayed once on a 401).
+"""
+import logging
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from accounts.ratelimit import get_ghl_limiter
+
+logger = logging.getLogger(__name__)
+
+GHL_BASE_URL = "https://services.leadconnectorhq.com"
+SMARTVAULT_BASE_URL = "https://rest.smartvault.com"
+
+# (connect, read) timeouts in seconds used when the caller does not pass one
+DEFAULT_TIMEOUT = getattr(settings, 'HTTP_CLIENT_TIMEOUT', (5, 30))
+POOL_MAXSIZE = getattr(settings, 'HTTP_CLIENT_POOL_MAXSIZE', 10)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_RETRIES = getattr(settings, 'HTTP_CLIENT_MAX_RETRIES', 5)
+BACKOFF_BASE = 0.5  # seconds
+BACKOFF_CAP = 30  # seconds
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def _build_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_MAXSIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({
+        "Accept-Encoding": "gzip, deflate",
+        "Connection": "keep-alive",
+    })
+    return session
+
+
+def get_session(url):
+    """Return the pooled session for the host of ``url`` (created on first use)"""
+    host = urlsplit(url).netloc
+    session = _sessions.get(host)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(host)
+            if session is None:
+                session = _sessions[host] = _build_session()
+    return session
+
+
+def _record(endpoint, elapsed_ms, failed):
+    with _stats_lock:
+        entry = _stats.setdefault(endpoint, {'count': 0, 'errors': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+        entry['count'] += 1
+        entry['total_ms'] += elapsed_ms
+        entry['max_ms'] = max(entry['max_ms'], elapsed_ms)
+        if failed:
+            entry['errors'] += 1
+
+
+def request(method, url, endpoint=None, timeout=None, **kwargs):
+    """
+    Send a request through the pooled session for the target host.
+
+    Args:
+        method (str): HTTP method.
+        url (str): Absolute URL.
+        endpoint (str, optional): Label used for the latency stats. Pass a
+            template such as ``"GET /users/{id}"`` for URLs that embed IDs,
+            otherwise the method and path are used.
+        timeout: Requests timeout, defaults to ``DEFAULT_TIMEOUT``.
+        **kwargs: Passed through to ``requests.Session.request``.
+
+    Returns:
+        requests.Response
+    """
+    if endpoint is None:
+        parts = urlsplit(url)
+        endpoint = f"{method.upper()} {parts.netloc}{parts.path}"
+
+    start = time.monotonic()
+    failed = True
+    try:
+        response = get_session(url).request(method, url, timeout=timeout or DEFAULT_TIMEOUT, **kwargs)
+        failed = response.status_code >= 400
+        return response
+    finally:
+        elapsed_ms = (time.monotonic() - start) * 1000
+        _record(endpoint, elapsed_ms, failed)
+        logger.debug(f"{endpoint} took {elapsed_ms:.0f}ms")
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+
+def put(url, **kwargs):
+    return request("PUT", url, **kwargs)
+
+
+def backoff_delay(attempt):
+    """Full-jitter exponential backoff: a random delay up to base * 2**attempt (capped)"""
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+
+def _retry_after(response):
+    value = response.headers.get('Retry-After')
+    try:
+        return min(BACKOFF_CAP, float(value)) if value else None
+    except ValueError:
+        return None
+
+
+def request_with_retry(method, url, limiter=None, max_retries=None, **kwargs):
+    """
+    Like ``request`` but rate limited and retried.
+
+    Each attempt first takes a token from ``limiter`` (if given) and feeds the
+    response headers back to it. Responses in ``RETRY_STATUSES`` and
+    connection errors/timeouts are retried up to ``max_retries`` times,
+    waiting ``Retry-After`` when the server sends it and a jittered
+    exponential backoff otherwise. The last response is returned (or the
+    last exception raised) when retries run out.
+    """
+    max_retries = MAX_RETRIES if max_retries is None else max_retries
+    attempt = 0
+    while True:
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            response = request(method, url, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            if attempt >= max_retries:
+                raise
+            delay = backoff_delay(attempt)
+            logger.warning(f"{method} {url} failed ({e}), retrying in {delay:.1f}s")
+        else:
+            if limiter is not None:
+                limiter.observe(response)
+            if response.status_code not in RETRY_STATUSES or attempt >= max_retries:
+                return response
+            delay = _retry_after(response) or backoff_delay(attempt)
+            logger.warning(f"{method} {url} returned {response.status_code}, retrying in {delay:.1f}s")
+        time.sleep(delay)
+        attempt += 1
+
+
+def ghl_request(method, url, location_id, **kwargs):
+    """
+    Call GoHighLevel for a location: rate limited, retried, and authenticated.
+
+    The bearer token comes from the location's token manager entry (the
+    caller's Authorization header is only used for locations without stored
+    credentials). On a 401 the token is refreshed once, single-flight across
+    workers, and the request is replayed with the new token.
+    """
+    from accounts.ghl_tokens import GHLTokenError, token_manager
+
+    headers = dict(kwargs.pop('headers', None) or {})
+    try:
+        token = token_manager.get_access_token(location_id)
+    except GHLTokenError:
+        token = None
+    if token:
+        headers['Authorization'] = f"Bearer {token}"
+
+    limiter = get_ghl_limiter(location_id)
+    response = request_with_retry(method, url, limiter=limiter, headers=headers, **kwargs)
+    if response.status_code == 401 and token:
+        logger.warning(f"{method} {url} returned 401 for location {location_id}, refreshing the token")
+        headers['Authorization'] = f"Bearer {token_manager.refresh(location_id, stale_token=token)['access_token']}"
+        response = request_with_retry(method, url, limiter=limiter, headers=headers, **kwargs)
+    return response
+
+
+def ghl_get(url, location_id, **kwargs):
+    """GET a GoHighLevel URL under the location's shared rate limit, with retries"""
+    return ghl_request("GET", url, location_id, **kwargs)
+
+
+def ghl_post(url, location_id, **kwargs):
+    """POST to a GoHighLevel URL under the location's shared rate limit, with retries"""
+    return ghl_request("POST", url, location_id, **kwargs)
+
+
+def get_latency_stats():
+    """Snapshot of per-endpoint latency stats (count, errors, avg_ms, max_ms)"""
+    with _stats_lock:
+        return {
+            endpoint: {
+                'count': entry['count'],
+                'errors': entry['errors'],
+                'avg_ms': round(entry['total_ms'] / entry['count'], 1) if entry['count'] else 0.0,
+                'max_ms': round(entry['max_ms'], 1),
+            }
+            for endpoint, entry in _stats.items()
+        }
+
+
+def merge_latency_stats(snapshots):
+    """Combine ``get_latency_stats`` snapshots (e.g. from several workers) into one"""
+    merged = {}
+    for snapshot in snapshots:
+        for endpoint, entry in snapshot.items():
+            total = merged.setdefault(endpoint, {'count': 0, 'errors': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+            total['count'] += entry['count']
+            total['errors'] += entry['errors']
+            total['total_ms'] += entry['avg_ms'] * entry['count']
+            total['max_ms'] = max(total['max_ms'], entry['max_ms'])
+    return {
+        endpoint: {
+            'count': entry['count'],
+            'errors': entry['errors'],
+            'avg_ms': round(entry['total_ms'] / entry['count'], 1) if entry['count'] else 0.0,
+            'max_ms': entry['max_ms'],
+        }
+        for endpoint, entry in merged.items()
+    }
+
+
+def format_latency_stats(stats):
+    return ", ".join(
+        f"{endpoint}: {entry['count']} calls, {entry['errors']} errors, avg {entry['avg_ms']}ms, max {entry['max_ms']}ms"
+        for endpoint, entry in sorted(stats.items())
+    ) or "no calls"
+
+
+def reset_latency_stats():
+    with _stats_lock:
+        _stats.clear()
@@ -0,0 +1,154 @@
+# locks.py
+"""
+Distributed locks on the shared Redis (``REDIS_URL``).
+
+A lock is a key holding a random owner token with an expiry, taken with
+``SET NX PX``; only the owner can extend or release it (compare-and-delete in
+Lua), so a holder that outlived its expiry never frees someone else's lock.
+
+``Lease`` is a lock with a short expiry that a heartbeat thread keeps
+renewing while the holder works. A holder that dies stops renewing, and the
+lease expires within ``ttl`` seconds so the next worker can take it over.
+"""
+import logging
+import threading
+import time
+import uuid
+
+import redis
+
+from accounts.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+_EXTEND_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+class LockNotAcquired(Exception):
+    """Raised by ``RedisLock`` used as a context manager when the wait times out"""
+
+
+class RedisLock:
+    """
+    Mutual exclusion across processes for up to ``ttl`` seconds.
+
+    Usage::
+
+        with RedisLock("lock:ghl:token:LOC", ttl=30, wait=10):
+            ...
+    """
+
+    def __init__(self, key, ttl=30, wait=0, poll_interval=0.1, token=None):
+        self.key = key
+        self.ttl = ttl
+        self.wait = wait
+        self.poll_interval = poll_interval
+        # Pass the token of an acquired lock to release it from another task
+        self.token = token or uuid.uuid4().hex
+
+    def acquire(self, wait=None):
+        """Try to take the lock, polling for up to ``wait`` seconds. Returns True on success."""
+        wait = self.wait if wait is None else wait
+        deadline = time.monotonic() + wait
+        while True:
+            if get_redis().set(self.key, self.token, nx=True, px=int(self.ttl * 1000)):
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(self.poll_interval)
+
+    def extend(self, ttl=None):
+        """Push the expiry back to ``ttl`` seconds from now; False if the lock was lost"""
+        ttl = self.ttl if ttl is None else ttl
+        return bool(get_redis().eval(_EXTEND_SCRIPT, 1, self.key, self.token, int(ttl * 1000)))
+
+    def holder(self):
+        """Token of whoever holds the lock now, or None"""
+        value = get_redis().get(self.key)
+        return value.decode() if value is not None else None
+
+    def release(self):
+        try:
+            get_redis().eval(_RELEASE_SCRIPT, 1, self.key, self.token)
+        except redis.RedisError as e:
+            # The key expires on its own
+            logger.warning(f"Could not release lock {self.key}: {e}")
+
+    def __enter__(self):
+        if not self.acquire():
+            raise LockNotAcquired(self.key)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+
+class Lease(RedisLock):
+    """
+    A ``RedisLock`` renewed every ``heartbeat`` seconds (``ttl / 3`` by default)
+    between ``start_heartbeat()`` and ``release()``/``stop_heartbeat()``.
+
+    ``lost`` is set if a renewal finds the lease gone (expired and taken over);
+    holders check it between units of work and stop writing once it is set.
+    A heartbeat can also be started for a lease acquired by another process by
+    passing its token.
+    """
+
+    def __init__(self, key, ttl=60, heartbeat=None, **kwargs):
+        super().__init__(key, ttl=ttl, **kwargs)
+        self.heartbeat = heartbeat or ttl / 3
+        self.lost = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start_heartbeat(self):
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._renew, name=f"lease:{self.key}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop_heartbeat(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def renew(self):
+        """
+        Extend the lease once. Returns False and sets ``lost`` if it is gone;
+        a Redis error is only logged, the lease survives until ``ttl``.
+        """
+        try:
+            renewed = self.extend()
+        except redis.RedisError as e:
+            logger.warning(f"Could not renew lease {self.key}: {e}")
+            return True
+        if not renewed:
+            logger.error(f"Lease {self.key} was lost")
+            self.lost.set()
+        return renewed
+
+    def _renew(self):
+        while not self._stopped.wait(self.heartbeat):
+            if not self.renew():
+                return
+
+    def release(self):
+        self.stop_heartbeat()
+        super().release()
+
+    def __enter__(self):
+        super().__enter__()
+        return self.start_heartbeat()
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.23 on 2026-10-18 08:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_opportunity_sync_generation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contact',
+            name='sync_generation',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.23 on 2026-10-18 08:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0008_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GHLUser',
+            fields=[
+                ('id', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('location_id', models.CharField(blank=True, max_length=50, null=True)),
+                ('name', models.CharField(blank=True, default='', max_length=255)),
+                ('email', models.CharField(blank=True, default='', max_length=255)),
+                ('first_name', models.CharField(blank=True, default='', max_length=100)),
+                ('last_name', models.CharField(blank=True, default='', max_length=100)),
+                ('fetched_at', models.DateTimeField()),
+            ],
+        ),
+    ]
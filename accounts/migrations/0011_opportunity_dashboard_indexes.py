@@ -0,0 +1,33 @@
+# Generated by Django 4.2.23 on 2026-10-18 08:17
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run in a transaction; it does not block
+    # writes to the opportunity table while the indexes build
+    atomic = False
+
+    dependencies = [
+        ('accounts', '0010_sync_generations'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='opportunity',
+            index=models.Index(fields=['location_id', '-updated_at', '-id'], name='opp_location_updated_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='opportunity',
+            index=models.Index(fields=['location_id', 'pipeline_id', 'pipeline_stage_id', '-updated_at', '-id'], name='opp_pipeline_stage_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='opportunity',
+            index=models.Index(fields=['location_id', 'status', '-updated_at', '-id'], name='opp_status_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='opportunity',
+            index=models.Index(fields=['location_id', 'assigned_to', '-updated_at', '-id'], name='opp_assignee_idx'),
+        ),
+    ]
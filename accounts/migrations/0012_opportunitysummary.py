@@ -0,0 +1,33 @@
+# Generated by Django 4.2.23 on 2026-10-18 08:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0011_opportunity_dashboard_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OpportunitySummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('location_id', models.CharField(max_length=50)),
+                ('pipeline_id', models.CharField(max_length=50)),
+                ('pipeline_stage_id', models.CharField(max_length=50)),
+                ('status', models.CharField(max_length=50)),
+                ('assigned_to', models.CharField(blank=True, default='', max_length=50)),
+                ('pipeline_name', models.CharField(blank=True, max_length=255, null=True)),
+                ('pipeline_stage_name', models.CharField(blank=True, max_length=255, null=True)),
+                ('assigned_user_name', models.CharField(blank=True, max_length=50, null=True)),
+                ('opportunity_count', models.IntegerField(default=0)),
+                ('total_value', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('refreshed_at', models.DateTimeField()),
+            ],
+            options={
+                'unique_together': {('location_id', 'pipeline_id', 'pipeline_stage_id', 'status', 'assigned_to')},
+            },
+        ),
+    ]
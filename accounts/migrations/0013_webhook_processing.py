@@ -0,0 +1,28 @@
+# Generated by Django 4.2.23 on 2026-10-18 08:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0012_opportunitysummary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='webhook',
+            name='error',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='webhook',
+            name='location_id',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='webhook',
+            name='processed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
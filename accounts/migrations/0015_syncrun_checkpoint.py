@@ -0,0 +1,22 @@
+# Generated by Django 4.2.23 on 2026-10-18 08:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0014_smartvaultclientjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='syncrun',
+            name='checkpoint',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='syncrun',
+            index=models.Index(fields=['location_id', 'scope', '-id'], name='syncrun_scope_latest_idx'),
+        ),
+    ]
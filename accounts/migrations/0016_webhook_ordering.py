@@ -0,0 +1,32 @@
+# Generated by Django 4.2.23 on 2026-10-18 08:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0015_syncrun_checkpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contact',
+            name='date_updated',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('contact', 'Contact'), ('opportunity', 'Opportunity')], max_length=20)),
+                ('record_id', models.CharField(max_length=100)),
+                ('location_id', models.CharField(max_length=100)),
+                ('deleted_at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['deleted_at'], name='tombstone_deleted_idx')],
+                'unique_together': {('kind', 'record_id')},
+            },
+        ),
+    ]
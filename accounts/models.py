@@ -32,11 +32,18 @@ class Contact(models.Model):
     dnd = models.BooleanField(default=False)
     country = models.CharField(max_length=50, blank=True, null=True)
     date_added = models.DateTimeField(blank=True, null=True)
+    # GoHighLevel's dateUpdated; an older record never overwrites a newer one
+    date_updated = models.DateTimeField(blank=True, null=True)
     tags = models.JSONField(default=list, blank=True)
     custom_fields = models.JSONField(default=list, blank=True)
     location_id = models.CharField(max_length=100)
     timestamp = models.DateTimeField(blank=True, null=True)
 
+    # SyncRun that last saw this contact (see Opportunity.sync_generation)
+    sync_generation = models.BigIntegerField(blank=True, null=True)
+    # SHA-1 of the synced fields; rows whose fingerprint is unchanged are not rewritten
+    content_hash = models.CharField(max_length=40, blank=True, null=True)
+
     def __str__(self):
         return f"{self.first_name} {self.last_name} ({self.email})"
     
@@ -44,12 +51,40 @@ class Contact(models.Model):
 class Webhook(models.Model):
     event = models.CharField(max_length=100)
     company_id = models.CharField(max_length=100)
+    location_id = models.CharField(max_length=100, blank=True, null=True)
     payload = models.JSONField()  # Store the entire raw payload
     received_at = models.DateTimeField(auto_now_add=True)
+    # Set once the event has been applied to Contact/Opportunity (or failed to)
+    processed_at = models.DateTimeField(blank=True, null=True)
+    error = models.TextField(blank=True, default='')
 
     def __str__(self):
         return f"{self.event} - {self.company_id}"
-    
+
+
+class Tombstone(models.Model):
+    """
+    A contact or opportunity deleted by a webhook event.
+
+    Kept for ``GHL_WEBHOOK_TOMBSTONE_TTL`` so a create/update event that
+    arrives after the delete does not bring the row back.
+    """
+    CONTACT = 'contact'
+    OPPORTUNITY = 'opportunity'
+    KIND_CHOICES = [(CONTACT, 'Contact'), (OPPORTUNITY, 'Opportunity')]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    record_id = models.CharField(max_length=100)
+    location_id = models.CharField(max_length=100)
+    deleted_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('kind', 'record_id')
+        indexes = [models.Index(fields=['deleted_at'], name='tombstone_deleted_idx')]
+
+    def __str__(self):
+        return f"{self.kind} {self.record_id} deleted at {self.deleted_at}"
+
 
 
 
@@ -79,6 +114,21 @@ class Opportunity(models.Model):
 
     location_id = models.CharField(max_length=50, blank=True, null=True)
 
+    # ID of the SyncRun that last saw this row. A completed full run deletes
+    # the rows in its scope that still carry an older generation.
+    sync_generation = models.BigIntegerField(blank=True, null=True)
+    # SHA-1 of the synced fields; rows whose fingerprint is unchanged are not rewritten
+    content_hash = models.CharField(max_length=40, blank=True, null=True)
+
+    class Meta:
+        # Each index matches a dashboard filter and ends in the list ordering
+        # (-updated_at, -id), so filtered keyset pages are index range scans.
+        indexes = [
+            models.Index(fields=['location_id', '-updated_at', '-id'], name='opp_location_updated_idx'),
+            models.Index(fields=['location_id', 'pipeline_id', 'pipeline_stage_id', '-updated_at', '-id'], name='opp_pipeline_stage_idx'),
+            models.Index(fields=['location_id', 'status', '-updated_at', '-id'], name='opp_status_idx'),
+            models.Index(fields=['location_id', 'assigned_to', '-updated_at', '-id'], name='opp_assignee_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -87,6 +137,110 @@ class Opportunity(models.Model):
 
 
 
+class OpportunitySummary(models.Model):
+    """
+    Opportunity count and value per location/pipeline/stage/status/assignee.
+
+    Rebuilt one pipeline at a time from the Opportunity table after each sync
+    (see ``dashboard.refresh_pipeline_summary``) and adjusted per row by
+    webhook events (``dashboard.apply_summary_delta``), so dashboard tiles
+    read a handful of group rows. Unassigned opportunities are grouped under ''.
+    """
+    location_id = models.CharField(max_length=50)
+    pipeline_id = models.CharField(max_length=50)
+    pipeline_stage_id = models.CharField(max_length=50)
+    status = models.CharField(max_length=50)
+    assigned_to = models.CharField(max_length=50, blank=True, default='')
+
+    pipeline_name = models.CharField(max_length=255, blank=True, null=True)
+    pipeline_stage_name = models.CharField(max_length=255, blank=True, null=True)
+    assigned_user_name = models.CharField(max_length=50, blank=True, null=True)
+
+    opportunity_count = models.IntegerField(default=0)
+    total_value = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    refreshed_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('location_id', 'pipeline_id', 'pipeline_stage_id', 'status', 'assigned_to')
+
+    def __str__(self):
+        return f"{self.pipeline_name} / {self.pipeline_stage_name} / {self.status}: {self.opportunity_count}"
+
+
+class GHLUser(models.Model):
+    """GoHighLevel user, kept locally so opportunity syncs do not refetch assignees every run"""
+    id = models.CharField(primary_key=True, max_length=50)
+    location_id = models.CharField(max_length=50, blank=True, null=True)
+    name = models.CharField(max_length=255, blank=True, default='')
+    email = models.CharField(max_length=255, blank=True, default='')
+    first_name = models.CharField(max_length=100, blank=True, default='')
+    last_name = models.CharField(max_length=100, blank=True, default='')
+    fetched_at = models.DateTimeField()
+
+    def as_dict(self):
+        return {
+            'name': self.name,
+            'email': self.email,
+            'firstName': self.first_name,
+            'lastName': self.last_name,
+        }
+
+    def __str__(self):
+        return f"{self.name} ({self.id})"
+
+
+class SyncState(models.Model):
+    """Incremental sync progress for one location and sync scope (e.g. "contacts")"""
+    location_id = models.CharField(max_length=100)
+    scope = models.CharField(max_length=100)
+    # Latest upstream update time already applied to the local table
+    high_water_mark = models.DateTimeField(blank=True, null=True)
+    last_full_sync_at = models.DateTimeField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('location_id', 'scope')
+
+    def __str__(self):
+        return f"{self.location_id} - {self.scope}"
+
+
+class SyncRun(models.Model):
+    """
+    One execution of a contact or pipeline sync. Its ID is the generation
+    stamped on every row the run touches.
+    """
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    INCOMPLETE = 'incomplete'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (INCOMPLETE, 'Incomplete'),
+        (FAILED, 'Failed'),
+    ]
+
+    location_id = models.CharField(max_length=100)
+    scope = models.CharField(max_length=100)
+    full = models.BooleanField(default=False)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=RUNNING)
+    report = models.JSONField(default=dict, blank=True)
+    # Where to resume after the last committed chunk: {"cursor", "high_water_mark"}
+    checkpoint = models.JSONField(blank=True, null=True)
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            # Latest run of a scope, looked up when a sync starts
+            models.Index(fields=['location_id', 'scope', '-id'], name='syncrun_scope_latest_idx'),
+        ]
+
+    def __str__(self):
+        return f"SyncRun({self.id}, {self.location_id} - {self.scope}, {self.status})"
+
+
 class SmartVaultToken(models.Model):
     user_id = models.CharField(max_length=255, unique=True)
     access_token = models.TextField()
@@ -106,3 +260,45 @@ class SmartVaultToken(models.Model):
 
     def __str__(self):
         return f"SmartVaultToken({self.user_id})"
+
+
+class SmartVaultClientJob(models.Model):
+    """A queued SmartVault client creation and its outcome"""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    client_id = models.CharField(max_length=255)
+    account_id = models.CharField(max_length=100)
+    client_data = models.JSONField()  # Validated SmartVault client body
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    response = models.JSONField(blank=True, null=True)  # SmartVault response on success
+    error = models.TextField(blank=True, default='')
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    def as_dict(self):
+        return {
+            'job_id': str(self.id),
+            'client_id': self.client_id,
+            'status': self.status,
+            'attempts': self.attempts,
+            'response': self.response,
+            'error': self.error or None,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at,
+        }
+
+    def __str__(self):
+        return f"SmartVaultClientJob({self.client_id}, {self.status})"
@@ -0,0 +1,132 @@
+# ratelimit.py
+"""
+Token-bucket rate limiting shared by every worker through Redis.
+
+GoHighLevel enforces a burst limit per location (``X-RateLimit-Max`` requests
+per ``X-RateLimit-Interval-Milliseconds``) and reports what is left in
+``X-RateLimit-Remaining``. The bucket starts from the configured defaults and
+adapts to those headers, so all workers together use the allowed budget
+without running into 429s.
+"""
+import logging
+import time
+
+import redis
+from django.conf import settings
+
+from accounts.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Refill the bucket from the time elapsed since the last call (Redis server
+# time, so worker clocks do not matter), then take one token or return the
+# number of milliseconds to wait for the next one.
+_TAKE_SCRIPT = """
+local rate = tonumber(redis.call('HGET', KEYS[1], 'rate') or ARGV[1])
+local capacity = tonumber(redis.call('HGET', KEYS[1], 'capacity') or ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local tokens = tonumber(redis.call('HGET', KEYS[1], 'tokens') or capacity)
+local ts = tonumber(redis.call('HGET', KEYS[1], 'ts') or now)
+tokens = math.min(capacity, tokens + (now - ts) * rate / 1000)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = math.ceil((1 - tokens) * 1000 / rate)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', now)
+redis.call('PEXPIRE', KEYS[1], 3600000)
+return wait
+"""
+
+# Apply the limits reported by the API: adopt its rate/capacity and never
+# hold more tokens than the server says are left.
+_OBSERVE_SCRIPT = """
+if ARGV[1] ~= '' then
+    redis.call('HSET', KEYS[1], 'rate', ARGV[1], 'capacity', ARGV[2])
+end
+if ARGV[3] ~= '' then
+    local tokens = tonumber(redis.call('HGET', KEYS[1], 'tokens') or ARGV[3])
+    if tonumber(ARGV[3]) < tokens then
+        redis.call('HSET', KEYS[1], 'tokens', ARGV[3])
+    end
+end
+redis.call('PEXPIRE', KEYS[1], 3600000)
+return 0
+"""
+
+
+class TokenBucket:
+    """
+    Distributed token bucket stored in one Redis hash.
+
+    Args:
+        key (str): Redis key of the bucket.
+        rate (float): Default refill rate in requests per second.
+        capacity (int): Default burst size.
+    """
+
+    def __init__(self, key, rate, capacity):
+        self.key = key
+        self.rate = rate
+        self.capacity = capacity
+
+    def acquire(self):
+        """Block until a request may be sent"""
+        while True:
+            try:
+                wait_ms = get_redis().eval(_TAKE_SCRIPT, 1, self.key, self.rate, self.capacity)
+            except redis.RedisError as e:
+                # Fail open: a Redis outage should slow nothing down, the
+                # retry/backoff in http_client still handles 429s.
+                logger.warning(f"Rate limiter unavailable for {self.key}: {e}")
+                return
+            if not wait_ms:
+                return
+            time.sleep(wait_ms / 1000)
+
+    def observe(self, response):
+        """Adapt the bucket to the rate-limit headers of a GoHighLevel response"""
+        headers = response.headers
+        limit = headers.get('X-RateLimit-Max')
+        interval_ms = headers.get('X-RateLimit-Interval-Milliseconds')
+        remaining = headers.get('X-RateLimit-Remaining')
+
+        rate = capacity = ''
+        try:
+            if limit and interval_ms and int(interval_ms) > 0:
+                capacity = int(limit)
+                rate = capacity * 1000 / int(interval_ms)
+            remaining = str(int(remaining)) if remaining is not None else ''
+        except ValueError:
+            return
+
+        daily_remaining = headers.get('X-RateLimit-Daily-Remaining')
+        if daily_remaining is not None and daily_remaining.isdigit() and int(daily_remaining) < 100:
+            logger.warning(f"GoHighLevel daily request budget almost used up for {self.key}: {daily_remaining} left")
+
+        if not rate and not remaining:
+            return
+        try:
+            get_redis().eval(_OBSERVE_SCRIPT, 1, self.key, rate, capacity, remaining)
+        except redis.RedisError as e:
+            logger.warning(f"Rate limiter unavailable for {self.key}: {e}")
+
+
+def get_ghl_limiter(location_id):
+    """Bucket shared by every request made for one GoHighLevel location"""
+    return TokenBucket(
+        f"ratelimit:ghl:{location_id}",
+        rate=getattr(settings, 'GHL_RATE_LIMIT_PER_SECOND', 10),
+        capacity=getattr(settings, 'GHL_RATE_LIMIT_BURST', 100),
+    )
+
+
+def get_smartvault_limiter():
+    """Bucket shared by every SmartVault client creation request"""
+    return TokenBucket(
+        "ratelimit:smartvault",
+        rate=getattr(settings, 'SMARTVAULT_RATE_LIMIT_PER_SECOND', 5),
+        capacity=getattr(settings, 'SMARTVAULT_RATE_LIMIT_BURST', 10),
+    )
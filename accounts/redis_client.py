@@ -0,0 +1,19 @@
+# redis_client.py
+"""Shared Redis connection for cross-worker coordination state (rate limits, locks)."""
+import threading
+
+import redis
+from django.conf import settings
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_redis():
+    """Return the process-wide Redis client (connections are pooled by redis-py)"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = redis.Redis.from_url(settings.REDIS_URL, socket_timeout=5)
+    return _client
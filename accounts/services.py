@@ -1,107 +1,250 @@
 import requests
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
 import pytz
 from django.core.management.base import BaseCommand
 from django.utils import timezone
-from accounts.models import Opportunity, GHLAuthCredentials,Contact  # Replace 'myapp' with your actual app name
+from accounts.models import Opportunity, GHLAuthCredentials, Contact, SyncState, SyncRun  # Replace 'myapp' with your actual app name
+from accounts import bulk, http_client
+from accounts.dashboard import refresh_pipeline_summary
+from accounts.directory import UserDirectory, get_pipelines
+from accounts.ghl_tokens import token_manager
+from accounts.locks import Lease
 import logging
 
-import time
+import hashlib
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import List, Dict, Any, Optional
+from django.conf import settings
 from django.utils.dateparse import parse_datetime
-from django.db import transaction
+from django.db import connection
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+
+# Opportunity fields that make up the row fingerprint
+OPPORTUNITY_CONTENT_FIELDS = [
+    'name', 'monetary_value', 'pipeline_id', 'pipeline_name',
+    'pipeline_stage_id', 'pipeline_stage_name',
+    'assigned_to', 'assigned_user_name', 'assigned_user_email',
+    'status', 'created_at', 'updated_at', 'contact_id',
+    'contact_name', 'contact_company_name', 'contact_email',
+    'contact_phone', 'contact_tags', 'location_id'
+]
+# Opportunity fields rewritten when an existing row has changed
+OPPORTUNITY_UPDATE_FIELDS = OPPORTUNITY_CONTENT_FIELDS + ['content_hash', 'sync_generation']
+
+
+def content_fingerprint(instance, fields):
+    """SHA-1 of the given field values, used to detect rows whose content did not change"""
+    values = [getattr(instance, field) for field in fields]
+    return hashlib.sha1(json.dumps(values, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def format_sync_report(report):
+    return ", ".join(f"{key}={report[key]}" for key in ('fetched', 'created', 'updated', 'skipped', 'deleted'))
+
+
+# SyncState scopes used for the contact and opportunity high-water marks
+CONTACT_SYNC_SCOPE = "contacts"
+
+
+def opportunity_sync_scope(pipeline_id):
+    """SyncState scope used for the updatedAt watermark of one pipeline"""
+    return f"opportunities:{pipeline_id}"
+
+
+# Redis key of the lease held while a scope (or a whole location sync, "workflow") is synced
+SYNC_LEASE_KEY = "lease:ghl:sync:{location_id}:{sync_type}"
+
+
+class SyncInProgress(Exception):
+    """Raised when another worker holds the sync lease of the scope"""
+
+
+class PaginationAborted(Exception):
+    """Raised when a paginated fetch stops before the last page"""
+
+
+class SyncLeaseLost(Exception):
+    """Raised between chunks when the scope's sync lease was lost; the run now belongs to its new holder"""
+
+
+@contextmanager
+def hold_sync_lease(location_id, scope):
+    """
+    Hold the scope's sync lease, with its heartbeat, for the duration of a sync.
+
+    Every sync of a scope runs under it, whoever starts it (workflow pieces,
+    management command, standalone calls, ``bulk_save_opportunities`` and
+    ``sync_contacts_to_db``), so ``open_sync_run`` never resumes a run that is
+    still being written and no sweep removes rows another sync just stamped.
+
+    Raises:
+        SyncInProgress: if another worker holds the lease.
+    """
+    lease = Lease(
+        SYNC_LEASE_KEY.format(location_id=location_id, sync_type=scope),
+        ttl=getattr(settings, 'GHL_SYNC_LEASE_TTL', 5 * 60),
+    )
+    if not lease.acquire():
+        raise SyncInProgress(f"A sync of {scope} for location {location_id} is already running")
+    lease.start_heartbeat()
+    try:
+        yield lease
+    finally:
+        lease.release()
+
+
+def check_sync_lease(lease):
+    """Stop a sync whose lease (``locks.Lease``) expired and may have been taken over"""
+    if lease.lost.is_set():
+        raise SyncLeaseLost(f"Sync lease {lease.key} was lost")
+
+
+def iter_chunks(pages, chunk_size):
+    """
+    Regroup an iterable of API pages into lists of at most ``chunk_size`` items.
+
+    Only one chunk is held in memory at a time. If reading the pages fails,
+    the items gathered so far are still yielded before the error is re-raised.
+    """
+    chunk = []
+    try:
+        for page in pages:
+            for item in page:
+                chunk.append(item)
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+    except Exception:
+        if chunk:
+            yield chunk
+        raise
+    if chunk:
+        yield chunk
+
+
+def iter_resumable_chunks(pages, chunk_size, cursor=None):
+    """
+    ``iter_chunks`` for pages yielded as ``(items, cursor)`` pairs, where the
+    cursor resumes pagination right after the page.
+
+    Yields ``(chunk, resume_cursor)``: where a later run has to restart to get
+    everything after the chunk. That is the cursor after the last page when
+    the chunk ends on a page boundary, and otherwise the cursor of the page it
+    stops in the middle of, which a resumed run reads again.
+    """
+    chunk = []
+    page_cursor = cursor  # cursor the current page was requested with
+    try:
+        for items, next_cursor in pages:
+            for position, item in enumerate(items, 1):
+                chunk.append(item)
+                if len(chunk) >= chunk_size:
+                    yield chunk, next_cursor if position == len(items) else page_cursor
+                    chunk = []
+            page_cursor = next_cursor
+    except Exception:
+        if chunk:
+            yield chunk, page_cursor
+        raise
+    if chunk:
+        yield chunk, page_cursor
+
+
 class GHLOpportunityFetcher:
-    def __init__(self, access_token, location_id):
+    def __init__(self, access_token, location_id, max_workers=None):
         self.access_token = access_token
         self.location_id = location_id
-        self.base_url = "https://services.leadconnectorhq.com"
+        # Number of pipelines fetched in parallel by fetch_all_opportunities
+        self.max_workers = max_workers or getattr(settings, 'GHL_SYNC_MAX_WORKERS', 3)
+        # Number of opportunities written to the database per transaction
+        self.chunk_size = getattr(settings, 'GHL_SYNC_CHUNK_SIZE', 500)
+        self.bulk_load_chunk_size = getattr(settings, 'GHL_BULK_LOAD_CHUNK_SIZE', 5000)
+        self.base_url = http_client.GHL_BASE_URL
         self.headers = {
             'Accept': 'application/json',
             'Authorization': f'Bearer {self.access_token}',
             'Version': '2021-07-28'
         }
         
-        # Pipeline mappings
-        self.pipelines = {
-            "General Entity Pipeline": "XuGY5OWwnnVApR7udk2m",
-            "Tax Onboarding Pipeline": "femeFj3B35BZTsOb04CZ", 
-            "Refund Pipeline": "PUlGYnwwi8Z10yD8Nu1s",
-            "Jannifer Pipeline":"oEQOWmBshN67mQTo8nJC",
-            "Caitlyn Pipeline":"10t8NVSGtAujbtkW643w",
-        }
-        
-        # Cache for pipeline and user data
+        # Pipeline and stage metadata ({pipeline_id: {'name', 'stages'}}), loaded
+        # from the shared cache by fetch_pipeline_data before the workers start.
+        # It is only replaced when a row references a stage it does not know.
         self.pipeline_cache = {}
-        self.user_cache = {}
+        self._pipeline_refresh_lock = threading.Lock()
+        self._pipelines_refreshed = False
+        # Assigned users, shared by all pipeline workers and persisted between runs
+        self.users = UserDirectory(self.location_id, self.headers)
+        # Sync report of the last fetch_all_opportunities run, summed over pipelines
+        self.report = Counter()
         
         # Set timezone to US/Arizona
         self.timezone = pytz.timezone('US/Arizona')
 
-    def fetch_pipeline_data(self):
-        """Fetch and cache pipeline data"""
+    @property
+    def pipelines(self):
+        """
+        Pipelines to sync as {id: name}, discovered from the pipeline metadata.
+        Keyed by ID because names are not unique.
+
+        Restricted to ``GHL_SYNC_PIPELINES`` (names or IDs) when that setting is not empty.
+        """
+        selected = set(getattr(settings, 'GHL_SYNC_PIPELINES', []) or [])
+        return {
+            pipeline_id: info['name']
+            for pipeline_id, info in self.pipeline_cache.items()
+            if not selected or pipeline_id in selected or info['name'] in selected
+        }
+
+    def fetch_pipeline_data(self, refresh=False):
+        """Load pipeline data from the shared metadata cache (fetching it on a miss)"""
         try:
-            url = f"{self.base_url}/opportunities/pipelines"
-            params = {'locationId': self.location_id}
-            
-            response = requests.get(url, headers=self.headers, params=params)
-            response.raise_for_status()
-            
-            data = response.json()
-            pipelines = data.get('pipelines', [])
-            
-            # Cache pipeline and stage information
-            for pipeline in pipelines:
-                pipeline_id = pipeline['id']
-                self.pipeline_cache[pipeline_id] = {
-                    'name': pipeline['name'],
-                    'stages': {stage['id']: stage['name'] for stage in pipeline.get('stages', [])}
-                }
-            
-            logger.info(f"Cached {len(pipelines)} pipelines")
+            self.pipeline_cache = get_pipelines(self.location_id, self.headers, refresh=refresh)
+            logger.info(f"Loaded {len(self.pipeline_cache)} pipelines")
             return True
             
         except requests.exceptions.RequestException as e:
             logger.error(f"Error fetching pipeline data: {e}")
             return False
 
+    def get_stage_name(self, pipeline_id, stage_id):
+        """Stage name from the pipeline metadata, refreshed once per run if a stage is unknown"""
+        stages = self.pipeline_cache.get(pipeline_id, {}).get('stages', {})
+        if stage_id and stage_id not in stages and not self._pipelines_refreshed:
+            with self._pipeline_refresh_lock:
+                if not self._pipelines_refreshed:
+                    self._pipelines_refreshed = True
+                    logger.info(f"Unknown stage {stage_id}, refreshing pipeline metadata")
+                    self.fetch_pipeline_data(refresh=True)
+            stages = self.pipeline_cache.get(pipeline_id, {}).get('stages', {})
+        return stages.get(stage_id, '')
+
     def fetch_user_data(self, user_id):
         """Fetch and cache user data"""
-        if user_id in self.user_cache:
-            return self.user_cache[user_id]
-        
-        try:
-            url = f"{self.base_url}/users/{user_id}"
-            response = requests.get(url, headers=self.headers)
-            response.raise_for_status()
-            
-            user_data = response.json()
-            self.user_cache[user_id] = {
-                'name': user_data.get('name', ''),
-                'email': user_data.get('email', ''),
-                'firstName': user_data.get('firstName', ''),
-                'lastName': user_data.get('lastName', '')
-            }
-            
-            logger.info(f"Cached user data for {user_id}")
-            return self.user_cache[user_id]
-            
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Error fetching user data for {user_id}: {e}")
-            return {'name': '', 'email': '', 'firstName': '', 'lastName': ''}
+        return self.users.get(user_id)
 
-    def fetch_opportunities_for_pipeline(self, pipeline_name, pipeline_id):
-        """Fetch all opportunities for a specific pipeline with pagination"""
-        all_opportunities = []
+    def iter_opportunity_pages(self, pipeline_name, pipeline_id, cursor=None):
+        """
+        Yield the opportunities of a pipeline one API page at a time, as
+        ``(opportunities, cursor)`` pairs. Passing a page's cursor back in
+        continues with the page after it.
+
+        Raises:
+            PaginationAborted: if a page request fails or the page limit is hit,
+                               so callers know the pipeline was not fully read.
+        """
         page = 1
         has_next_page = True
-        start_after_id = None
-        start_after = None
+        start_after_id = (cursor or {}).get('startAfterId')
+        start_after = (cursor or {}).get('startAfter')
+        total = 0
         
         logger.info(f"Fetching opportunities for pipeline: {pipeline_name}")
         
@@ -120,78 +263,163 @@ class GHLOpportunityFetcher:
                 if start_after:
                     params['startAfter'] = start_after
                 
-                response = requests.get(url, headers=self.headers, params=params)
+                response = http_client.ghl_get(url, self.location_id, headers=self.headers, params=params)
                 response.raise_for_status()
                 
                 data = response.json()
-                opportunities = data.get('opportunities', [])
-                meta = data.get('meta', {})
-                
-                all_opportunities.extend(opportunities)
-                
-                # Check if there's a next page
-                next_page_url = meta.get('nextPageUrl')
-                start_after_id = meta.get('startAfterId')
-                start_after = meta.get('startAfter')
-                
-                has_next_page = bool(next_page_url and opportunities)
-                
-                logger.info(f"Fetched page {page} for {pipeline_name}: {len(opportunities)} opportunities")
-                page += 1
-                
-                # Safety check to prevent infinite loops
-                if page > 1000:
-                    logger.warning(f"Reached maximum page limit for {pipeline_name}")
-                    break
-                    
             except requests.exceptions.RequestException as e:
                 logger.error(f"Error fetching opportunities for {pipeline_name}, page {page}: {e}")
-                break
+                raise PaginationAborted(f"{pipeline_name}: page {page} failed: {e}") from e
+            
+            opportunities = data.get('opportunities', [])
+            meta = data.get('meta', {})
+            
+            # Check if there's a next page
+            next_page_url = meta.get('nextPageUrl')
+            start_after_id = meta.get('startAfterId')
+            start_after = meta.get('startAfter')
+            
+            has_next_page = bool(next_page_url and opportunities)
+            
+            total += len(opportunities)
+            logger.info(f"Fetched page {page} for {pipeline_name}: {len(opportunities)} opportunities")
+            
+            if opportunities:
+                yield opportunities, {'startAfter': start_after, 'startAfterId': start_after_id}
+            page += 1
+            
+            # Safety check to prevent infinite loops
+            if has_next_page and page > 1000:
+                logger.warning(f"Reached maximum page limit for {pipeline_name}")
+                raise PaginationAborted(f"{pipeline_name}: reached maximum page limit")
         
-        logger.info(f"Total opportunities fetched for {pipeline_name}: {len(all_opportunities)}")
-        return all_opportunities
+        logger.info(f"Total opportunities fetched for {pipeline_name}: {total}")
 
-    def bulk_save_opportunities(self, opportunities, pipeline_name):
+    def iter_updated_opportunity_pages(self, pipeline_name, pipeline_id, since, cursor=None):
         """
-        Bulk save, update, or delete opportunities based on incoming API data.
+        Yield pages of a pipeline's opportunities whose ``updatedAt`` is at or
+        after ``since``, as ``(opportunities, cursor)`` pairs.
 
-        Args:
-            opportunities (list): List of opportunity dicts from GoHighLevel API.
-            pipeline_name (str): The name of the pipeline these opportunities belong to.
-                                 Used to scope the sync (especially for deletions).
+        Uses the filtered ``/opportunities/search`` query sorted by ``updatedAt``
+        ascending with its ``searchAfter`` cursor. Records older than ``since``
+        are dropped here as well, so nothing unchanged reaches the database.
+
+        Raises:
+            PaginationAborted: if a page request fails or the page limit is hit.
         """
-        to_create = []
-        to_update = []
-        incoming_opportunity_ids = {opp["id"] for opp in opportunities if "id" in opp}
+        url = f"{self.base_url}/opportunities/search"
+        body = {
+            'locationId': self.location_id,
+            'limit': 100,
+            'filters': [
+                {'field': 'pipeline_id', 'operator': 'eq', 'value': pipeline_id},
+                {'field': 'updatedAt', 'operator': 'range', 'value': {'gte': since.isoformat()}},
+            ],
+            'sort': [{'field': 'updatedAt', 'direction': 'asc'}],
+        }
+        if cursor:
+            body['searchAfter'] = cursor
+        page = 1
+        total = 0
 
-        # --- Determine the scope for existing opportunities and deletion ---
-        # We need to fetch existing opportunities from the DB that match the scope
-        # of the incoming data. This is crucial for accurate deletion.
-        # Assuming opportunities always come with a 'locationId' and this function
-        # processes opportunities for a specific pipeline within a location.
+        while True:
+            try:
+                response = http_client.ghl_post(url, self.location_id, headers=self.headers, json=body)
+                response.raise_for_status()
+                data = response.json()
+            except requests.exceptions.RequestException as e:
+                logger.error(f"Error fetching updated opportunities for {pipeline_name}, page {page}: {e}")
+                raise PaginationAborted(f"{pipeline_name}: page {page} failed: {e}") from e
 
-        # Get the location_id from the incoming data. Assuming consistency for the batch.
-        location_id_for_sync = None
-        if opportunities:
-            location_id_for_sync = opportunities[0].get('locationId')
+            opportunities = data.get('opportunities', [])
+            if not opportunities:
+                break
 
-        if not location_id_for_sync:
-            logger.warning("No locationId found in incoming opportunities. Deletion scope will be broad or skipped.")
-            # Decide if you want to abort, or proceed without deletion, or use a broader scope.
-            # For safety, let's make deletion contingent on a known location_id.
+            changed = [
+                opp for opp in opportunities
+                if (_api_datetime(opp.get('updatedAt')) or since) >= since
+            ]
+            total += len(changed)
+            logger.info(f"Fetched page {page} for {pipeline_name}: {len(changed)} updated opportunities")
+            search_after = opportunities[-1].get('searchAfter')
+            if changed:
+                yield changed, search_after
+
+            if len(opportunities) < 100 or not search_after:
+                break
+            body['searchAfter'] = search_after
+            page += 1
 
-        # Fetch existing opportunities relevant to the current sync scope (location + pipeline)
-        existing_db_opportunities_query = Opportunity.objects.filter(
-            location_id=location_id_for_sync,
-            pipeline_name=pipeline_name # Assuming pipeline_name is a reliable filter for deletion scope
-        ) if location_id_for_sync else Opportunity.objects.none() # Don't fetch if no location_id for safety
+            if page > 1000:
+                logger.warning(f"Reached maximum page limit for {pipeline_name}")
+                raise PaginationAborted(f"{pipeline_name}: reached maximum page limit")
 
-        existing_db_opportunities_map = {
-            opp.id: opp for opp in existing_db_opportunities_query
-        }
-        existing_db_opportunity_ids = set(existing_db_opportunities_map.keys())
+        logger.info(f"Total updated opportunities fetched for {pipeline_name}: {total}")
 
+    def fetch_opportunities_for_pipeline(self, pipeline_name, pipeline_id):
+        """Fetch all opportunities for a specific pipeline with pagination"""
+        all_opportunities = []
+        try:
+            for opportunities, _ in self.iter_opportunity_pages(pipeline_name, pipeline_id):
+                all_opportunities.extend(opportunities)
+        except PaginationAborted:
+            pass
+        return all_opportunities
+
+    def build_opportunity(self, opp_data, pipeline_name):
+        """Map one GoHighLevel opportunity dict to an (unsaved) Opportunity instance"""
+        pipeline_id = opp_data.get('pipelineId', '')
+        stage_id = opp_data.get('pipelineStageId', '')
+        stage_name = self.get_stage_name(pipeline_id, stage_id)
+
+        assigned_to = opp_data.get('assignedTo', '')
+        user_info = self.fetch_user_data(assigned_to) if assigned_to else {}
+
+        contact = opp_data.get('contact', {})
+
+        return Opportunity(
+            id=opp_data['id'],
+            name=opp_data.get('name', ''),
+            monetary_value=opp_data.get('monetaryValue', 0),
+            pipeline_id=pipeline_id,
+            pipeline_name=pipeline_name, # Use the passed pipeline_name for consistency
+            pipeline_stage_id=stage_id,
+            pipeline_stage_name=stage_name,
+            assigned_to=assigned_to,
+            assigned_user_name=user_info.get('name', ''),
+            assigned_user_email=user_info.get('email', ''),
+            status=opp_data.get('status', ''),
+            created_at=self.parse_datetime(opp_data.get('createdAt')),
+            updated_at=self.parse_datetime(opp_data.get('updatedAt')),
+            contact_id=contact.get('id', ''),
+            contact_name=contact.get('name', ''),
+            contact_company_name=contact.get('companyName', ''),
+            contact_email=contact.get('email', ''),
+            contact_phone=contact.get('phone', ''),
+            contact_tags=contact.get('tags', []),
+            location_id=opp_data.get('locationId', '')
+        )
 
+    def upsert_opportunities(self, opportunities, pipeline_name, generation, bulk_load=False):
+        """
+        Create or update one chunk of opportunities and stamp them with the run ``generation``.
+
+        Written with a single ``INSERT ... ON CONFLICT (id) DO UPDATE`` per
+        batch (see ``bulk.upsert``); existing rows are never loaded. Rows
+        whose fingerprint matches the incoming record are not rewritten, they
+        only get their ``sync_generation`` moved forward so the deletion sweep
+        keeps them. A stored row with a later ``updated_at`` is never
+        overwritten by an older record (e.g. a late webhook). With
+        ``bulk_load`` the chunk is streamed through ``COPY`` instead (see
+        ``bulk.copy_upsert``), which is what full runs use.
+
+        Returns:
+            Counter: ``created``, ``updated`` and ``skipped`` row counts.
+        """
+        # Resolve every assignee of the chunk up front instead of one request per row
+        self.users.prefetch({opp.get('assignedTo') for opp in opportunities})
+
+        to_save = []
         for opp_data in opportunities:
             opp_id = opp_data.get('id')
             if not opp_id:
@@ -199,115 +427,117 @@ class GHLOpportunityFetcher:
                 continue
 
             try:
-                pipeline_id = opp_data.get('pipelineId', '')
-                stage_id = opp_data.get('pipelineStageId', '')
-                pipeline_info = self.pipeline_cache.get(pipeline_id, {})
-                stage_name = pipeline_info.get('stages', {}).get(stage_id, '')
-
-                assigned_to = opp_data.get('assignedTo', '')
-                user_info = self.fetch_user_data(assigned_to) if assigned_to else {}
-
-                contact = opp_data.get('contact', {})
-                created_at = self.parse_datetime(opp_data.get('createdAt'))
-                updated_at = self.parse_datetime(opp_data.get('updatedAt'))
-
-                # Create an Opportunity instance, whether for creation or update
-                # For update, we'll later copy these fields to the existing instance
-                opportunity = Opportunity(
-                    id=opp_id,
-                    name=opp_data.get('name', ''),
-                    monetary_value=opp_data.get('monetaryValue', 0),
-                    pipeline_id=pipeline_id,
-                    pipeline_name=pipeline_name, # Use the passed pipeline_name for consistency
-                    pipeline_stage_id=stage_id,
-                    pipeline_stage_name=stage_name,
-                    assigned_to=assigned_to,
-                    assigned_user_name=user_info.get('name', ''),
-                    assigned_user_email=user_info.get('email', ''),
-                    status=opp_data.get('status', ''),
-                    created_at=created_at,
-                    updated_at=updated_at,
-                    contact_id=contact.get('id', ''),
-                    contact_name=contact.get('name', ''),
-                    contact_company_name=contact.get('companyName', ''),
-                    contact_email=contact.get('email', ''),
-                    contact_phone=contact.get('phone', ''),
-                    contact_tags=contact.get('tags', []),
-                    location_id=opp_data.get('locationId', '')
-                )
-
-                if opp_id in existing_db_opportunity_ids: # Check against fetched DB IDs
-                    # Update existing opportunity instance for bulk_update
-                    existing_instance = existing_db_opportunities_map[opp_id]
-                    existing_instance.name = opportunity.name
-                    existing_instance.monetary_value = opportunity.monetary_value
-                    existing_instance.pipeline_id = opportunity.pipeline_id
-                    existing_instance.pipeline_name = opportunity.pipeline_name
-                    existing_instance.pipeline_stage_id = opportunity.pipeline_stage_id
-                    existing_instance.pipeline_stage_name = opportunity.pipeline_stage_name
-                    existing_instance.assigned_to = opportunity.assigned_to
-                    existing_instance.assigned_user_name = opportunity.assigned_user_name
-                    existing_instance.assigned_user_email = opportunity.assigned_user_email
-                    existing_instance.status = opportunity.status
-                    existing_instance.created_at = opportunity.created_at # Assuming you might update this, otherwise remove
-                    existing_instance.updated_at = opportunity.updated_at
-                    existing_instance.contact_id = opportunity.contact_id
-                    existing_instance.contact_name = opportunity.contact_name
-                    existing_instance.contact_company_name = opportunity.contact_company_name
-                    existing_instance.contact_email = opportunity.contact_email
-                    existing_instance.contact_phone = opportunity.contact_phone
-                    existing_instance.contact_tags = opportunity.contact_tags
-                    existing_instance.location_id = opportunity.location_id
-                    to_update.append(existing_instance)
-                else:
-                    # New opportunity
-                    to_create.append(opportunity)
-
+                opportunity = self.build_opportunity(opp_data, pipeline_name)
+                opportunity.content_hash = content_fingerprint(opportunity, OPPORTUNITY_CONTENT_FIELDS)
+                opportunity.sync_generation = generation
             except Exception as e:
                 logger.error(f"Error preparing opportunity {opp_id}: {e}")
                 continue
+            to_save.append(opportunity)
 
-        # --- Deletion Logic ---
-        opportunities_to_delete_ids = existing_db_opportunity_ids - incoming_opportunity_ids
+        if bulk_load:
+            return bulk.copy_upsert(Opportunity, to_save, 'id', OPPORTUNITY_UPDATE_FIELDS, newer_field='updated_at')
+        return bulk.upsert(
+            Opportunity, to_save, 'id', OPPORTUNITY_UPDATE_FIELDS, batch_size=self.chunk_size, newer_field='updated_at',
+        )
 
-        total_processed = 0
+    def sweep_stale_opportunities(self, location_id, pipeline_id, generation):
+        """
+        Delete opportunities of a location/pipeline that the sync run ``generation`` did not see.
+
+        Scoped by pipeline ID: names come from the API and can be renamed or shared.
+        """
+        if not location_id or not pipeline_id:
+            logger.warning("Skipped opportunity deletion due to missing location_id or pipeline_id in sync context.")
+            return 0
+
+        deleted_count = bulk.sweep(Opportunity, generation, location_id=location_id, pipeline_id=pipeline_id)
+        logger.info(f"Deleted {deleted_count} opportunities not in incoming data for location '{location_id}' and pipeline '{pipeline_id}'.")
+        return deleted_count
+
+    def previous_pipelines(self, opportunities, pipeline_id):
+        """
+        Pipelines that opportunities of this chunk are stored under before it is
+        written, i.e. the pipelines they were moved out of into ``pipeline_id``.
+        Call before upserting the chunk.
+        """
+        ids = [opp['id'] for opp in opportunities if opp.get('id')]
+        moved_from = (
+            Opportunity.objects.filter(id__in=ids).exclude(pipeline_id=pipeline_id)
+            .values_list('pipeline_id', flat=True).distinct()
+        )
+        return set(moved_from) - {None, ''}
+
+    def refresh_summary(self, pipeline_id, report, moved_from=()):
+        """
+        Rebuild the pipeline's OpportunitySummary rows if the sync changed anything,
+        and those of every pipeline ``moved_from``, which still count the moved rows.
+        """
+        pipeline_ids = set(moved_from)
+        if pipeline_id and (report['created'] or report['updated'] or report['deleted']):
+            pipeline_ids.add(pipeline_id)
+        for summary_pipeline_id in pipeline_ids:
+            try:
+                groups = refresh_pipeline_summary(self.location_id, summary_pipeline_id)
+                logger.info(f"Refreshed {groups} summary rows for pipeline {summary_pipeline_id}")
+            except Exception as e:
+                logger.error(f"Failed to refresh summary for pipeline {summary_pipeline_id}: {e}", exc_info=True)
+
+    def bulk_save_opportunities(self, opportunities, pipeline_name):
+        """
+        Bulk save, update, or delete opportunities based on incoming API data.
+
+        Args:
+            opportunities (list): List of opportunity dicts from GoHighLevel API.
+            pipeline_name (str): The name of the pipeline these opportunities belong to.
+
+        Runs under the pipeline's sync lease (``hold_sync_lease``); nothing is
+        written and 0 is returned while another sync of the pipeline holds it.
+        Once the lease is lost it stops before the next chunk and the sweep.
+        """
+        # Get the location_id from the incoming data. Assuming consistency for the batch.
+        location_id_for_sync = None
+        if opportunities:
+            location_id_for_sync = opportunities[0].get('locationId')
+
+        if not location_id_for_sync:
+            logger.warning("No locationId found in incoming opportunities. Deletion scope will be broad or skipped.")
+
+        pipeline_id = opportunities[0].get('pipelineId') if opportunities else next(
+            (pipeline_id for pipeline_id, name in self.pipelines.items() if name == pipeline_name), None
+        )
+        location_id = location_id_for_sync or self.location_id
         try:
-            with transaction.atomic():
-                if to_create:
-                    Opportunity.objects.bulk_create(to_create, ignore_conflicts=True)
-                    logger.info(f"Bulk created {len(to_create)} opportunities")
-                    total_processed += len(to_create)
-
-                if to_update:
-                    # Ensure all fields are in the list for bulk_update
-                    update_fields = [
-                        'name', 'monetary_value', 'pipeline_id', 'pipeline_name',
-                        'pipeline_stage_id', 'pipeline_stage_name',
-                        'assigned_to', 'assigned_user_name', 'assigned_user_email',
-                        'status', 'created_at', 'updated_at', 'contact_id',
-                        'contact_name', 'contact_company_name', 'contact_email',
-                        'contact_phone', 'contact_tags', 'location_id'
-                    ]
-                    Opportunity.objects.bulk_update(to_update, fields=update_fields)
-                    logger.info(f"Bulk updated {len(to_update)} opportunities")
-                    total_processed += len(to_update)
-
-                if opportunities_to_delete_ids:
-                    if location_id_for_sync and pipeline_name: # Safety check before deleting
-                        deleted_count, _ = Opportunity.objects.filter(
-                            id__in=opportunities_to_delete_ids,
-                            location_id=location_id_for_sync,
-                            pipeline_name=pipeline_name # Filter by pipeline to scope deletion
-                        ).delete()
-                        logger.info(f"Deleted {deleted_count} opportunities not in incoming data for location '{location_id_for_sync}' and pipeline '{pipeline_name}'.")
-                        total_processed += deleted_count # Count deletions as part of processed
-                    else:
-                        logger.warning("Skipped opportunity deletion due to missing location_id or pipeline_name in sync context.")
-
-            return total_processed
+            # Same lease and run scope as sync_pipeline, so the two never sweep each other's rows
+            with hold_sync_lease(location_id, opportunity_sync_scope(pipeline_id)) as lease:
+                return self._bulk_save_opportunities(opportunities, pipeline_name, location_id_for_sync, pipeline_id, lease)
+        except (SyncInProgress, SyncLeaseLost) as e:
+            logger.error(f"Bulk save skipped for {pipeline_name}: {e}")
+            return 0
 
+    def _bulk_save_opportunities(self, opportunities, pipeline_name, location_id_for_sync, pipeline_id, lease):
+        run = start_sync_run(location_id_for_sync or self.location_id, opportunity_sync_scope(pipeline_id), full=True)
+        report = Counter(fetched=len(opportunities))
+        moved_from = set()
+        try:
+            for chunk in iter_chunks([opportunities], self.bulk_load_chunk_size):
+                check_sync_lease(lease)
+                moved_from |= self.previous_pipelines(chunk, pipeline_id)
+                report.update(self.upsert_opportunities(chunk, pipeline_name, run.id, bulk_load=True))
+            check_sync_lease(lease)
+            report['deleted'] = self.sweep_stale_opportunities(location_id_for_sync, pipeline_id, run.id)
+            logger.info(f"Sync report for {pipeline_name}: {format_sync_report(report)}")
+            finish_sync_run(run, report)
+            self.refresh_summary(pipeline_id, report, moved_from)
+            return report['created'] + report['updated'] + report['deleted']
+
+        except SyncLeaseLost:
+            # The run belongs to the worker that took the lease over; leave its status alone
+            self.refresh_summary(pipeline_id, report, moved_from)
+            raise
         except Exception as e:
             logger.error(f"Bulk save/update/delete failed for opportunities: {e}", exc_info=True)
+            finish_sync_run(run, report, SyncRun.FAILED)
             return 0
 
 
@@ -334,8 +564,131 @@ class GHLOpportunityFetcher:
             logger.warning(f"Could not parse datetime: {date_string}, error: {e}")
             return timezone.now().astimezone(self.timezone)
 
-    def fetch_all_opportunities(self):
-        """Main method to fetch all opportunities from specified pipelines"""
+    def sync_pipeline(self, pipeline_name, pipeline_id, full=None):
+        """
+        Stream one pipeline into the database.
+
+        Pages are upserted in chunks of ``self.chunk_size`` as they arrive;
+        full runs bulk-load larger chunks through ``COPY`` instead.
+
+        Args:
+            full (bool, optional): Force (True) or skip (False) a full sweep.
+                By default a full run happens when the pipeline has no
+                ``updatedAt`` watermark yet or its last full run is older than
+                ``GHL_FULL_SYNC_INTERVAL``; otherwise only opportunities
+                updated since the watermark are requested and upserted.
+
+        A full run deletes the rows that were not seen at the end, but only
+        when the whole pipeline was read, so a failed page never wipes
+        existing data. Incremental runs never delete.
+
+        The pipeline is synced under its scope's lease (``hold_sync_lease``);
+        once the lease is lost the run stops before the next chunk
+        (``SyncLeaseLost``).
+
+        Progress is checkpointed on the SyncRun after every chunk; a run that
+        was interrupted is resumed from its checkpoint (see ``open_sync_run``).
+        A crash therefore re-reads the pages after the last committed chunk,
+        up to ``GHL_BULK_LOAD_CHUNK_SIZE`` rows on full runs and
+        ``GHL_SYNC_CHUNK_SIZE`` on incremental ones.
+
+        Returns:
+            Counter: sync report with ``fetched``, ``created``, ``updated``,
+            ``skipped`` (unchanged) and ``deleted`` counts.
+
+        Raises:
+            SyncInProgress: if the pipeline is already being synced.
+        """
+        with hold_sync_lease(self.location_id, opportunity_sync_scope(pipeline_id)) as lease:
+            return self._sync_pipeline(pipeline_name, pipeline_id, full, lease)
+
+    def _sync_pipeline(self, pipeline_name, pipeline_id, full, lease):
+        logger.info(f"\n--- Processing {pipeline_name} ---")
+        
+        state = get_sync_state(self.location_id, opportunity_sync_scope(pipeline_id))
+        run, checkpoint = open_sync_run(self.location_id, opportunity_sync_scope(pipeline_id), state, full)
+        full = run.full
+        synced_at = run.started_at
+        report = Counter(run.report) if checkpoint else Counter()
+        high_water_mark = resumed_high_water_mark(state, checkpoint)
+        cursor = checkpoint['cursor'] if checkpoint else None
+        if checkpoint:
+            logger.info(f"Resuming sync run {run.id} for {pipeline_name} from its last checkpoint")
+        
+        if full:
+            pages = self.iter_opportunity_pages(pipeline_name, pipeline_id, cursor=cursor)
+            chunk_size = self.bulk_load_chunk_size
+        else:
+            since = state.high_water_mark - getattr(settings, 'GHL_INCREMENTAL_OVERLAP', timedelta(minutes=5))
+            logger.info(f"Incremental sync for {pipeline_name} since {since.isoformat()}")
+            pages = self.iter_updated_opportunity_pages(pipeline_name, pipeline_id, since, cursor=cursor)
+            chunk_size = self.chunk_size
+        
+        moved_from = set()
+        try:
+            for chunk, cursor in iter_resumable_chunks(pages, chunk_size, cursor):
+                check_sync_lease(lease)
+                report['fetched'] += len(chunk)
+                moved_from |= self.previous_pipelines(chunk, pipeline_id)
+                report.update(self.upsert_opportunities(chunk, pipeline_name, run.id, bulk_load=full))
+                for opp_data in chunk:
+                    seen = _api_datetime(opp_data.get('updatedAt'))
+                    if seen and (high_water_mark is None or seen > high_water_mark):
+                        high_water_mark = seen
+                save_checkpoint(run, cursor, report, high_water_mark)
+            # Never sweep on behalf of a run someone else has taken over
+            check_sync_lease(lease)
+        except SyncLeaseLost:
+            # The run belongs to the worker that took the lease over; leave its status alone
+            self.refresh_summary(pipeline_id, report, moved_from)
+            raise
+        except PaginationAborted as e:
+            logger.error(f"Incomplete fetch for {pipeline_name}, skipping deletion and keeping the watermark: {e}")
+            logger.info(f"Sync report for {pipeline_name}: {format_sync_report(report)}")
+            finish_sync_run(run, report, SyncRun.INCOMPLETE)
+            # The chunks that were written are committed, keep the tiles in step with them
+            self.refresh_summary(pipeline_id, report, moved_from)
+            return report
+        except Exception:
+            finish_sync_run(run, report, SyncRun.FAILED)
+            # A retry no longer sees where the already written rows came from
+            self.refresh_summary(pipeline_id, report, moved_from)
+            raise
+        
+        if full:
+            report['deleted'] = self.sweep_stale_opportunities(self.location_id, pipeline_id, run.id)
+            state.last_full_sync_at = synced_at
+            # Pages read early in a long run miss later edits; only the run's start is safe
+            high_water_mark = synced_at
+        
+        state.high_water_mark = high_water_mark
+        state.save(update_fields=['high_water_mark', 'last_full_sync_at', 'updated_at'])
+        finish_sync_run(run, report)
+        self.refresh_summary(pipeline_id, report, moved_from)
+        
+        logger.info(f"Sync report for {pipeline_name}: {format_sync_report(report)}")
+        return report
+
+    def _sync_pipeline_in_worker(self, pipeline_name, pipeline_id, full=None):
+        """Run sync_pipeline in a worker thread and release its DB connection afterwards"""
+        try:
+            return self.sync_pipeline(pipeline_name, pipeline_id, full=full)
+        finally:
+            # Django opens one connection per thread; the pool threads die with
+            # the executor, so close it explicitly instead of leaking it.
+            connection.close()
+
+    def fetch_all_opportunities(self, concurrent=True, full=None):
+        """
+        Main method to fetch all opportunities from specified pipelines.
+
+        Args:
+            concurrent (bool): Fetch pipelines in parallel using up to
+                               ``self.max_workers`` threads. When False the
+                               pipelines are processed one after another.
+            full (bool, optional): Passed to ``sync_pipeline``; None lets each
+                                   pipeline decide between full and incremental.
+        """
         logger.info("Starting opportunity fetch process...")
         
         # First, fetch and cache pipeline data
@@ -343,34 +696,33 @@ class GHLOpportunityFetcher:
             logger.error("Failed to fetch pipeline data. Aborting.")
             return False
         
-        total_saved = 0
+        total_report = self.report = Counter()
+        workers = min(self.max_workers, len(self.pipelines))
         
-        # Fetch opportunities for each pipeline
-        for pipeline_name, pipeline_id in self.pipelines.items():
-            try:
-                logger.info(f"\n--- Processing {pipeline_name} ---")
-                
-                # Fetch all opportunities for this pipeline
-                opportunities = self.fetch_opportunities_for_pipeline(pipeline_name, pipeline_id)
-                
-                # Save each opportunity to database
-                # saved_count = 0
-                # for opp_data in opportunities:
-                #     if self.save_opportunity_to_db(opp_data, pipeline_name):
-                #         saved_count += 1
-
-                saved_count = self.bulk_save_opportunities(opportunities, pipeline_name)
-
-                
-                logger.info(f"Saved {saved_count}/{len(opportunities)} opportunities for {pipeline_name}")
-                total_saved += saved_count
-                
-            except Exception as e:
-                logger.error(f"Error processing pipeline {pipeline_name}: {e}")
-                continue
+        if concurrent and workers > 1:
+            logger.info(f"Fetching {len(self.pipelines)} pipelines with {workers} workers")
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ghl-pipeline") as executor:
+                futures = {
+                    executor.submit(self._sync_pipeline_in_worker, pipeline_name, pipeline_id, full): pipeline_name
+                    for pipeline_id, pipeline_name in self.pipelines.items()
+                }
+                for future in as_completed(futures):
+                    pipeline_name = futures[future]
+                    try:
+                        total_report.update(future.result())
+                    except Exception as e:
+                        logger.error(f"Error processing pipeline {pipeline_name}: {e}")
+        else:
+            # Fetch opportunities for each pipeline
+            for pipeline_id, pipeline_name in self.pipelines.items():
+                try:
+                    total_report.update(self.sync_pipeline(pipeline_name, pipeline_id, full=full))
+                except Exception as e:
+                    logger.error(f"Error processing pipeline {pipeline_name}: {e}")
+                    continue
         
         logger.info(f"\n=== Process Complete ===")
-        logger.info(f"Total opportunities saved: {total_saved}")
+        logger.info(f"Total opportunities: {format_sync_report(total_report)}")
         return True
 
 
@@ -442,48 +794,76 @@ def fetch_opportunities_standalone(access_token, location_id):
     return fetcher.fetch_all_opportunities()
 
 
-def sync_opportunities():
-    token = GHLAuthCredentials.objects.first()
-    ACCESS_TOKEN = token.access_token
-    LOCATION_ID = token.location_id
+def sync_opportunities(location_id=None):
+    """
+    Sync the opportunities of every pipeline of a location (the default
+    location when omitted).
 
-    fetch_opportunities_standalone(ACCESS_TOKEN, LOCATION_ID)
-    # fetch_all_contacts(LOCATION_ID,ACCESS_TOKEN)
+    Returns:
+        Counter: sync report summed over the pipelines.
+    """
+    credentials = token_manager.get_credentials(location_id)
+    fetcher = GHLOpportunityFetcher(credentials['access_token'], credentials['location_id'])
+    fetcher.fetch_all_opportunities()
+    return fetcher.report
 
 
 
 
 
 
-def fetch_all_contacts() -> List[Dict[str, Any]]:
-    """
-    Fetch all contacts from GoHighLevel API with proper pagination handling.
-    
-    Args:
-        location_id (str): The location ID for the subaccount
-        access_token (str, optional): Bearer token for authentication
-        
-    Returns:
-        List[Dict]: List of all contacts
+# Contact fields that make up the row fingerprint
+CONTACT_CONTENT_FIELDS = [
+    "first_name", "last_name", "phone", "email", "dnd", "country",
+    "date_added", "date_updated", "tags", "custom_fields", "location_id", "timestamp"
+]
+# Contact fields rewritten when an existing row has changed
+CONTACT_UPDATE_FIELDS = CONTACT_CONTENT_FIELDS + ["content_hash", "sync_generation"]
+
+
+def _contact_start_after(last_contact):
+    """Millisecond timestamp of the last contact on a page, used as the startAfter cursor"""
+    for key in ("dateAdded", "createdAt"):
+        if key not in last_contact:
+            continue
+        value = last_contact[key]
+        if isinstance(value, str):
+            try:
+                # Try parsing ISO format
+                dt = datetime.fromisoformat(value.replace('Z', '+00:00'))
+                return int(dt.timestamp() * 1000)  # Convert to milliseconds
+            except ValueError:
+                # Try parsing as timestamp
+                try:
+                    return int(float(value))
+                except ValueError:
+                    return None
+        elif isinstance(value, (int, float)):
+            return int(value)
+        return None
+    return None
+
+
+def iter_contact_pages(location_id, access_token, cursor=None):
     """
+    Yield the contacts of a location from GoHighLevel one API page at a time,
+    as ``(contacts, cursor)`` pairs. Passing a page's cursor back in continues
+    with the page after it.
 
-    
-    token = GHLAuthCredentials.objects.first()
-    location_id = token.location_id
-    access_token = token.access_token
-    
-    
-    base_url = "https://services.leadconnectorhq.com/contacts/"
+    Raises:
+        PaginationAborted: if the page limit is reached before the last page.
+    """
+    base_url = f"{http_client.GHL_BASE_URL}/contacts/"
     headers = {
         "Accept": "application/json",
         "Authorization": f"Bearer {access_token}",
         "Version": "2021-07-28"
     }
     
-    all_contacts = []
-    start_after = None
-    start_after_id = None
+    start_after = (cursor or {}).get("startAfter")
+    start_after_id = (cursor or {}).get("startAfterId")
     page_count = 0
+    fetched = 0
     
     while True:
         page_count += 1
@@ -502,7 +882,7 @@ def fetch_all_contacts() -> List[Dict[str, Any]]:
             params["startAfterId"] = start_after_id
             
         try:
-            response = requests.get(base_url, headers=headers, params=params)
+            response = http_client.ghl_get(base_url, location_id, headers=headers, params=params)
             
             if response.status_code != 200:
                 print(f"Error Response: {response.status_code}")
@@ -510,234 +890,405 @@ def fetch_all_contacts() -> List[Dict[str, Any]]:
                 raise Exception(f"API Error: {response.status_code}, {response.text}")
             
             data = response.json()
-            
-            # Get contacts from response
-            contacts = data.get("contacts", [])
-            if not contacts:
-                print("No more contacts found.")
-                break
-                
-            all_contacts.extend(contacts)
-            print(f"Retrieved {len(contacts)} contacts. Total so far: {len(all_contacts)}")
-            
-            # Check if there are more pages
-            # GoHighLevel API uses cursor-based pagination
-            meta = data.get("meta", {})
-            
-            # Update pagination cursors for next request
-            if contacts:  # If we got contacts, prepare for next page
-                last_contact = contacts[-1]
-                
-                # Get the ID for startAfterId (this should be a string)
-                if "id" in last_contact:
-                    start_after_id = last_contact["id"]
-                
-                # Get timestamp for startAfter (this must be a number/timestamp)
-                start_after = None
-                if "dateAdded" in last_contact:
-                    # Convert to timestamp if it's a string
-                    date_added = last_contact["dateAdded"]
-                    if isinstance(date_added, str):
-                        try:
-                            from datetime import datetime
-                            # Try parsing ISO format
-                            dt = datetime.fromisoformat(date_added.replace('Z', '+00:00'))
-                            start_after = int(dt.timestamp() * 1000)  # Convert to milliseconds
-                        except:
-                            # Try parsing as timestamp
-                            try:
-                                start_after = int(float(date_added))
-                            except:
-                                pass
-                    elif isinstance(date_added, (int, float)):
-                        start_after = int(date_added)
-                        
-                elif "createdAt" in last_contact:
-                    created_at = last_contact["createdAt"]
-                    if isinstance(created_at, str):
-                        try:
-                            from datetime import datetime
-                            dt = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
-                            start_after = int(dt.timestamp() * 1000)
-                        except:
-                            try:
-                                start_after = int(float(created_at))
-                            except:
-                                pass
-                    elif isinstance(created_at, (int, float)):
-                        start_after = int(created_at)
-            
-            # Check if we've reached the end
-            total_count = meta.get("total", 0)
-            if total_count > 0 and len(all_contacts) >= total_count:
-                print(f"Retrieved all {total_count} contacts.")
-                break
-                
-            # If we got fewer contacts than the limit, we're likely at the end
-            if len(contacts) < 100:
-                print("Retrieved fewer contacts than limit, likely at end.")
-                break
-                
         except requests.exceptions.RequestException as e:
             print(f"Request failed: {e}")
             raise
-        except Exception as e:
-            print(f"Unexpected error: {e}")
-            raise
             
-        # Add a small delay to be respectful to the API
-        time.sleep(0.1)
+        # Get contacts from response
+        contacts = data.get("contacts", [])
+        if not contacts:
+            print("No more contacts found.")
+            break
+        
+        fetched += len(contacts)
+        print(f"Retrieved {len(contacts)} contacts. Total so far: {fetched}")
+        
+        # Update pagination cursors for next request
+        # GoHighLevel API uses cursor-based pagination
+        last_contact = contacts[-1]
+        if "id" in last_contact:
+            start_after_id = last_contact["id"]
+        start_after = _contact_start_after(last_contact)
+        yield contacts, {"startAfter": start_after, "startAfterId": start_after_id}
+        
+        # Check if we've reached the end
+        meta = data.get("meta", {})
+        total_count = meta.get("total", 0)
+        if total_count > 0 and fetched >= total_count:
+            print(f"Retrieved all {total_count} contacts.")
+            break
+            
+        # If we got fewer contacts than the limit, we're likely at the end
+        if len(contacts) < 100:
+            print("Retrieved fewer contacts than limit, likely at end.")
+            break
         
         # Safety check to prevent infinite loops
-        if page_count > 1000:  # Adjust based on expected contact count
+        if page_count >= 1000:  # Adjust based on expected contact count
             print("Warning: Stopped after 1000 pages to prevent infinite loop")
-            break
+            raise PaginationAborted(f"contacts for {location_id}: reached maximum page limit")
     
-    print(f"\nTotal contacts retrieved: {len(all_contacts)}")
+    print(f"\nTotal contacts retrieved: {fetched}")
+
+
+def iter_updated_contact_pages(location_id, access_token, since, cursor=None):
+    """
+    Yield pages of contacts whose ``dateUpdated`` is at or after ``since``,
+    as ``(contacts, cursor)`` pairs.
+
+    Uses the ``/contacts/search`` endpoint sorted by ``dateUpdated`` ascending
+    and its ``searchAfter`` cursor.
+
+    Raises:
+        PaginationAborted: if the page limit is reached before the last page.
+    """
+    url = f"{http_client.GHL_BASE_URL}/contacts/search"
+    headers = {
+        "Accept": "application/json",
+        "Authorization": f"Bearer {access_token}",
+        "Version": "2021-07-28"
+    }
+    body = {
+        "locationId": location_id,
+        "pageLimit": 100,
+        "filters": [
+            {"field": "dateUpdated", "operator": "range", "value": {"gte": since.isoformat()}},
+        ],
+        "sort": [{"field": "dateUpdated", "direction": "asc"}],
+    }
+    if cursor:
+        body["searchAfter"] = cursor
+    page_count = 0
+    fetched = 0
 
-    sync_contacts_to_db(all_contacts)
-    # return all_contacts
+    while True:
+        page_count += 1
+        response = http_client.ghl_post(url, location_id, headers=headers, json=body)
+        if response.status_code != 200:
+            print(f"Error Response: {response.status_code}")
+            print(f"Error Details: {response.text}")
+            raise Exception(f"API Error: {response.status_code}, {response.text}")
+
+        contacts = response.json().get("contacts", [])
+        if not contacts:
+            break
 
+        fetched += len(contacts)
+        print(f"Retrieved {len(contacts)} changed contacts. Total so far: {fetched}")
+        search_after = contacts[-1].get("searchAfter")
+        yield contacts, search_after
 
+        if len(contacts) < 100 or not search_after:
+            break
+        body["searchAfter"] = search_after
 
+        if page_count >= 1000:
+            print("Warning: Stopped after 1000 pages to prevent infinite loop")
+            raise PaginationAborted(f"changed contacts for {location_id}: reached maximum page limit")
 
+    print(f"\nTotal changed contacts retrieved: {fetched}")
 
-def sync_contacts_to_db(contact_data):
+
+def _api_datetime(value):
+    """Parse an API date (ISO string or epoch milliseconds) to an aware datetime, or None"""
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value / 1000, tz=pytz.UTC)
+    if isinstance(value, str):
+        try:
+            dt = parse_datetime(value)
+        except ValueError:
+            return None
+        if dt is not None and timezone.is_naive(dt):
+            dt = pytz.UTC.localize(dt)
+        return dt
+    return None
+
+
+def start_sync_run(location_id, scope, full):
+    """Open a SyncRun; its ID is the generation stamped on every row the run writes"""
+    return SyncRun.objects.create(location_id=location_id, scope=scope, full=bool(full))
+
+
+def next_sync_generation():
     """
-    Syncs contact data from API into the local Contact model using bulk upsert and deletion.
+    Allocate a generation newer than every run started so far, without a SyncRun row.
 
-    Args:
-        contact_data (list): List of contact dicts from GoHighLevel API
+    Used for single-row writes outside a sync (webhooks): a full run that is
+    already in progress will not sweep the row, and the next one re-stamps it.
     """
-    contacts_to_create = []
-    contacts_to_update = [] # Use this list to collect objects for bulk_update
-
-    # Get all contact_ids from the incoming API data
-    incoming_contact_ids = {c['id'] for c in contact_data if 'id' in c} # Use a set for efficient lookups
-
-    # Get all existing contact_ids in your database that correspond to the incoming data's location(s)
-    # IMPORTANT: You need a way to filter your existing_ids to only those relevant to the current sync operation.
-    # If contact_data is always for a single location, you can filter by that location_id.
-    # If contact_data can contain multiple locations, you'll need a more sophisticated approach.
-    # For this example, let's assume all incoming_contact_ids belong to the scope of this sync.
-    # A better approach might be to pass a 'location_id' to this function.
-
-    # Let's assume you pass the location_id(s) for which you are syncing contacts.
-    # For simplicity, if the contact_data has a consistent 'locationId' for all items:
-    current_location_id = None
-    if contact_data:
-        # Get location_id from the first contact, assuming consistency for the entire batch
-        current_location_id = contact_data[0].get('locationId')
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT nextval(pg_get_serial_sequence(%s, 'id'))", [SyncRun._meta.db_table])
+        return cursor.fetchone()[0]
 
-    if not current_location_id:
-        print("Warning: No location_id found in contact_data. Cannot perform accurate deletion scope.")
-        # Decide whether to proceed without deletion, or raise an error.
-        # For now, let's proceed with a limited deletion scope or skip it if no location_id.
 
+def open_sync_run(location_id, scope, state, full=None):
+    """
+    Resume the scope's last run if it stopped part-way, otherwise start a new one.
+
+    The last run is resumed when it did not succeed, has a checkpoint, started
+    within ``GHL_SYNC_RESUME_MAX_AGE`` and, if ``full`` is given, is of that
+    kind. It keeps its ID, so the rows written before the interruption carry
+    the run's generation and survive the sweep at the end of a full run.
+    Callers hold the scope's sync lease (``hold_sync_lease``), so a run still
+    marked running belongs to a worker that died or lost the lease.
+
+    Returns:
+        tuple: ``(run, checkpoint)``; the checkpoint is None for a new run.
+    """
+    run = SyncRun.objects.filter(location_id=location_id, scope=scope).order_by('-id').first()
+    max_age = getattr(settings, 'GHL_SYNC_RESUME_MAX_AGE', timedelta(hours=24))
+    if (run is not None and run.status != SyncRun.SUCCEEDED and run.checkpoint
+            and timezone.now() - run.started_at <= max_age and full in (None, run.full)):
+        run.status = SyncRun.RUNNING
+        run.finished_at = None
+        run.save(update_fields=["status", "finished_at"])
+        return run, run.checkpoint
+
+    if full is None:
+        full = is_full_sync_due(state)
+    return start_sync_run(location_id, scope, full), None
+
+
+def resumed_high_water_mark(state, checkpoint):
+    """Watermark to continue from: the stored one or the checkpoint's, whichever is later"""
+    marks = [state.high_water_mark, _api_datetime((checkpoint or {}).get("high_water_mark"))]
+    marks = [mark for mark in marks if mark is not None]
+    return max(marks) if marks else None
+
+
+def save_checkpoint(run, cursor, report, high_water_mark):
+    """Record a run's position and progress after a committed chunk, so it can resume from there"""
+    run.checkpoint = {
+        "cursor": cursor,
+        "high_water_mark": high_water_mark.isoformat() if high_water_mark else None,
+    }
+    run.report = dict(report)
+    run.save(update_fields=["checkpoint", "report"])
 
-    # Fetch existing contacts relevant to the current sync scope
-    # If you always sync contacts for a specific location, filter by that location_id
-    if current_location_id:
-        existing_db_contacts_query = Contact.objects.filter(location_id=current_location_id)
-    else:
-        # Fallback: if no location_id, this might delete contacts from all locations
-        # This is generally NOT recommended for a sync function unless you're syncing ALL contacts.
-        existing_db_contacts_query = Contact.objects.all()
 
-    existing_db_contacts_map = {contact.contact_id: contact for contact in existing_db_contacts_query}
-    existing_db_contact_ids = set(existing_db_contacts_map.keys())
+def finish_sync_run(run, report, status=SyncRun.SUCCEEDED):
+    run.status = status
+    run.report = dict(report)
+    run.finished_at = timezone.now()
+    if status == SyncRun.SUCCEEDED:
+        # Only interrupted runs are resumed
+        run.checkpoint = None
+    run.save(update_fields=["status", "report", "checkpoint", "finished_at"])
 
 
+def get_sync_state(location_id, scope):
+    state, _ = SyncState.objects.get_or_create(location_id=location_id, scope=scope)
+    return state
+
+
+def is_full_sync_due(state):
+    """A full reconciliation is due when there is no watermark yet or the last one is too old"""
+    if state.high_water_mark is None or state.last_full_sync_at is None:
+        return True
+    interval = getattr(settings, 'GHL_FULL_SYNC_INTERVAL', timedelta(days=7))
+    return timezone.now() - state.last_full_sync_at >= interval
+
+
+def fetch_all_contacts(full=None, location_id=None):
+    """
+    Stream the contacts of a location (the default location when omitted)
+    from GoHighLevel into the Contact table.
+
+    Pages are written in chunks of ``GHL_SYNC_CHUNK_SIZE`` as they arrive, so
+    memory stays bounded by the chunk size. Full runs (including the first
+    import of a location) bulk-load chunks of ``GHL_BULK_LOAD_CHUNK_SIZE``
+    through ``COPY`` instead.
+
+    Args:
+        full (bool, optional): Force (True) or skip (False) a full
+            reconciliation. By default a full run happens when the location
+            has no high-water mark yet or its last full run is older than
+            ``GHL_FULL_SYNC_INTERVAL``; otherwise only contacts updated since
+            the stored mark are fetched.
+
+    A full run re-reads every contact and then deletes the ones that were not
+    returned with a single set-based sweep (only when every page was read).
+    Incremental runs never delete; deletions are picked up by the next full run.
+
+    The contacts are synced under the scope's lease (``hold_sync_lease``);
+    once the lease is lost the run stops before the next chunk
+    (``SyncLeaseLost``).
+
+    Progress is checkpointed on the SyncRun after every chunk; a run that was
+    interrupted is resumed from its checkpoint (see ``open_sync_run``). A
+    crash therefore re-reads the pages after the last committed chunk, up to
+    ``GHL_BULK_LOAD_CHUNK_SIZE`` rows on full runs and ``GHL_SYNC_CHUNK_SIZE``
+    on incremental ones.
+
+    Returns:
+        Counter: sync report (``fetched``, ``created``, ``updated``,
+        ``skipped``, ``deleted``).
+
+    Raises:
+        SyncInProgress: if the location's contacts are already being synced.
+    """
+    credentials = token_manager.get_credentials(location_id)
+    location_id = credentials['location_id']
+    with hold_sync_lease(location_id, CONTACT_SYNC_SCOPE) as lease:
+        return _sync_contacts(location_id, credentials['access_token'], full, lease)
+
+
+def _sync_contacts(location_id, access_token, full, lease):
+    state = get_sync_state(location_id, CONTACT_SYNC_SCOPE)
+    run, checkpoint = open_sync_run(location_id, CONTACT_SYNC_SCOPE, state, full)
+    full = run.full
+    synced_at = run.started_at
+    cursor = checkpoint["cursor"] if checkpoint else None
+    if checkpoint:
+        print(f"Resuming contact sync run {run.id} for location {location_id} from its last checkpoint")
+    
+    if full:
+        print(f"Running full contact sync for location {location_id}")
+        pages = iter_contact_pages(location_id, access_token, cursor=cursor)
+        chunk_size = getattr(settings, 'GHL_BULK_LOAD_CHUNK_SIZE', 5000)
+    else:
+        # Re-read a small window before the mark so contacts updated in the
+        # same instant as the last one seen are not missed
+        since = state.high_water_mark - getattr(settings, 'GHL_INCREMENTAL_OVERLAP', timedelta(minutes=5))
+        print(f"Running incremental contact sync for location {location_id} since {since.isoformat()}")
+        pages = iter_updated_contact_pages(location_id, access_token, since, cursor=cursor)
+        chunk_size = getattr(settings, 'GHL_SYNC_CHUNK_SIZE', 500)
+    
+    high_water_mark = resumed_high_water_mark(state, checkpoint)
+    report = Counter(run.report) if checkpoint else Counter()
+    try:
+        for chunk, cursor in iter_resumable_chunks(pages, chunk_size, cursor):
+            check_sync_lease(lease)
+            report['fetched'] += len(chunk)
+            report.update(upsert_contacts(chunk, run.id, bulk_load=full))
+            for item in chunk:
+                seen = _api_datetime(item.get("dateUpdated") or item.get("dateAdded"))
+                if seen and (high_water_mark is None or seen > high_water_mark):
+                    high_water_mark = seen
+            save_checkpoint(run, cursor, report, high_water_mark)
+        # Never sweep on behalf of a run someone else has taken over
+        check_sync_lease(lease)
+    except SyncLeaseLost:
+        # The run belongs to the worker that took the lease over; leave its status alone
+        raise
+    except PaginationAborted as e:
+        print(f"Incomplete contact fetch, keeping previous high-water mark: {e}")
+        print(f"Contact sync report: {format_sync_report(report)}")
+        finish_sync_run(run, report, SyncRun.INCOMPLETE)
+        return report
+    except Exception:
+        finish_sync_run(run, report, SyncRun.FAILED)
+        raise
+    
+    if full:
+        report['deleted'] = sweep_stale_contacts(location_id, run.id)
+        state.last_full_sync_at = synced_at
+        # Everything up to the start of this run is now in the table; contacts
+        # edited after their page was read may be older than later marks
+        high_water_mark = synced_at
+    
+    state.high_water_mark = high_water_mark
+    state.save(update_fields=["high_water_mark", "last_full_sync_at", "updated_at"])
+    finish_sync_run(run, report)
+    print(f"Contact sync report: {format_sync_report(report)}")
+    print("Sync complete.")
+    return report
+
+
+def contact_from_api(item):
+    """Map one GoHighLevel contact dict to an (unsaved) Contact instance"""
+    date_added = parse_datetime(item.get("dateAdded")) if item.get("dateAdded") else None
+    date_updated = parse_datetime(item.get("dateUpdated")) if item.get("dateUpdated") else None
+
+    return Contact(
+        contact_id=item["id"],
+        first_name=item.get("firstName"),
+        last_name=item.get("lastName"),
+        phone=item.get("phone"),
+        email=item.get("email"),
+        dnd=item.get("dnd", False),
+        country=item.get("country"),
+        date_added=date_added,
+        date_updated=date_updated,
+        tags=item.get("tags", []),
+        custom_fields=item.get("customFields", []),
+        location_id=item.get("locationId"),
+        timestamp=date_added # Assuming timestamp maps to date_added for now
+    )
+
+
+def upsert_contacts(contact_data, generation, bulk_load=False):
+    """
+    Create or update one chunk of contacts and stamp them with the run ``generation``.
+
+    Uses ``INSERT ... ON CONFLICT (contact_id) DO UPDATE`` (see
+    ``bulk.upsert``); existing contacts are never loaded and unchanged ones
+    are not rewritten, only re-stamped. A contact stored with a later
+    ``date_updated`` is never overwritten by an older record.
+    ``bulk_load`` streams the chunk through ``COPY`` instead
+    (``bulk.copy_upsert``).
+
+    Returns:
+        Counter: ``created``, ``updated`` and ``skipped`` row counts.
+    """
+    contacts = []
     for item in contact_data:
-        contact_id = item.get("id")
-        if not contact_id: # Skip items without an ID
+        if not item.get("id"): # Skip items without an ID
             print(f"Skipping contact item with no ID: {item}")
             continue
 
-        date_added = parse_datetime(item.get("dateAdded")) if item.get("dateAdded") else None
-
-        # Create a new Contact instance (even for updates, as it simplifies setting all fields)
-        contact_obj = Contact(
-            contact_id=contact_id,
-            first_name=item.get("firstName"),
-            last_name=item.get("lastName"),
-            phone=item.get("phone"),
-            email=item.get("email"),
-            dnd=item.get("dnd", False),
-            country=item.get("country"),
-            date_added=date_added,
-            tags=item.get("tags", []),
-            custom_fields=item.get("customFields", []),
-            location_id=item.get("locationId"),
-            timestamp=date_added # Assuming timestamp maps to date_added for now
-        )
+        contact_obj = contact_from_api(item)
+        contact_obj.content_hash = content_fingerprint(contact_obj, CONTACT_CONTENT_FIELDS)
+        contact_obj.sync_generation = generation
+        contacts.append(contact_obj)
 
-        if contact_id in existing_db_contact_ids:
-            # Update existing contact. Append to update list.
-            # We fetch the existing object to update its fields directly,
-            # then add it to the bulk_update list.
-            # This is more efficient than .filter().update() if you also use bulk_create.
-            # For .bulk_update(), you need a list of actual model instances with their PKs.
-            existing_instance = existing_db_contacts_map[contact_id]
-            existing_instance.first_name = contact_obj.first_name
-            existing_instance.last_name = contact_obj.last_name
-            existing_instance.phone = contact_obj.phone
-            existing_instance.email = contact_obj.email
-            existing_instance.dnd = contact_obj.dnd
-            existing_instance.country = contact_obj.country
-            existing_instance.date_added = contact_obj.date_added
-            existing_instance.tags = contact_obj.tags
-            existing_instance.custom_fields = contact_obj.custom_fields
-            existing_instance.location_id = contact_obj.location_id
-            existing_instance.timestamp = contact_obj.timestamp # Update timestamp as well
-            contacts_to_update.append(existing_instance)
-        else:
-            # New contact
-            contacts_to_create.append(contact_obj)
-
-    # Identify contacts for deletion
-    # These are contacts in our DB (within the sync scope) but NOT in the incoming data
-    contacts_to_delete_ids = existing_db_contact_ids - incoming_contact_ids
-
-    # Perform operations within a single transaction
-    with transaction.atomic():
-        # 1. Create new contacts
-        if contacts_to_create:
-            Contact.objects.bulk_create(contacts_to_create, ignore_conflicts=True)
-            print(f"Created {len(contacts_to_create)} new contacts.")
-
-        # 2. Update existing contacts
-        if contacts_to_update:
-            # List of fields to update for existing contacts
-            update_fields = [
-                "first_name", "last_name", "phone", "email", "dnd", "country",
-                "date_added", "tags", "custom_fields", "location_id", "timestamp"
-            ]
-            Contact.objects.bulk_update(contacts_to_update, update_fields)
-            print(f"Updated {len(contacts_to_update)} existing contacts.")
-
-        # 3. Delete contacts not present in the incoming data (within the current location scope)
-        if contacts_to_delete_ids:
-            # IMPORTANT: Add a safeguard if current_location_id is None, to prevent mass deletion
-            if current_location_id:
-                deleted_count, _ = Contact.objects.filter(
-                    contact_id__in=contacts_to_delete_ids,
-                    location_id=current_location_id
-                ).delete()
-                print(f"Deleted {deleted_count} contacts not present in the incoming data for location {current_location_id}.")
-            else:
-                print("Skipped deletion of contacts due to unknown location_id for the sync scope.")
-                # If you're syncing ALL contacts, you might remove the current_location_id check
-                # and directly delete based on contacts_to_delete_ids
-                # For a full global sync:
-                # deleted_count, _ = Contact.objects.filter(contact_id__in=contacts_to_delete_ids).delete()
-                # print(f"Deleted {deleted_count} contacts not present in incoming data.")
-
-    # You might want to remove these specific prints and just have a final summary
-    # Or keep them for detailed logging.
-    # print(f"{len(contacts_to_create)} new contacts created.")
-    # print(f"{len(existing_ids)} existing contacts updated.") # This old print is no longer accurate
-    # Let's adjust the final prints:
-    print("Sync complete.")
+    if bulk_load:
+        report = bulk.copy_upsert(Contact, contacts, "contact_id", CONTACT_UPDATE_FIELDS, newer_field="date_updated")
+    else:
+        report = bulk.upsert(Contact, contacts, "contact_id", CONTACT_UPDATE_FIELDS, newer_field="date_updated")
+    print(f"Created {report['created']}, updated {report['updated']}, skipped {report['skipped']} unchanged contacts.")
+    return report
+
+
+def sweep_stale_contacts(location_id, generation):
+    """Delete contacts of a location that the sync run ``generation`` did not see"""
+    # Safeguard: never delete without a location scope
+    if not location_id:
+        print("Skipped deletion of contacts due to unknown location_id for the sync scope.")
+        return 0
+
+    deleted_count = bulk.sweep(Contact, generation, location_id=location_id)
+    print(f"Deleted {deleted_count} contacts not present in the incoming data for location {location_id}.")
+    return deleted_count
+
+
+def sync_contacts_to_db(contact_data):
+    """
+    Syncs contact data from API into the local Contact model using bulk upsert and deletion.
 
+    Args:
+        contact_data (list): List of contact dicts from GoHighLevel API
+
+    Raises:
+        SyncInProgress: if the location's contacts are already being synced.
+        SyncLeaseLost: if the lease was lost part-way; nothing is swept then.
+    """
+    # Get location_id from the first contact, assuming consistency for the entire batch
+    current_location_id = contact_data[0].get('locationId') if contact_data else None
 
+    if not current_location_id:
+        print("Warning: No location_id found in contact_data. Cannot perform accurate deletion scope.")
+
+    # Same lease as fetch_all_contacts, so the two never sweep each other's rows
+    with hold_sync_lease(current_location_id or '', CONTACT_SYNC_SCOPE) as lease:
+        run = start_sync_run(current_location_id or '', CONTACT_SYNC_SCOPE, full=True)
+        report = Counter(fetched=len(contact_data))
+        for chunk in iter_chunks([contact_data], getattr(settings, 'GHL_BULK_LOAD_CHUNK_SIZE', 5000)):
+            check_sync_lease(lease)
+            report.update(upsert_contacts(chunk, run.id, bulk_load=True))
+        check_sync_lease(lease)
+        report['deleted'] = sweep_stale_contacts(current_location_id, run.id)
+        finish_sync_run(run, report)
+
+    print(f"Contact sync report: {format_sync_report(report)}")
+    print("Sync complete.")
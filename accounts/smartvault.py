@@ -0,0 +1,383 @@
+# smartvault.py
+"""
+SmartVault access tokens and client creation, shared by the views and the
+Celery tasks.
+
+Callers get the OAuth access token from ``get_access_token()`` instead of
+reading SmartVaultToken themselves. The provider keeps the token in process
+memory for a short TTL, shares it between processes through the Django cache
+(Redis) and only reads the table on a cache miss. Tokens are refreshed in the
+background shortly before ``expires_at``, and synchronously (by a single
+caller) if one has already expired.
+"""
+import copy
+import logging
+import threading
+import time
+import xml.etree.ElementTree as ET
+from datetime import timedelta
+from typing import Any, Dict, List, Tuple
+
+import requests
+from decouple import config
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from accounts import http_client
+from accounts.models import SmartVaultToken
+
+logger = logging.getLogger(__name__)
+
+SMARTVAULT_TOKEN_BASE_URL = f"{http_client.SMARTVAULT_BASE_URL}/auto/auth"
+TOKEN_CACHE_KEY = "smartvault:token"
+TOKEN_REFRESH_LOCK_KEY = "smartvault:token:refreshing"
+TOKEN_REFRESH_SCHEDULED_KEY = "smartvault:token:refresh-scheduled"
+
+CREATE_CLIENT_ENDPOINT = "PUT /nodes/entity/SmartVault.Accounting.Firm/{account_id}/SmartVault.Accounting.FirmClient"
+
+# Fixed default structure for person client (matching API documentation)
+DEFAULT_PERSON_CLIENT = {
+    "entity": {
+        "meta_data": {
+            "entity_definition": "SmartVault.Accounting.Client"
+        },
+        "smart_vault": {
+            "accounting": {
+                "client": {
+                    "type_qualifier": "Individual",
+                    "persons": [
+                        {
+                            "names": [
+                                {
+                                    "FirstName": "John",
+                                    "MiddleName": "",
+                                    "LastName": "Doe"
+                                }
+                            ],
+                            "email_addresses": [{"address": "john.doe@example.com"}],
+                            "phone_numbers": [{"Number": "+1234567890"}]
+                        }
+                    ],
+                    "client_salutation_override": "Mr.",
+                    "end_of_fiscal_year": 12,
+                    "tags": [],
+                    "aliases": [],
+                    "client_id": "DEFAULT_PERSON_CLIENT"
+                }
+            }
+        }
+    }
+}
+
+REQUIRED_FIELDS = ['first_name', 'last_name']
+
+
+class SmartVaultTokenError(Exception):
+    """No usable SmartVault token (none stored, or the token endpoint failed)"""
+
+    def __init__(self, message, details=None):
+        super().__init__(message)
+        self.details = details
+
+
+def parse_token_response(text):
+    """Parse the XML returned by the SmartVault dtoken/rtoken endpoints"""
+    try:
+        message = ET.fromstring(text).find("message")
+        return {
+            "access_token": message.find("access_token").text,
+            "refresh_token": message.find("refresh_token").text,
+            "token_type": message.find("token_type").text,
+            "expires_in": int(message.find("expires_in").text),
+            "refresh_token_expires_in": int(message.find("refresh_token_expires_in").text),
+            "id": message.find("id").text,
+        }
+    except (ET.ParseError, AttributeError, TypeError, ValueError):
+        raise SmartVaultTokenError("Invalid SmartVault response", details=text)
+
+
+def save_token(data):
+    """Store freshly issued tokens and publish the access token to every process"""
+    token, created = SmartVaultToken.objects.update_or_create(
+        user_id=data["id"],
+        defaults={
+            "access_token": data["access_token"],
+            "refresh_token": data["refresh_token"],
+            "token_type": data["token_type"],
+            "expires_at": timezone.now() + timedelta(seconds=data["expires_in"]),
+            "refresh_expires_at": timezone.now() + timedelta(seconds=data["refresh_token_expires_in"]),
+        }
+    )
+    token_provider.publish(token)
+    return token
+
+
+def refresh_access_token():
+    """
+    Exchange the stored refresh token for a new token pair.
+
+    Raises:
+        SmartVaultTokenError: if no token is stored or SmartVault rejects the refresh.
+    """
+    token = SmartVaultToken.objects.order_by('-updated_at').first()
+    if not token:
+        raise SmartVaultTokenError("No SmartVault token found in DB.")
+
+    payload = {
+        "grant_type": "refresh_token",
+        "client_secret": config("SMARTVAULT_CLIENT_SECRET"),
+        "refresh_token": token.refresh_token,
+    }
+    response = http_client.post(f"{SMARTVAULT_TOKEN_BASE_URL}/rtoken/2", json=payload)
+    if response.status_code != 200:
+        raise SmartVaultTokenError("Failed to refresh tokens", details=response.text)
+
+    token = save_token(parse_token_response(response.text))
+    logger.info(f"Refreshed SmartVault token, valid until {token.expires_at.isoformat()}")
+    return token
+
+
+class SmartVaultTokenProvider:
+    """
+    Process-wide access token cache (memory, then Django cache, then DB).
+
+    ``ttl`` bounds how long a process trusts its in-memory copy, so a token
+    rotated elsewhere is picked up within that time. Once the token is within
+    ``refresh_ahead`` of ``expires_at`` one background refresh is queued; an
+    expired token is refreshed inline by whichever caller takes the lock while
+    the others wait for the new token to be published.
+    """
+
+    def __init__(self, ttl=None, refresh_ahead=None):
+        self.ttl = ttl or getattr(settings, 'SMARTVAULT_TOKEN_CACHE_TTL', 60)
+        self.refresh_ahead = refresh_ahead or getattr(settings, 'SMARTVAULT_TOKEN_REFRESH_AHEAD', timedelta(minutes=10))
+        self._lock = threading.Lock()
+        self._entry = None
+        self._entry_until = 0.0
+
+    def get_access_token(self):
+        """
+        Raises:
+            SmartVaultTokenError: if there is no stored token or it cannot be refreshed.
+        """
+        with self._lock:
+            if self._entry is not None and time.monotonic() < self._entry_until:
+                return self._entry['access_token']
+
+        entry = cache.get(TOKEN_CACHE_KEY)
+        if entry is None:
+            token = SmartVaultToken.objects.order_by('-updated_at').first()
+            if not token or not token.access_token:
+                raise SmartVaultTokenError("No SmartVault access token found")
+            entry = self.publish(token)
+
+        remaining = entry['expires_at'] - timezone.now()
+        if remaining <= timedelta(seconds=30):
+            entry = self._refresh_now()
+            remaining = entry['expires_at'] - timezone.now()
+        elif remaining <= self.refresh_ahead:
+            self._schedule_refresh()
+
+        with self._lock:
+            self._entry = entry
+            # Come back to the shared cache once the refresh window opens
+            until_refresh = max((remaining - self.refresh_ahead).total_seconds(), 1)
+            self._entry_until = time.monotonic() + min(self.ttl, until_refresh)
+        return entry['access_token']
+
+    def publish(self, token):
+        """Share ``token`` through the Django cache until it expires"""
+        entry = {'access_token': token.access_token, 'expires_at': token.expires_at}
+        timeout = max(int((token.expires_at - timezone.now()).total_seconds()), 1)
+        cache.set(TOKEN_CACHE_KEY, entry, timeout)
+        with self._lock:
+            self._entry = None
+        return entry
+
+    def invalidate(self):
+        """Forget the cached token (e.g. after SmartVault answered 401)"""
+        cache.delete(TOKEN_CACHE_KEY)
+        with self._lock:
+            self._entry = None
+
+    def _schedule_refresh(self):
+        # One queued refresh per window across all processes
+        if cache.add(TOKEN_REFRESH_SCHEDULED_KEY, 1, 60):
+            from accounts.tasks import refresh_smartvault_token
+            refresh_smartvault_token.delay()
+
+    def _refresh_now(self):
+        if cache.add(TOKEN_REFRESH_LOCK_KEY, 1, 30):
+            try:
+                token = refresh_access_token()
+                return {'access_token': token.access_token, 'expires_at': token.expires_at}
+            finally:
+                cache.delete(TOKEN_REFRESH_LOCK_KEY)
+
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            time.sleep(0.25)
+            entry = cache.get(TOKEN_CACHE_KEY)
+            if entry is not None and entry['expires_at'] - timezone.now() > timedelta(seconds=30):
+                return entry
+        raise SmartVaultTokenError("Timed out waiting for the SmartVault token refresh")
+
+
+token_provider = SmartVaultTokenProvider()
+
+
+def get_access_token():
+    """The current SmartVault OAuth access token (see SmartVaultTokenProvider)"""
+    return token_provider.get_access_token()
+
+
+class SmartVaultClientManager:
+    """SmartVault Client Management API"""
+
+    def __init__(self, base_url: str = http_client.SMARTVAULT_BASE_URL):
+        self.base_url = base_url
+
+    def create_person_client(self, oauth_token: str, account_id: str, client_data: Dict[str, Any],
+                             limiter=None, max_retries: int = None) -> Dict[str, Any]:
+        """
+        Create a SmartVault client as a person/individual
+
+        With a ``limiter`` (TokenBucket) the PUT waits for a token and is
+        retried on 429/5xx/connection errors up to ``max_retries`` times
+        (``http_client.request_with_retry``).
+
+        Raises:
+            requests.RequestException: if the PUT fails or returns an error status.
+        """
+        url = f"{self.base_url}/nodes/entity/SmartVault.Accounting.Firm/{account_id}/SmartVault.Accounting.FirmClient"
+
+        headers = {
+            "Content-Type": "application/json",
+            "Accept": "application/json",
+            "Authorization": f"Bearer {oauth_token}"
+        }
+
+        body = self._deep_merge(DEFAULT_PERSON_CLIENT, client_data)
+        client_id = body['entity']['smart_vault']['accounting']['client']['client_id']
+        logger.info(f"Creating SmartVault person client {client_id} in account {account_id}")
+
+        if limiter is not None:
+            response = http_client.request_with_retry(
+                "PUT", url, limiter=limiter, max_retries=max_retries, headers=headers, json=body,
+                endpoint=CREATE_CLIENT_ENDPOINT,
+            )
+        else:
+            response = http_client.put(url, headers=headers, json=body, endpoint=CREATE_CLIENT_ENDPOINT)
+        if response.status_code != 200:
+            logger.error(f"SmartVault returned {response.status_code} for client {client_id}: {response.text}")
+        response.raise_for_status()
+        return response.json()
+
+    def _deep_merge(self, default: Dict[str, Any], custom: Dict[str, Any]) -> Dict[str, Any]:
+        """Deep merge two dictionaries"""
+        result = copy.deepcopy(default)
+        for key, value in custom.items():
+            if key in result and isinstance(result[key], dict) and isinstance(value, dict):
+                result[key] = self._deep_merge(result[key], value)
+            else:
+                result[key] = value
+        return result
+
+
+def determine_salutation(first_name: str) -> str:
+    """Simple salutation determination based on common names"""
+    # This is a basic implementation - you might want to use a more sophisticated approach
+    common_male_names = ['john', 'james', 'robert', 'michael', 'william', 'david', 'richard', 'joseph', 'thomas', 'christopher']
+    common_female_names = ['mary', 'patricia', 'jennifer', 'linda', 'elizabeth', 'barbara', 'susan', 'jessica', 'sarah', 'karen']
+
+    name_lower = first_name.lower()
+
+    if name_lower in common_male_names:
+        return "Mr."
+    elif name_lower in common_female_names:
+        return "Ms."
+    else:
+        return "Mr."  # Default fallback
+
+
+def build_person_client(payload: Dict[str, Any]) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    Validate a webhook payload and build the SmartVault client body for it.
+
+    Expected payload: ``{"first_name", "last_name", "email"?, "phone"?}``
+
+    Returns:
+        tuple: ``(client_data, errors)``; ``client_data`` is None when
+        ``errors`` is not empty.
+    """
+    if not isinstance(payload, dict):
+        return None, ['Payload must be a JSON object']
+
+    missing_fields = [field for field in REQUIRED_FIELDS if not str(payload.get(field) or '').strip()]
+    if missing_fields:
+        return None, [f'Missing required fields: {", ".join(missing_fields)}']
+
+    first_name = str(payload.get('first_name') or '').strip()
+    last_name = str(payload.get('last_name') or '').strip()
+    email = str(payload.get('email') or '').strip()
+    phone = str(payload.get('phone') or '').strip()
+
+    client_id = f"{first_name}{last_name}"
+    if email:
+        client_id += str(len(email))
+
+    client_data = {
+        "entity": {
+            "smart_vault": {
+                "accounting": {
+                    "client": {
+                        "type_qualifier": "Individual",
+                        "persons": [
+                            {
+                                "names": [
+                                    {
+                                        "FirstName": first_name,
+                                        "MiddleName": "",
+                                        "LastName": last_name
+                                    }
+                                ],
+                                "email_addresses": [{"address": email}] if email else [],
+                                "phone_numbers": [{"Number": phone}] if phone else [],
+                            }
+                        ],
+                        "client_salutation_override": determine_salutation(first_name),
+                        "end_of_fiscal_year": 12,
+                        "tags": [
+                            {"value": "Individual"},
+                            {"value": "Webhook Created"}
+                        ],
+                        "aliases": [],
+                        "client_id": client_id
+                    }
+                }
+            }
+        }
+    }
+    return client_data, []
+
+
+def client_summary(client_data: Dict[str, Any]) -> Dict[str, Any]:
+    """The client_id/name/email/phone of a built client body, as returned to callers"""
+    client = client_data['entity']['smart_vault']['accounting']['client']
+    person = client['persons'][0]
+    name = person['names'][0]
+    return {
+        'client_id': client['client_id'],
+        'name': f"{name['FirstName']} {name['LastName']}",
+        'email': person['email_addresses'][0]['address'] if person['email_addresses'] else None,
+        'phone': person['phone_numbers'][0]['Number'] if person['phone_numbers'] else None,
+    }
+
+
+def is_retryable(error: requests.RequestException) -> bool:
+    """Connection problems, timeouts, 429s and 5xx responses are worth retrying"""
+    response = getattr(error, 'response', None)
+    if response is None:
+        return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+    return response.status_code in http_client.RETRY_STATUSES
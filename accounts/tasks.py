@@ -1,107 +1,240 @@
 
+from collections import Counter
+
 import requests
-from celery import shared_task
-from accounts.models import GHLAuthCredentials,SmartVaultToken
-from decouple import config
-from accounts.services import fetch_all_contacts, sync_opportunities
+from celery import chord, shared_task
+from django.conf import settings
+from accounts.models import GHLAuthCredentials,Webhook,SmartVaultClientJob
+from accounts.services import (
+    SYNC_LEASE_KEY, GHLOpportunityFetcher, SyncInProgress, SyncLeaseLost, fetch_all_contacts,
+)
+from accounts import http_client
+from accounts.ghl_tokens import token_manager
+from accounts.locks import Lease
+from accounts.ratelimit import get_smartvault_limiter
+from accounts.smartvault import (
+    SmartVaultClientManager, SmartVaultTokenError, get_access_token, is_retryable, refresh_access_token, token_provider,
+)
+from accounts.dashboard import bump_dashboard_version, warm_dashboard_cache
 
-import xml.etree.ElementTree as ET
 from django.utils import timezone
-from datetime import timedelta
-
-
-SMARTVAULT_BASE_URL = "https://rest.smartvault.com/auto/auth"
 
 @shared_task
 def make_api_call():
-    credentials = GHLAuthCredentials.objects.first()
-    
-    print("credentials tokenL", credentials)
-    refresh_token = credentials.refresh_token
-
-    
-    response = requests.post('https://services.leadconnectorhq.com/oauth/token', data={
-        'grant_type': 'refresh_token',
-        'client_id': config("GHL_CLIENT_ID"),
-        'client_secret': config("GHL_CLIENT_SECRET"),
-        'refresh_token': refresh_token
-    })
-    
-    new_tokens = response.json()
-
-    print("new tokens: ", new_tokens)
-
-    obj, created = GHLAuthCredentials.objects.update_or_create(
-            location_id= new_tokens.get("locationId"),
-            defaults={
-                "access_token": new_tokens.get("access_token"),
-                "refresh_token": new_tokens.get("refresh_token"),
-                "expires_in": new_tokens.get("expires_in"),
-                "scope": new_tokens.get("scope"),
-                "user_type": new_tokens.get("userType"),
-                "company_id": new_tokens.get("companyId"),
-                "user_id":new_tokens.get("userId"),
-
-            }
-        )
-    
+    """
+    Refresh the GHL tokens of every location that is within GHL_TOKEN_REFRESH_AHEAD
+    of its expiry (updated_at + expires_in). Tokens that are not due are left alone,
+    so the task can run often; requests also refresh on demand.
+    """
+    refreshed = token_manager.refresh_due()
+    print(f"Refreshed GHL tokens for locations: {refreshed}")
+    return refreshed
+
 
 @shared_task
 def contact_and_opportunity_sync_task():
-    fetch_all_contacts()
-    sync_opportunities()
+    """
+    Sync every connected location: one ``sync_location`` job per stored
+    GHLAuthCredentials location, run in parallel across the workers, with
+    ``summarize_location_syncs`` collecting their results.
+    """
+    location_ids = list(
+        GHLAuthCredentials.objects.exclude(location_id__isnull=True).exclude(location_id='')
+        .order_by('location_id').values_list('location_id', flat=True).distinct()
+    )
+    if not location_ids:
+        print("No GHL locations to sync")
+        return {"locations": 0}
 
+    print(f"Queueing sync for {len(location_ids)} locations")
+    result = chord(sync_location.s(location_id) for location_id in location_ids)(summarize_location_syncs.s())
+    return {"locations": len(location_ids), "summary_task_id": result.id}
 
-@shared_task
-def refresh_smartvault_token():
+
+def _workflow_lease(location_id, token=None):
     """
-    Background task to refresh SmartVault tokens and save to DB.
+    Lease of a whole location sync. Its TTL is long enough to outlast the
+    pieces' queue waits and retry countdowns, since nothing renews it then.
     """
-    token = SmartVaultToken.objects.first()
-    if not token:
-        return {"error": "No SmartVault token found in DB."}
-
-    payload = {
-        "grant_type": "refresh_token",
-        "client_secret": config("SMARTVAULT_CLIENT_SECRET"),
-        "refresh_token": token.refresh_token,
-    }
+    return Lease(
+        SYNC_LEASE_KEY.format(location_id=location_id, sync_type="workflow"),
+        ttl=getattr(settings, "GHL_SYNC_WORKFLOW_LEASE_TTL", 60 * 60),
+        token=token,
+    )
 
-    response = requests.post(f"{SMARTVAULT_BASE_URL}/rtoken/2", json=payload)
 
-    if response.status_code != 200:
-        return {
-            "error": "Failed to refresh tokens",
-            "details": response.text
-        }
+@shared_task(bind=True)
+def sync_location(self, location_id):
+    """
+    Sync the contacts and opportunities of one location as a workflow.
 
-    # Parse XML response
-    root = ET.fromstring(response.text)
-    message = root.find("message")
+    The task replaces itself with a chord of ``sync_location_contacts`` and
+    one ``sync_location_pipeline`` per pipeline, so the pieces run on any free
+    worker and are retried on their own; ``finish_location_sync`` collects
+    them and refreshes the dashboard cache.
 
-    if message is None:
-        return {"error": "Invalid SmartVault response", "details": response.text}
+    The workflow holds the location's ``workflow`` lease, identified by this
+    task's ID, from here until the callback releases it. Every piece renews it
+    when it starts, while it runs and when it ends (also before a retry), so it
+    only expires if the workflow stalls for ``GHL_SYNC_WORKFLOW_LEASE_TTL``.
+    A trigger that finds the lease held is skipped and returns the ID of the
+    running sync instead of duplicating it. Errors are returned
+    rather than raised so one failing location does not fail the whole fan-out.
+    """
+    lease = _workflow_lease(location_id, token=self.request.id)
+    if not lease.acquire():
+        running = lease.holder()
+        print(f"Sync for location {location_id} is already running ({running}), skipping")
+        return {"location_id": location_id, "status": "skipped", "running": running}
 
-    data = {
-        "access_token": message.find("access_token").text,
-        "refresh_token": message.find("refresh_token").text,
-        "token_type": message.find("token_type").text,
-        "expires_in": int(message.find("expires_in").text),
-        "refresh_token_expires_in": int(message.find("refresh_token_expires_in").text),
-        "id": message.find("id").text,
-    }
+    try:
+        fetcher = GHLOpportunityFetcher(token_manager.get_access_token(location_id), location_id)
+        if not fetcher.fetch_pipeline_data():
+            raise RuntimeError("Failed to fetch pipeline data")
+        pipelines = fetcher.pipelines
+    except Exception as e:
+        lease.release()
+        print(f"Sync for location {location_id} failed: {e}")
+        return {"location_id": location_id, "status": "failed", "error": str(e)}
 
-    # Save/Update in DB
-    token, created = SmartVaultToken.objects.update_or_create(
-        user_id=data["id"],
-        defaults={
-            "access_token": data["access_token"],
-            "refresh_token": data["refresh_token"],
-            "token_type": data["token_type"],
-            "expires_at": timezone.now() + timedelta(seconds=data["expires_in"]),
-            "refresh_expires_at": timezone.now() + timedelta(seconds=data["refresh_token_expires_in"]),
-        }
+    print(f"Syncing location {location_id}: contacts and {len(pipelines)} pipelines")
+    workflow = chord(
+        [sync_location_contacts.s(location_id, lease.token)]
+        + [sync_location_pipeline.s(location_id, name, pipeline_id, lease.token) for pipeline_id, name in pipelines.items()],
+        finish_location_sync.s(location_id, lease.token),
     )
+    raise self.replace(workflow)
+
+
+def _sync_part(task, location_id, part, sync, workflow_token=None):
+    """
+    Run one piece of a location sync. ``sync`` takes the lease of its scope
+    (``services.hold_sync_lease``), so the same rows are never written by two
+    syncs at once; a piece whose lease is held elsewhere, or lost while it
+    runs, is skipped. The workflow lease of the sync the piece belongs to is
+    renewed at the start, by the heartbeat and at the end.
+
+    Failures are retried with an exponential countdown up to
+    ``GHL_SYNC_TASK_MAX_RETRIES`` times. The final failure is returned so the
+    chord callback still runs.
+
+    The result carries the GoHighLevel latency stats of the piece. They are
+    process-wide, so they are reset first (prefork workers run one task at a
+    time).
+    """
+    workflow_lease = _workflow_lease(location_id, token=workflow_token) if workflow_token else None
+    if workflow_lease:
+        workflow_lease.renew()
+        workflow_lease.start_heartbeat()
+    http_client.reset_latency_stats()
+    try:
+        report = sync()
+    except (SyncInProgress, SyncLeaseLost) as e:
+        # Another worker is syncing the piece; retrying would only skip
+        print(f"Sync of {part} for location {location_id} skipped: {e}")
+        return {"part": part, "status": "skipped", "latency": http_client.get_latency_stats()}
+    except Exception as e:
+        max_retries = getattr(settings, "GHL_SYNC_TASK_MAX_RETRIES", 3)
+        if task.request.retries < max_retries:
+            raise task.retry(exc=e, countdown=30 * 2 ** task.request.retries, max_retries=max_retries)
+        print(f"Sync of {part} failed after {task.request.retries} retries: {e}")
+        return {"part": part, "status": "failed", "error": str(e), "latency": http_client.get_latency_stats()}
+    finally:
+        if workflow_lease:
+            workflow_lease.stop_heartbeat()
+            # Covers the wait for the remaining pieces, the callback and a retry countdown
+            workflow_lease.renew()
+    return {"part": part, "status": "succeeded", "report": dict(report), "latency": http_client.get_latency_stats()}
+
+
+@shared_task(bind=True)
+def sync_location_contacts(self, location_id, workflow_token=None):
+    return _sync_part(self, location_id, "contacts", lambda: fetch_all_contacts(location_id=location_id), workflow_token)
+
+
+@shared_task(bind=True)
+def sync_location_pipeline(self, location_id, pipeline_name, pipeline_id, workflow_token=None):
+    def sync():
+        # The token is read per attempt, so a retry picks up a refreshed one
+        fetcher = GHLOpportunityFetcher(token_manager.get_access_token(location_id), location_id)
+        if not fetcher.fetch_pipeline_data():
+            raise RuntimeError("Failed to fetch pipeline data")
+        return fetcher.sync_pipeline(pipeline_name, pipeline_id)
+
+    return _sync_part(self, location_id, f"pipeline {pipeline_name}", sync, workflow_token)
+
+
+@shared_task
+def finish_location_sync(results, location_id, workflow_token):
+    """Chord callback of ``sync_location``: combine the pieces, refresh the dashboard cache, release the lease"""
+    try:
+        report = Counter()
+        errors = {}
+        for result in results:
+            report.update(result.get("report", {}))
+            if result["status"] == "failed":
+                errors[result["part"]] = result["error"]
+        latency = http_client.merge_latency_stats(result.get("latency", {}) for result in results)
+        print(f"GoHighLevel latency for location {location_id}: {http_client.format_latency_stats(latency)}")
+
+        # Everything the pieces wrote is committed; drop the cached dashboard and rebuild its default views
+        bump_dashboard_version(location_id)
+        warm_dashboard_cache(location_id)
+    finally:
+        _workflow_lease(location_id, token=workflow_token).release()
+
+    if errors:
+        return {"location_id": location_id, "status": "failed", "error": "; ".join(f"{part}: {error}" for part, error in errors.items()), "report": dict(report), "latency": latency}
+    return {"location_id": location_id, "status": "succeeded", "report": dict(report), "latency": latency}
+
+
+@shared_task
+def summarize_location_syncs(results):
+    """Aggregate the ``sync_location`` results of one fan-out"""
+    summary = {"locations": len(results), "succeeded": 0, "skipped": 0, "failed": 0, "errors": {}}
+    report = Counter()
+    for result in results:
+        summary[result["status"]] += 1
+        report.update(result.get("report", {}))
+        if result["status"] == "failed":
+            summary["errors"][result["location_id"]] = result["error"]
+    summary["report"] = dict(report)
+    summary["latency"] = http_client.merge_latency_stats(result.get("latency", {}) for result in results)
+    print(f"Location sync summary: {summary}")
+    return summary
+
+
+@shared_task
+def process_ghl_webhook(webhook_id):
+    """Apply a stored GoHighLevel webhook event to Contact/Opportunity"""
+    from accounts.webhooks import apply_webhook
+
+    webhook = Webhook.objects.filter(id=webhook_id, processed_at__isnull=True).first()
+    if webhook is None:
+        return {"webhook_id": webhook_id, "outcome": "missing or already processed"}
+    return {"webhook_id": webhook_id, "outcome": apply_webhook(webhook)}
+
+
+@shared_task
+def prune_webhook_tombstones():
+    """Drop the webhook delete tombstones older than ``GHL_WEBHOOK_TOMBSTONE_TTL``"""
+    from accounts.webhooks import prune_tombstones
+
+    return {"pruned": prune_tombstones()}
+
+
+@shared_task
+def refresh_smartvault_token():
+    """
+    Background task to refresh SmartVault tokens and save to DB.
+
+    Runs on the beat schedule and is also queued by the token provider
+    shortly before the access token expires.
+    """
+    try:
+        token = refresh_access_token()
+    except SmartVaultTokenError as e:
+        return {"error": str(e), "details": e.details}
 
     return {
         "user_id": token.user_id,
@@ -111,3 +244,60 @@ def refresh_smartvault_token():
         "expires_at": str(token.expires_at),
         "refresh_expires_at": str(token.refresh_expires_at),
     }
+
+
+def _finish_client_job(job, status, response=None, error=''):
+    job.status = status
+    job.response = response
+    job.error = error
+    job.finished_at = timezone.now()
+    job.save(update_fields=["status", "response", "error", "finished_at", "updated_at"])
+
+
+@shared_task(bind=True)
+def create_smartvault_client(self, job_id):
+    """
+    Create the SmartVault client of a queued SmartVaultClientJob.
+
+    Transient failures (connection errors, 429/5xx) are retried with an
+    exponential countdown up to ``SMARTVAULT_CLIENT_MAX_RETRIES`` times; the
+    final outcome is stored on the job for the status endpoint.
+    """
+    job = SmartVaultClientJob.objects.filter(id=job_id).first()
+    if job is None or job.status in (SmartVaultClientJob.SUCCEEDED, SmartVaultClientJob.FAILED):
+        return {"job_id": job_id, "status": job.status if job else "missing"}
+
+    try:
+        access_token = get_access_token()
+    except SmartVaultTokenError as e:
+        _finish_client_job(job, SmartVaultClientJob.FAILED, error=str(e))
+        return {"job_id": job_id, "status": job.status}
+
+    job.status = SmartVaultClientJob.RUNNING
+    job.attempts += 1
+    job.save(update_fields=["status", "attempts", "updated_at"])
+
+    try:
+        # Every job draws on the shared SmartVault bucket; retries are left to Celery
+        response = SmartVaultClientManager().create_person_client(
+            access_token, job.account_id, job.client_data, limiter=get_smartvault_limiter(), max_retries=0,
+        )
+    except requests.RequestException as e:
+        max_retries = getattr(settings, "SMARTVAULT_CLIENT_MAX_RETRIES", 3)
+        unauthorized = getattr(e.response, "status_code", None) == 401
+        if unauthorized:
+            # Rotated or revoked token; the retry reloads it from the DB
+            token_provider.invalidate()
+        if (unauthorized or is_retryable(e)) and self.request.retries < max_retries:
+            job.status = SmartVaultClientJob.QUEUED
+            job.error = str(e)
+            job.save(update_fields=["status", "error", "updated_at"])
+            raise self.retry(exc=e, countdown=10 * 2 ** self.request.retries, max_retries=max_retries)
+        _finish_client_job(job, SmartVaultClientJob.FAILED, error=str(e))
+        return {"job_id": job_id, "status": job.status}
+    except Exception as e:
+        _finish_client_job(job, SmartVaultClientJob.FAILED, error=str(e))
+        raise
+
+    _finish_client_job(job, SmartVaultClientJob.SUCCEEDED, response=response)
+    return {"job_id": job_id, "status": job.status}
@@ -3,6 +3,34 @@ from django.test import TestCase
 # Create your tests here.
 import requests
 import json
+import base64
+import datetime
+import threading
+from unittest import mock
+
+import fakeredis
+import redis
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.auth.models import AnonymousUser
+from django.db import models
+from django.http import JsonResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.utils import timezone
+
+from accounts import http_client
+from accounts.bulk import _array_literal, _cast_type, _clip_to_max_length, _copy_text
+from accounts.dashboard import QueryError, decode_cursor, encode_cursor
+from accounts.directory import UserDirectory
+from accounts.ghl_tokens import REFRESH_LOCK_KEY, GHLTokenError, GHLTokenManager
+from accounts.models import Contact, GHLAuthCredentials, Opportunity
+from accounts.ratelimit import TokenBucket
+from accounts.services import PaginationAborted, content_fingerprint, iter_resumable_chunks
+from accounts.smartvault import build_person_client, client_summary
+from accounts.views import _parse_batch_body, dashboard_auth_required, smartvault_batch_create, smartvault_job_status
+from accounts.webhooks import _public_key, verify_signature
+
 
 def test_webhook():
     """Test the webhook endpoint"""
@@ -38,5 +66,488 @@ def test_webhook():
     except Exception as e:
         print(f"Error testing webhook: {e}")
 
+
+class CopyTextTests(SimpleTestCase):
+    def test_escapes_copy_control_characters(self):
+        value = 'tab\there\nnewline\rreturn back\\slash'
+        self.assertEqual(
+            _copy_text(models.CharField(), value),
+            'tab\\there\\nnewline\\rreturn back\\\\slash',
+        )
+
+    def test_none_is_null_marker(self):
+        self.assertEqual(_copy_text(models.CharField(), None), '\\N')
+
+    def test_scalars(self):
+        self.assertEqual(_copy_text(models.BooleanField(), True), 't')
+        self.assertEqual(_copy_text(models.BooleanField(), False), 'f')
+        moment = datetime.datetime(2026, 1, 2, 3, 4, 5, tzinfo=datetime.timezone.utc)
+        self.assertEqual(_copy_text(models.DateTimeField(), moment), '2026-01-02T03:04:05+00:00')
+
+    def test_json_is_dumped_then_escaped(self):
+        # json.dumps writes the tab as \t; COPY needs that backslash doubled
+        self.assertEqual(_copy_text(models.JSONField(), {'a': 'x\ty'}), '{"a": "x\\\\ty"}')
+
+    def test_array_is_literal_then_escaped(self):
+        field = ArrayField(models.CharField(max_length=10))
+        self.assertEqual(_copy_text(field, ['a\tb', 'c"d']), '{"a\\tb","c\\\\"d"}')
+
+
+class ArrayLiteralTests(SimpleTestCase):
+    def test_quotes_and_escapes_items(self):
+        self.assertEqual(
+            _array_literal(['plain', 'say "hi"', 'back\\slash', 'comma,brace}']),
+            '{"plain","say \\"hi\\"","back\\\\slash","comma,brace}"}',
+        )
+
+    def test_none_items_are_null(self):
+        self.assertEqual(_array_literal(['a', None]), '{"a",NULL}')
+        self.assertEqual(_array_literal([]), '{}')
+
+
+@override_settings(DASHBOARD_API_KEYS=['key-1', 'key-2'])
+class DashboardAuthRequiredTests(SimpleTestCase):
+    view = staticmethod(dashboard_auth_required(lambda request: JsonResponse({'ok': True})))
+
+    def get(self, user=None, **headers):
+        request = RequestFactory().get('/accounts/dashboard/opportunities/', **headers)
+        request.user = user or AnonymousUser()
+        return self.view(request)
+
+    def test_rejects_anonymous_requests(self):
+        self.assertEqual(self.get().status_code, 401)
+        self.assertEqual(self.get(HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+        self.assertEqual(self.get(HTTP_AUTHORIZATION='key-1').status_code, 401)
+        self.assertEqual(self.get(HTTP_X_API_KEY='').status_code, 401)
+
+    def test_accepts_api_keys(self):
+        self.assertEqual(self.get(HTTP_AUTHORIZATION='Bearer key-2').status_code, 200)
+        self.assertEqual(self.get(HTTP_X_API_KEY='key-1').status_code, 200)
+
+    def test_accepts_logged_in_users(self):
+        self.assertEqual(self.get(user=mock.Mock(is_authenticated=True)).status_code, 200)
+
+
+class ContentFingerprintTests(SimpleTestCase):
+    fields = ['first_name', 'email', 'tags']
+
+    def contact(self, **kwargs):
+        values = {'contact_id': 'c1', 'first_name': 'Ann', 'email': 'ann@example.com', 'tags': ['a']}
+        values.update(kwargs)
+        return Contact(**values)
+
+    def test_stable_for_equal_content(self):
+        fingerprint = content_fingerprint(self.contact(), self.fields)
+        self.assertEqual(fingerprint, content_fingerprint(self.contact(), self.fields))
+        self.assertRegex(fingerprint, r'^[0-9a-f]{40}$')
+
+    def test_changes_with_a_listed_field(self):
+        self.assertNotEqual(
+            content_fingerprint(self.contact(), self.fields),
+            content_fingerprint(self.contact(tags=['a', 'b']), self.fields),
+        )
+
+    def test_ignores_fields_not_listed(self):
+        self.assertEqual(
+            content_fingerprint(self.contact(), self.fields),
+            content_fingerprint(self.contact(contact_id='c2', sync_generation=7), self.fields),
+        )
+
+
+class CursorTests(SimpleTestCase):
+    def test_round_trip(self):
+        updated_at = datetime.datetime(2026, 5, 6, 7, 8, 9, 123456, tzinfo=datetime.timezone.utc)
+        self.assertEqual(decode_cursor(encode_cursor(updated_at, 'opp-1')), (updated_at, 'opp-1'))
+
+    def test_invalid_cursors(self):
+        def encoded(value):
+            return base64.urlsafe_b64encode(json.dumps(value).encode()).decode()
+
+        for cursor in ['not base64 json', '', encoded(['not a date', 'x']), encoded(['2026-01-01T00:00:00+00:00'])]:
+            with self.subTest(cursor=cursor), self.assertRaises(QueryError):
+                decode_cursor(cursor)
+
+
+class IterResumableChunksTests(SimpleTestCase):
+    pages = [(['a', 'b', 'c'], 'after-1'), (['d', 'e'], 'after-2')]
+
+    def test_chunk_ending_mid_page_resumes_at_that_page(self):
+        self.assertEqual(list(iter_resumable_chunks(self.pages, 2, 'start')), [
+            (['a', 'b'], 'start'),
+            (['c', 'd'], 'after-1'),
+            (['e'], 'after-2'),
+        ])
+
+    def test_chunk_ending_on_page_boundary_resumes_after_it(self):
+        self.assertEqual(list(iter_resumable_chunks(self.pages, 3)), [
+            (['a', 'b', 'c'], 'after-1'),
+            (['d', 'e'], 'after-2'),
+        ])
+
+    def test_partial_chunk_is_yielded_before_the_error(self):
+        def pages():
+            yield ['a', 'b', 'c'], 'after-1'
+            raise PaginationAborted('page 2 failed')
+
+        chunks = iter_resumable_chunks(pages(), 2, 'start')
+        self.assertEqual(next(chunks), (['a', 'b'], 'start'))
+        self.assertEqual(next(chunks), (['c'], 'after-1'))
+        with self.assertRaises(PaginationAborted):
+            next(chunks)
+
+
+
+class Slept(Exception):
+    """Raised by a patched time.sleep to stop a blocking loop"""
+
+
+def fake_response(status_code, headers=None):
+    return mock.Mock(status_code=status_code, headers=headers or {})
+
+
+class TokenBucketTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch('accounts.ratelimit.get_redis', return_value=fakeredis.FakeRedis())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_burst_then_waits_for_refill(self):
+        bucket = TokenBucket('ratelimit:test', rate=2, capacity=3)
+        with mock.patch('accounts.ratelimit.time.sleep', side_effect=Slept) as sleep:
+            for _ in range(3):
+                bucket.acquire()
+            sleep.assert_not_called()
+            with self.assertRaises(Slept):
+                bucket.acquire()
+        wait = sleep.call_args[0][0]
+        self.assertGreater(wait, 0)
+        self.assertLessEqual(wait, 0.5)
+
+    def test_observe_adopts_headers_and_caps_tokens(self):
+        bucket = TokenBucket('ratelimit:test', rate=100, capacity=100)
+        bucket.acquire()
+        bucket.observe(fake_response(200, {
+            'X-RateLimit-Max': '10',
+            'X-RateLimit-Interval-Milliseconds': '1000',
+            'X-RateLimit-Remaining': '0',
+        }))
+        with mock.patch('accounts.ratelimit.time.sleep', side_effect=Slept) as sleep, self.assertRaises(Slept):
+            bucket.acquire()
+        # One token at the reported 10/s, not the configured 100/s
+        self.assertGreater(sleep.call_args[0][0], 0.05)
+
+    def test_fails_open_without_redis(self):
+        client = mock.Mock()
+        client.eval.side_effect = redis.ConnectionError('down')
+        with mock.patch('accounts.ratelimit.get_redis', return_value=client), self.assertLogs('accounts.ratelimit', 'WARNING'):
+            bucket = TokenBucket('ratelimit:test', rate=1, capacity=1)
+            bucket.acquire()
+            bucket.observe(fake_response(200, {'X-RateLimit-Remaining': '5'}))
+
+
+@mock.patch('accounts.http_client.time.sleep')
+class RequestWithRetryTests(SimpleTestCase):
+    def test_retries_retryable_statuses_then_returns(self, sleep):
+        responses = [fake_response(503), fake_response(429, {'Retry-After': '2'}), fake_response(200)]
+        with mock.patch('accounts.http_client.request', side_effect=responses) as request, self.assertLogs('accounts.http_client', 'WARNING'):
+            response = http_client.request_with_retry('GET', 'https://example.com/x')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(request.call_count, 3)
+        self.assertLessEqual(sleep.call_args_list[0][0][0], http_client.BACKOFF_BASE)
+        self.assertEqual(sleep.call_args_list[1][0][0], 2.0)
+
+    def test_returns_last_response_when_retries_run_out(self, sleep):
+        with mock.patch('accounts.http_client.request', return_value=fake_response(502)) as request, self.assertLogs('accounts.http_client', 'WARNING'):
+            response = http_client.request_with_retry('GET', 'https://example.com/x', max_retries=2)
+        self.assertEqual(response.status_code, 502)
+        self.assertEqual(request.call_count, 3)
+        self.assertEqual(sleep.call_count, 2)
+
+    def test_client_errors_are_not_retried(self, sleep):
+        with mock.patch('accounts.http_client.request', return_value=fake_response(404)) as request:
+            self.assertEqual(http_client.request_with_retry('GET', 'https://example.com/x').status_code, 404)
+        request.assert_called_once()
+        sleep.assert_not_called()
+
+    def test_connection_errors_are_retried_then_raised(self, sleep):
+        error = requests.exceptions.ConnectionError('reset')
+        with mock.patch('accounts.http_client.request', side_effect=error) as request, self.assertLogs('accounts.http_client', 'WARNING'):
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                http_client.request_with_retry('GET', 'https://example.com/x', max_retries=1)
+        self.assertEqual(request.call_count, 2)
+
+    def test_limiter_is_taken_and_fed_every_attempt(self, sleep):
+        limiter = mock.Mock()
+        responses = [fake_response(500), fake_response(200)]
+        with mock.patch('accounts.http_client.request', side_effect=responses), self.assertLogs('accounts.http_client', 'WARNING'):
+            http_client.request_with_retry('GET', 'https://example.com/x', limiter=limiter)
+        self.assertEqual(limiter.acquire.call_count, 2)
+        self.assertEqual([c[0][0] for c in limiter.observe.call_args_list], responses)
+
+    def test_backoff_is_capped(self, sleep):
+        for attempt in range(20):
+            self.assertLessEqual(http_client.backoff_delay(attempt), http_client.BACKOFF_CAP)
+        self.assertEqual(http_client._retry_after(fake_response(429, {'Retry-After': '600'})), http_client.BACKOFF_CAP)
+
+
+
+class VerifySignatureTests(SimpleTestCase):
+    body = b'{"type": "OpportunityUpdate", "id": "opp-1"}'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        cls.public_pem = cls.private_key.public_key().public_bytes(
+            serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo,
+        ).decode()
+
+    def setUp(self):
+        _public_key.cache_clear()
+        self.addCleanup(_public_key.cache_clear)
+        override = override_settings(GHL_WEBHOOK_PUBLIC_KEY=self.public_pem)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def sign(self, body):
+        return base64.b64encode(self.private_key.sign(body, padding.PKCS1v15(), hashes.SHA256())).decode()
+
+    def test_accepts_a_valid_signature(self):
+        self.assertTrue(verify_signature(self.body, self.sign(self.body)))
+
+    def test_rejects_a_modified_body(self):
+        self.assertFalse(verify_signature(self.body + b' ', self.sign(self.body)))
+
+    def test_rejects_missing_or_malformed_signatures(self):
+        self.assertFalse(verify_signature(self.body, None))
+        self.assertFalse(verify_signature(self.body, ''))
+        self.assertFalse(verify_signature(self.body, 'not base64!'))
+        self.assertFalse(verify_signature(self.body, base64.b64encode(b'short').decode()))
+
+    def test_rejects_everything_without_a_public_key(self):
+        with override_settings(GHL_WEBHOOK_PUBLIC_KEY=''), self.assertLogs('accounts.webhooks', 'ERROR'):
+            self.assertFalse(verify_signature(self.body, self.sign(self.body)))
+
+
+
+class BuildPersonClientTests(SimpleTestCase):
+    def test_builds_the_client_body(self):
+        client_data, errors = build_person_client({
+            'first_name': ' Sarah ', 'last_name': 'Johnson', 'email': 'sarah@example.com', 'phone': '+15550100',
+        })
+        self.assertEqual(errors, [])
+        client = client_data['entity']['smart_vault']['accounting']['client']
+        self.assertEqual(client['persons'][0]['names'][0]['FirstName'], 'Sarah')
+        self.assertEqual(client['client_salutation_override'], 'Ms.')
+        self.assertEqual(client_summary(client_data), {
+            'client_id': 'SarahJohnson17',
+            'name': 'Sarah Johnson',
+            'email': 'sarah@example.com',
+            'phone': '+15550100',
+        })
+
+    def test_optional_contact_details(self):
+        client_data, errors = build_person_client({'first_name': 'Ann', 'last_name': 'Lee'})
+        self.assertEqual(errors, [])
+        person = client_data['entity']['smart_vault']['accounting']['client']['persons'][0]
+        self.assertEqual((person['email_addresses'], person['phone_numbers']), ([], []))
+        self.assertEqual(client_summary(client_data)['client_id'], 'AnnLee')
+
+    def test_invalid_payloads(self):
+        self.assertEqual(build_person_client(['not', 'a', 'dict']), (None, ['Payload must be a JSON object']))
+        self.assertEqual(
+            build_person_client({'first_name': '  ', 'email': 'x@example.com'}),
+            (None, ['Missing required fields: first_name, last_name']),
+        )
+
+
+
+class SmartVaultJobStatusTests(SimpleTestCase):
+    def test_requires_authentication(self):
+        request = RequestFactory().get('/accounts/smartvault/jobs/00000000-0000-0000-0000-000000000000/')
+        request.user = AnonymousUser()
+        with mock.patch('accounts.views.SmartVaultClientJob.objects') as jobs:
+            response = smartvault_job_status(request, job_id='00000000-0000-0000-0000-000000000000')
+        self.assertEqual(response.status_code, 401)
+        jobs.filter.assert_not_called()
+
+
+class SmartVaultBatchBodyTests(SimpleTestCase):
+    def post(self, body, content_type='application/json'):
+        return RequestFactory().post('/accounts/smartvault/clients/batch/', data=body, content_type=content_type)
+
+    def test_json_array_and_clients_object(self):
+        clients = [{'first_name': 'Ann', 'last_name': 'Lee'}, {'first_name': 'Bo'}]
+        self.assertEqual(_parse_batch_body(self.post(json.dumps(clients))), clients)
+        self.assertEqual(_parse_batch_body(self.post(json.dumps({'clients': clients}))), clients)
+
+    def test_ndjson_skips_blank_lines_and_keeps_bad_lines(self):
+        body = '{"first_name": "Ann", "last_name": "Lee"}\n\n  \nnot json\n'
+        self.assertEqual(
+            _parse_batch_body(self.post(body, 'application/x-ndjson')),
+            [{'first_name': 'Ann', 'last_name': 'Lee'}, 'not json'],
+        )
+
+    def test_rejects_bodies_without_a_list(self):
+        for body in ['{"first_name": "Ann"}', '"clients"', '{not json']:
+            with self.subTest(body=body), self.assertRaises(ValueError):
+                _parse_batch_body(self.post(body))
+
+    def test_view_reports_bad_and_oversized_batches(self):
+        self.assertEqual(smartvault_batch_create(self.post('{not json')).status_code, 400)
+        with override_settings(SMARTVAULT_BATCH_MAX_ITEMS=1):
+            self.assertEqual(smartvault_batch_create(self.post('[{}, {}]')).status_code, 413)
+
+    def test_view_reports_invalid_items_by_index(self):
+        response = smartvault_batch_create(self.post('{"first_name": "Ann"}\nnot json\n', 'application/x-ndjson'))
+        self.assertEqual(response.status_code, 202)
+        result = json.loads(response.content)
+        self.assertEqual((result['total'], result['queued'], result['invalid']), (2, 0, 2))
+        self.assertEqual([item['index'] for item in result['results']], [0, 1])
+        self.assertEqual({item['status'] for item in result['results']}, {'invalid'})
+
+
+
+class GHLRequestTests(SimpleTestCase):
+    url = 'https://services.leadconnectorhq.com/contacts/'
+
+    def ghl_request(self, responses):
+        responses = iter(responses)
+        sent = []
+
+        def request_with_retry(method, url, limiter=None, headers=None, **kwargs):
+            # The headers dict is updated in place for the replay, so copy it
+            sent.append((dict(headers), kwargs))
+            return next(responses)
+
+        with mock.patch('accounts.ghl_tokens.token_manager') as manager, \
+                mock.patch('accounts.http_client.request_with_retry', side_effect=request_with_retry):
+            manager.get_access_token.return_value = 'old'
+            manager.refresh.return_value = {'access_token': 'new'}
+            response = http_client.ghl_request('GET', self.url, 'LOC', params={'limit': 1})
+        return response, manager, sent
+
+    def test_401_refreshes_the_token_and_replays(self):
+        with self.assertLogs('accounts.http_client', 'WARNING'):
+            response, manager, sent = self.ghl_request([fake_response(401), fake_response(200)])
+        self.assertEqual(response.status_code, 200)
+        manager.refresh.assert_called_once_with('LOC', stale_token='old')
+        self.assertEqual([headers['Authorization'] for headers, _ in sent], ['Bearer old', 'Bearer new'])
+        self.assertEqual([kwargs for _, kwargs in sent], [{'params': {'limit': 1}}] * 2)
+
+    def test_other_responses_are_returned_as_is(self):
+        response, manager, sent = self.ghl_request([fake_response(403)])
+        self.assertEqual(response.status_code, 403)
+        manager.refresh.assert_not_called()
+        self.assertEqual(len(sent), 1)
+
+
+class GHLTokenManagerTests(SimpleTestCase):
+    def credentials(self, location_id, expires_in_seconds):
+        return GHLAuthCredentials(
+            location_id=location_id, access_token=f'{location_id}-token', expires_in=3600,
+            updated_at=timezone.now() - datetime.timedelta(seconds=3600 - expires_in_seconds),
+        )
+
+    def test_refresh_due_refreshes_tokens_inside_the_window(self):
+        manager = GHLTokenManager(refresh_ahead=datetime.timedelta(minutes=30))
+        rows = [self.credentials('fresh', 3000), self.credentials('due', 600), self.credentials('broken', 60)]
+
+        def refresh(location_id, wait):
+            if location_id == 'broken':
+                raise GHLTokenError('refused')
+
+        with mock.patch.object(GHLAuthCredentials.objects, 'exclude', return_value=rows), \
+                mock.patch.object(manager, 'refresh', side_effect=refresh) as refresh_mock, \
+                self.assertLogs('accounts.ghl_tokens', 'ERROR'):
+            self.assertEqual(manager.refresh_due(), ['due'])
+        self.assertEqual([c.args[0] for c in refresh_mock.call_args_list], ['due', 'broken'])
+        self.assertEqual({c.kwargs['wait'] for c in refresh_mock.call_args_list}, {0})
+
+    def test_refresh_elsewhere_returns_the_stored_token(self):
+        manager = GHLTokenManager()
+        client = fakeredis.FakeRedis()
+        client.set(REFRESH_LOCK_KEY.format(location_id='LOC'), 'other-worker')
+        stored = {'location_id': 'LOC', 'access_token': 'new', 'expires_at': timezone.now()}
+        with mock.patch('accounts.locks.get_redis', return_value=client), \
+                mock.patch.object(manager, '_load', return_value=stored):
+            self.assertEqual(manager.refresh('LOC', stale_token='old', wait=0.2), stored)
+            # The holder has not stored a new token yet
+            with self.assertRaises(GHLTokenError):
+                manager.refresh('LOC', stale_token='new', wait=0.2)
+            # A proactive refresh keeps the still-valid token
+            self.assertEqual(manager.refresh('LOC', stale_token='new', wait=0), stored)
+
+
+
+class UserDirectoryTests(SimpleTestCase):
+    def setUp(self):
+        # Nothing is stored yet; writes are not part of these tests
+        for target, kwargs in [
+            ('accounts.directory.GHLUser.objects.filter', {'return_value': []}),
+            ('accounts.directory.UserDirectory._store', {}),
+            ('accounts.directory.connection', {}),
+        ]:
+            patcher = mock.patch(target, **kwargs)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.directory = UserDirectory('LOC', headers={}, max_workers=2)
+
+    def test_concurrent_misses_share_one_listing(self):
+        started, release = threading.Event(), threading.Event()
+
+        def list_users():
+            started.set()
+            release.wait(5)
+            return {'u1': {'name': 'One'}, 'u2': {'name': 'Two'}}
+
+        with mock.patch.object(self.directory, '_fetch_location_users', side_effect=list_users) as listing, \
+                mock.patch.object(self.directory, '_fetch_user') as fetch_user:
+            first = threading.Thread(target=self.directory.prefetch, args=(['u1'],))
+            first.start()
+            started.wait(5)
+            second = threading.Thread(target=self.directory.prefetch, args=(['u2'],))
+            second.start()
+            release.set()
+            first.join(5)
+            second.join(5)
+        listing.assert_called_once()
+        fetch_user.assert_not_called()
+        self.assertEqual(self.directory.get('u2'), {'name': 'Two'})
+
+    def test_failed_listing_is_retried(self):
+        listings = [None, {'u1': {'name': 'One'}}]
+        with mock.patch.object(self.directory, '_fetch_location_users', side_effect=listings), \
+                mock.patch.object(self.directory, '_fetch_user', side_effect=lambda user_id: (user_id, None)) as fetch_user:
+            self.assertEqual(self.directory.get('u1')['name'], '')
+            fetch_user.assert_called_once_with('u1')
+            self.directory.prefetch(['u3'])
+        # The retried listing replaces the placeholder of the failed lookup
+        self.assertEqual(self.directory.get('u1')['name'], 'One')
+        self.assertEqual(self.directory.get('u3')['name'], '')
+        self.assertTrue(self.directory._location_listed)
+
+
+
+class FieldLengthTests(SimpleTestCase):
+    def fields(self, *names):
+        return [Opportunity._meta.get_field(name) for name in names]
+
+    def test_casts_drop_length_and_precision(self):
+        self.assertEqual(
+            [_cast_type(field) for field in self.fields('name', 'monetary_value', 'contact_tags', 'updated_at')],
+            ['varchar', 'numeric', 'varchar[]', 'timestamp with time zone'],
+        )
+
+    def test_overlong_strings_are_clipped_with_a_warning(self):
+        opportunity = Opportunity(id='opp-1', name='n' * 300, status='open', contact_tags=['t' * 150, 'ok', None])
+        with self.assertLogs('accounts.bulk', 'WARNING') as logs:
+            _clip_to_max_length(Opportunity, [opportunity], self.fields('id', 'name', 'status', 'contact_tags'), 'id')
+        self.assertEqual(opportunity.name, 'n' * 255)
+        self.assertEqual(opportunity.contact_tags, ['t' * 100, 'ok', None])
+        self.assertEqual(opportunity.status, 'open')
+        self.assertEqual(len(logs.output), 2)
+
+
 if __name__ == "__main__":
-    test_webhook()
\ No newline at end of file
+    test_webhook()
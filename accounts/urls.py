@@ -1,11 +1,12 @@
 from django.urls import path
-from accounts.views import auth_connect,tokens,callback,smartvaultcallback,smartvault_auth,smartvault_refresh,smartvaultauth_connect,SmartVaultWebhookView
+from accounts.views import auth_connect,tokens,callback,smartvaultcallback,smartvault_auth,smartvault_refresh,smartvaultauth_connect,SmartVaultWebhookView,opportunity_list,opportunity_summary,ghl_webhook,smartvault_job_status,smartvault_batch_create
 
 
 urlpatterns = [
     path("auth/connect/", auth_connect, name="oauth_connect"),
     path("auth/tokens/", tokens, name="oauth_tokens"),
     path("auth/callback/", callback, name="oauth_callback"),
+    path("ghl/webhook/", ghl_webhook, name="ghl-webhook"),
     path("smartvault/callback/", smartvaultcallback),
 
 
@@ -14,4 +15,9 @@ urlpatterns = [
     path("smartvault/refresh/", smartvault_refresh, name="smartvault-refresh"),
 
     path('smartvault/webhook/', SmartVaultWebhookView.as_view(), name='smartvault_webhook'),
+    path('smartvault/jobs/<uuid:job_id>/', smartvault_job_status, name='smartvault-job-status'),
+    path('smartvault/clients/batch/', smartvault_batch_create, name='smartvault-batch-create'),
+
+    path("opportunities/", opportunity_list, name="opportunity-list"),
+    path("opportunities/summary/", opportunity_summary, name="opportunity-summary"),
 ]
\ No newline at end of file
@@ -3,7 +3,9 @@ import requests
 from django.http import JsonResponse
 import json
 from django.shortcuts import redirect
-from accounts.models import GHLAuthCredentials,Webhook, SmartVaultToken
+from accounts.models import Webhook
+from accounts import http_client
+from accounts.ghl_tokens import token_manager
 from django.views.decorators.csrf import csrf_exempt
 import logging
 from django.views import View
@@ -20,13 +22,13 @@ logger = logging.getLogger(__name__)
 GHL_CLIENT_ID = config("GHL_CLIENT_ID")
 GHL_CLIENT_SECRET = config("GHL_CLIENT_SECRET")
 GHL_REDIRECTED_URI = config("GHL_REDIRECTED_URI")
-TOKEN_URL = "https://services.leadconnectorhq.com/oauth/token"
+TOKEN_URL = f"{http_client.GHL_BASE_URL}/oauth/token"
 SCOPE = config("SCOPE")
 
 
 SMARTVAULT_CLIENT_ID = config("SMARTVAULT_CLIENT_ID")
 SMARTVAULT_CLIENT_SECRET = config("SMARTVAULT_CLIENT_SECRET")
-SMARTVAULT_TOKEN_BASE_URL = "https://rest.smartvault.com/auto/auth"
+SMARTVAULT_TOKEN_BASE_URL = f"{http_client.SMARTVAULT_BASE_URL}/auto/auth"
 SMARTVAULT_REDIRECT_URI=config("SMARTVAULT_REDIRECT_URI")
 
 def auth_connect(request):
@@ -63,26 +65,14 @@ def tokens(request):
         "code": authorization_code,
     }
 
-    response = requests.post(TOKEN_URL, data=data)
+    response = http_client.post(TOKEN_URL, data=data)
 
     try:
         response_data = response.json()
         if not response_data:
             return
 
-        obj, created = GHLAuthCredentials.objects.update_or_create(
-            location_id= response_data.get("locationId"),
-            defaults={
-                "access_token": response_data.get("access_token"),
-                "refresh_token": response_data.get("refresh_token"),
-                "expires_in": response_data.get("expires_in"),
-                "scope": response_data.get("scope"),
-                "user_type": response_data.get("userType"),
-                "company_id": response_data.get("companyId"),
-                "user_id":response_data.get("userId"),
-
-            }
-        )
+        token_manager.save_tokens(response_data)
         return JsonResponse({
             "message": "Authentication successful",
             "access_token": response_data.get('access_token'),
@@ -129,13 +119,10 @@ def smartvaultcallback(request):
 
 import json
 import requests
-from datetime import timedelta
 from django.http import JsonResponse
-from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
-from .models import SmartVaultToken
 from decouple import config
-import xml.etree.ElementTree as ET
+from accounts.smartvault import SmartVaultTokenError, get_access_token, parse_token_response, refresh_access_token, save_token
 
 
 
@@ -165,7 +152,7 @@ def smartvault_auth(request):
         "client_secret": SMARTVAULT_CLIENT_SECRET
     }
 
-    response = requests.post(f"{SMARTVAULT_TOKEN_BASE_URL}/dtoken/2", json=payload)
+    response = http_client.post(f"{SMARTVAULT_TOKEN_BASE_URL}/dtoken/2", json=payload)
 
     if response.status_code != 200:
         return JsonResponse({
@@ -173,30 +160,10 @@ def smartvault_auth(request):
             "details": response.text
         }, status=response.status_code)
 
-    # Parse XML response
-    root = ET.fromstring(response.text)
-    message = root.find("message")
-
-    data = {
-        "access_token": message.find("access_token").text,
-        "refresh_token": message.find("refresh_token").text,
-        "token_type": message.find("token_type").text,
-        "expires_in": int(message.find("expires_in").text),
-        "refresh_token_expires_in": int(message.find("refresh_token_expires_in").text),
-        "id": message.find("id").text,
-    }
-
-    # Save to DB
-    token, created = SmartVaultToken.objects.update_or_create(
-        user_id=data["id"],
-        defaults={
-            "access_token": data["access_token"],
-            "refresh_token": data["refresh_token"],
-            "token_type": data["token_type"],
-            "expires_at": timezone.now() + timedelta(seconds=data["expires_in"]),
-            "refresh_expires_at": timezone.now() + timedelta(seconds=data["refresh_token_expires_in"]),
-        }
-    )
+    try:
+        token = save_token(parse_token_response(response.text))
+    except SmartVaultTokenError as e:
+        return JsonResponse({"error": str(e), "details": e.details}, status=502)
 
     return JsonResponse({
         "user_id": token.user_id,
@@ -210,47 +177,10 @@ def smartvault_auth(request):
 
 @csrf_exempt
 def smartvault_refresh(request):
-
-
-    token = SmartVaultToken.objects.all().first()
-    payload = {
-        "grant_type": "refresh_token",
-        "client_secret": SMARTVAULT_CLIENT_SECRET,
-        "refresh_token": token.refresh_token,
-    }
-
-    response = requests.post(f"{SMARTVAULT_TOKEN_BASE_URL}/rtoken/2", json=payload)
-
-    if response.status_code != 200:
-        return JsonResponse({
-            "error": "Failed to refresh tokens",
-            "details": response.text
-        }, status=response.status_code)
-
-    # Parse XML response
-    root = ET.fromstring(response.text)
-    message = root.find("message")
-
-    data = {
-        "access_token": message.find("access_token").text,
-        "refresh_token": message.find("refresh_token").text,
-        "token_type": message.find("token_type").text,
-        "expires_in": int(message.find("expires_in").text),
-        "refresh_token_expires_in": int(message.find("refresh_token_expires_in").text),
-        "id": message.find("id").text,
-    }
-
-    # Save/Update in DB
-    token, created = SmartVaultToken.objects.update_or_create(
-        user_id=data["id"],
-        defaults={
-            "access_token": data["access_token"],
-            "refresh_token": data["refresh_token"],
-            "token_type": data["token_type"],
-            "expires_at": timezone.now() + timedelta(seconds=data["expires_in"]),
-            "refresh_expires_at": timezone.now() + timedelta(seconds=data["refresh_token_expires_in"]),
-        }
-    )
+    try:
+        token = refresh_access_token()
+    except SmartVaultTokenError as e:
+        return JsonResponse({"error": str(e), "details": e.details}, status=502)
 
     return JsonResponse({
         "user_id": token.user_id,
@@ -269,9 +199,8 @@ import requests
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.timezone import now
-from .models import SmartVaultToken  # assumes you store access_token here
 
-SMARTVAULT_BASE_URL = "https://rest.smartvault.com"
+SMARTVAULT_BASE_URL = http_client.SMARTVAULT_BASE_URL
 
 
 @csrf_exempt
@@ -296,12 +225,11 @@ def create_individual_client(request):
                 status=400,
             )
 
-        # Fetch latest token
-        token = SmartVaultToken.objects.first()
-        if not token or not token.access_token:
-            return JsonResponse({"error": "No SmartVault access token found"}, status=401)
+        try:
+            oauth_token = get_access_token()
+        except SmartVaultTokenError as e:
+            return JsonResponse({"error": str(e)}, status=401)
 
-        oauth_token = token.access_token
         headers = {
             "Authorization": f"Bearer {oauth_token}",
             "Content-Type": "application/json",
@@ -309,7 +237,7 @@ def create_individual_client(request):
         }
 
         # Get account info (to retrieve account_id)
-        account_resp = requests.get(
+        account_resp = http_client.get(
             f"{SMARTVAULT_BASE_URL}/nodes/entity/SmartVault.Accounting.Firm",
             headers=headers,
         )
@@ -358,7 +286,12 @@ def create_individual_client(request):
 
         # Create the client in SmartVault
         create_url = f"{SMARTVAULT_BASE_URL}/nodes/entity/SmartVault.Accounting.Firm/{account_id}/SmartVault.Accounting.FirmClient"
-        create_resp = requests.put(create_url, headers=headers, json=client_data)
+        create_resp = http_client.put(
+            create_url,
+            headers=headers,
+            json=client_data,
+            endpoint="PUT /nodes/entity/SmartVault.Accounting.Firm/{account_id}/SmartVault.Accounting.FirmClient",
+        )
 
         if create_resp.status_code not in (200, 201):
             return JsonResponse(
@@ -392,99 +325,14 @@ from django.conf import settings
 
 logger = logging.getLogger(__name__)
 
-class SmartVaultClientManager:
-    """SmartVault Client Management API"""
-    
-    def __init__(self, base_url: str = "https://rest.smartvault.com"):
-        self.base_url = base_url
-    
-    def create_person_client(self, oauth_token: str, account_id: str, client_data: Dict[str, Any]) -> Dict[str, Any]:
-        """
-        Create a SmartVault client as a person/individual
-        """
-        url = f"{self.base_url}/nodes/entity/SmartVault.Accounting.Firm/{account_id}/SmartVault.Accounting.FirmClient"
-        
-        headers = {
-            "Content-Type": "application/json",
-            "Accept": "application/json",
-            "Authorization": f"Bearer {oauth_token}"
-        }
-        
-        # Fixed default structure for person client (matching API documentation)
-        default_data = {
-            "entity": {
-                "meta_data": {
-                    "entity_definition": "SmartVault.Accounting.Client"
-                },
-                "smart_vault": {
-                    "accounting": {
-                        "client": {
-                            "type_qualifier": "Individual",
-                            "persons": [  # Changed from "person" to "persons" (array)
-                                {
-                                    "names": [
-                                        {
-                                            "FirstName": "John",
-                                            "MiddleName": "",
-                                            "LastName": "Doe"
-                                        }
-                                    ],
-                                    "email_addresses": [{"address": "john.doe@example.com"}],
-                                    "phone_numbers": [{"Number": "+1234567890"}]  # Changed "number" to "Number"
-                                }
-                            ],
-                            "client_salutation_override": "Mr.",
-                            "end_of_fiscal_year": 12,
-                            "tags": [],
-                            "aliases": [],
-                            "client_id": "DEFAULT_PERSON_CLIENT"
-                        }
-                    }
-                }
-            }
-        }
-        
-        # Merge with provided data
-        body = self._deep_merge(default_data, client_data)
-        
-        try:
-            print(f"\n=== Creating SmartVault Person Client ===")
-            client_info = body['entity']['smart_vault']['accounting']['client']
-            person_name = client_info['persons'][0]['names'][0]  # Fixed path
-            full_name = f"{person_name.get('FirstName', '')} {person_name.get('LastName', '')}"
-            
-            print(f"Account ID: {account_id}")
-            print(f"Client ID: {client_info['client_id']}")
-            print(f"Name: {full_name}")
-            print(f"Request URL: {url}")
-            print("Request Body:", json.dumps(body, indent=2))
-            
-            response = requests.put(url, headers=headers, json=body)
-            
-            print(f"Response Status: {response.status_code}")
-            if response.status_code != 200:
-                print(f"Error Response: {response.text}")
-                
-            response.raise_for_status()
-            return response.json()
-            
-        except requests.RequestException as e:
-            print(f"Request failed: {e}")
-            raise
-        except Exception as e:
-            print(f"Error creating person client: {e}")
-            raise
-    
-    def _deep_merge(self, default: Dict[str, Any], custom: Dict[str, Any]) -> Dict[str, Any]:
-        """Deep merge two dictionaries"""
-        import copy
-        result = copy.deepcopy(default)
-        for key, value in custom.items():
-            if key in result and isinstance(result[key], dict) and isinstance(value, dict):
-                result[key] = self._deep_merge(result[key], value)
-            else:
-                result[key] = value
-        return result
+import hmac
+from functools import wraps
+
+from celery import group
+from django.db import transaction
+from accounts.models import SmartVaultClientJob
+from accounts.smartvault import build_person_client, client_summary
+from accounts.tasks import create_smartvault_client
 
 
 @method_decorator(csrf_exempt, name='dispatch')
@@ -502,135 +350,47 @@ class SmartVaultWebhookView(View):
     }
     """
 
-    token = SmartVaultToken.objects.all().first()
-    
-    # Static configuration - Update these values
-    OAUTH_ACCESS_TOKEN = token.access_token  # Your OAuth token
-    ACCOUNT_ID = "mwdDxuks8kGhPsVdxb7U9A"  # Your SmartVault account ID
+    # Static configuration - the OAuth token comes from accounts.smartvault.get_access_token
+    ACCOUNT_ID = settings.SMARTVAULT_ACCOUNT_ID  # Your SmartVault account ID
     
     def post(self, request):
+        """
+        Validate the payload, store a SmartVaultClientJob and queue it; the
+        SmartVault PUT runs in the ``create_smartvault_client`` Celery task.
+        Responds 202 with the job ID to poll on ``smartvault/jobs/<job_id>/``.
+        """
         try:
-            # Parse JSON payload
-            try:
-                payload = json.loads(request.body)
-            except json.JSONDecodeError:
-                return JsonResponse({
-                    'success': False,
-                    'error': 'Invalid JSON payload'
-                }, status=400)
-            
-            # Validate required fields
-            required_fields = ['first_name', 'last_name']
-            missing_fields = [field for field in required_fields if not payload.get(field)]
-            
-            if missing_fields:
-                return JsonResponse({
-                    'success': False,
-                    'error': f'Missing required fields: {", ".join(missing_fields)}'
-                }, status=400)
-            
-            # Extract client data from payload
-            first_name = payload.get('first_name', '').strip()
-            last_name = payload.get('last_name', '').strip()
-            email = payload.get('email', '').strip()
-            phone = payload.get('phone', '').strip()
-            client_id=""
-            if not client_id:
-                if first_name:
-                    client_id += first_name
-                if last_name:
-                    client_id+= last_name
-                if email:
-                    client_id+=str(len(email))         
-            # Log the incoming request
-            logger.info(f"Creating SmartVault client for: {first_name} {last_name} (ID: {client_id})")
-            
-            # Build client data structure - FIXED VERSION
-            client_data = {
-                "entity": {
-                    "smart_vault": {
-                        "accounting": {
-                            "client": {
-                                "type_qualifier": "Individual",
-                                "persons": [  # Changed from "person" to "persons" (array)
-                                    {
-                                        "names": [
-                                            {
-                                                "FirstName": first_name,
-                                                "MiddleName": "",
-                                                "LastName": last_name
-                                            }
-                                        ],
-                                        "email_addresses": [],  # Will be populated below
-                                        "phone_numbers": []     # Will be populated below
-                                    }
-                                ],
-                                "client_salutation_override": self._determine_salutation(first_name),
-                                "end_of_fiscal_year": 12,
-                                "tags": [
-                                    {"value": "Individual"},
-                                    {"value": "Webhook Created"}
-                                ],
-                                "aliases": [],
-                                "client_id": client_id
-                            }
-                        }
-                    }
-                }
-            }
-            
-            # Add email if provided
-            if email:
-                client_data["entity"]["smart_vault"]["accounting"]["client"]["persons"][0]["email_addresses"].append({
-                    "address": email
-                })
-            
-            # Add phone if provided - FIXED: Using "Number" instead of "number"
-            if phone:
-                client_data["entity"]["smart_vault"]["accounting"]["client"]["persons"][0]["phone_numbers"].append({
-                    "Number": phone  # Changed from "number" to "Number"
-                })
-            
-            # Create SmartVault client
-            client_manager = SmartVaultClientManager()
-            
-            try:
-                response = client_manager.create_person_client(
-                    self.OAUTH_ACCESS_TOKEN,
-                    self.ACCOUNT_ID,
-                    client_data
-                )
-                
-                logger.info(f"Successfully created SmartVault client: {client_id}")
-                
-                return JsonResponse({
-                    'success': True,
-                    'message': 'Client created successfully',
-                    'client_data': {
-                        'client_id': client_id,
-                        'name': f"{first_name} {last_name}",
-                        'email': email or None,
-                        'phone': phone or None
-                    },
-                    'smartvault_response': response
-                })
-                
-            except requests.RequestException as e:
-                logger.error(f"SmartVault API error for client {client_id}: {str(e)}")
-                return JsonResponse({
-                    'success': False,
-                    'error': 'Failed to create client in SmartVault',
-                    'details': str(e)
-                }, status=500)
-            
-        except Exception as e:
-            logger.error(f"Unexpected error in webhook: {str(e)}")
+            payload = json.loads(request.body)
+        except json.JSONDecodeError:
             return JsonResponse({
                 'success': False,
-                'error': 'Internal server error',
-                'details': str(e)
-            }, status=500)
-    
+                'error': 'Invalid JSON payload'
+            }, status=400)
+
+        client_data, errors = build_person_client(payload)
+        if errors:
+            return JsonResponse({
+                'success': False,
+                'error': '; '.join(errors)
+            }, status=400)
+
+        summary = client_summary(client_data)
+        job = SmartVaultClientJob.objects.create(
+            client_id=summary['client_id'],
+            account_id=self.ACCOUNT_ID,
+            client_data=client_data,
+        )
+        transaction.on_commit(lambda: create_smartvault_client.delay(str(job.id)))
+        logger.info(f"Queued SmartVault client {summary['client_id']} as job {job.id}")
+
+        return JsonResponse({
+            'success': True,
+            'message': 'Client creation queued',
+            'job_id': str(job.id),
+            'status': job.status,
+            'client_data': summary,
+        }, status=202)
+
     def get(self, request):
         """Health check endpoint"""
         return JsonResponse({
@@ -640,18 +400,179 @@ class SmartVaultWebhookView(View):
             'required_fields': ['first_name', 'last_name', 'client_id'],
             'optional_fields': ['email', 'phone']
         })
-    
-    def _determine_salutation(self, first_name: str) -> str:
-        """Simple salutation determination based on common names"""
-        # This is a basic implementation - you might want to use a more sophisticated approach
-        common_male_names = ['john', 'james', 'robert', 'michael', 'william', 'david', 'richard', 'joseph', 'thomas', 'christopher']
-        common_female_names = ['mary', 'patricia', 'jennifer', 'linda', 'elizabeth', 'barbara', 'susan', 'jessica', 'sarah', 'karen']
-        
-        name_lower = first_name.lower()
-        
-        if name_lower in common_male_names:
-            return "Mr."
-        elif name_lower in common_female_names:
-            return "Ms."
-        else:
-            return "Mr."  # Default fallback
+
+
+def _parse_batch_body(request):
+    """Clients of a batch request: a JSON array (or {"clients": [...]}) or NDJSON, one client per line"""
+    if request.content_type in ('application/x-ndjson', 'application/jsonl'):
+        items = []
+        for line in request.body.decode().splitlines():
+            if not line.strip():
+                continue
+            try:
+                items.append(json.loads(line))
+            except json.JSONDecodeError:
+                items.append(line)  # Reported as an invalid item
+        return items
+
+    payload = json.loads(request.body)
+    if isinstance(payload, dict):
+        payload = payload.get('clients')
+    if not isinstance(payload, list):
+        raise ValueError('Expected a JSON array of clients')
+    return payload
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def smartvault_batch_create(request):
+    """
+    Queue many SmartVault client creations in one request.
+
+    Accepts a JSON array (or ``{"clients": [...]}``) or NDJSON
+    (``Content-Type: application/x-ndjson``) of webhook-style client payloads.
+    Every item is validated up front; each valid one is stored as a
+    SmartVaultClientJob and the jobs are queued as one Celery group of
+    ``create_smartvault_client`` tasks, which share the SmartVault rate limit.
+    Responds 202 with one result per item, in input order: the job ID to poll
+    on ``smartvault/jobs/<job_id>/`` or the validation errors.
+    """
+    try:
+        items = _parse_batch_body(request)
+    except (ValueError, UnicodeDecodeError) as e:
+        return JsonResponse({'success': False, 'error': f'Invalid batch payload: {e}'}, status=400)
+
+    max_items = getattr(settings, 'SMARTVAULT_BATCH_MAX_ITEMS', 1000)
+    if len(items) > max_items:
+        return JsonResponse({'success': False, 'error': f'At most {max_items} clients per batch'}, status=413)
+
+    results = []
+    jobs = []
+    for index, item in enumerate(items):
+        client_data, errors = build_person_client(item)
+        if errors:
+            results.append({'index': index, 'status': 'invalid', 'errors': errors})
+            continue
+        summary = client_summary(client_data)
+        job = SmartVaultClientJob(client_id=summary['client_id'], account_id=settings.SMARTVAULT_ACCOUNT_ID, client_data=client_data)
+        jobs.append(job)
+        results.append({'index': index, 'status': job.status, 'job_id': str(job.id), 'client_data': summary})
+
+    if jobs:
+        with transaction.atomic():
+            SmartVaultClientJob.objects.bulk_create(jobs)
+            job_ids = [str(job.id) for job in jobs]
+            transaction.on_commit(lambda: group(create_smartvault_client.s(job_id) for job_id in job_ids).apply_async())
+        logger.info(f"Queued {len(jobs)} SmartVault clients, {len(items) - len(jobs)} invalid")
+
+    return JsonResponse({
+        'success': len(jobs) == len(items),
+        'total': len(items),
+        'queued': len(jobs),
+        'invalid': len(items) - len(jobs),
+        'results': results,
+    }, status=202)
+
+
+def dashboard_auth_required(view):
+    """
+    Allow a logged-in Django user, or a request carrying one of
+    ``DASHBOARD_API_KEYS`` as ``Authorization: Bearer <key>`` or ``X-API-Key``.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return view(request, *args, **kwargs)
+
+        authorization = request.headers.get("Authorization", "")
+        key = authorization[len("Bearer "):] if authorization.startswith("Bearer ") else request.headers.get("X-API-Key", "")
+        if key and any(hmac.compare_digest(key, allowed) for allowed in settings.DASHBOARD_API_KEYS):
+            return view(request, *args, **kwargs)
+        return JsonResponse({"error": "Authentication required"}, status=401)
+    return wrapper
+
+
+@require_http_methods(["GET"])
+@dashboard_auth_required
+def smartvault_job_status(request, job_id):
+    """Status and result of a queued SmartVault client creation"""
+    job = SmartVaultClientJob.objects.filter(id=job_id).first()
+    if job is None:
+        return JsonResponse({"error": "Job not found"}, status=404)
+    return JsonResponse(job.as_dict())
+
+
+
+
+from accounts.dashboard import QueryError, cached_query, list_opportunities, pipeline_summary
+
+
+@require_http_methods(["GET"])
+@dashboard_auth_required
+def opportunity_list(request):
+    """
+    Keyset-paginated opportunity list for the dashboard.
+
+    Query params: location_id (required), pipeline_id, pipeline_stage_id,
+    assigned_to, status, updated_after, updated_before, fields, limit, cursor.
+    Pass ``next_cursor`` from the response as ``cursor`` to get the next page.
+    """
+    try:
+        return JsonResponse(cached_query('opportunities', request.GET, list_opportunities))
+    except QueryError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+
+@require_http_methods(["GET"])
+@dashboard_auth_required
+def opportunity_summary(request):
+    """
+    Opportunity count and value per pipeline/stage/status/assignee, read from the
+    OpportunitySummary rollup. Query params: the opportunity_list filters and
+    group_by (e.g. ``group_by=pipeline_id,status``).
+    """
+    try:
+        return JsonResponse(cached_query('summary', request.GET, pipeline_summary))
+    except QueryError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+
+
+
+from accounts.tasks import process_ghl_webhook
+from accounts.webhooks import SUPPORTED_EVENTS, verify_signature
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def ghl_webhook(request):
+    """
+    GoHighLevel webhook receiver.
+
+    Stores every event and queues the supported contact/opportunity events
+    (see ``webhooks.SUPPORTED_EVENTS``) for ``process_ghl_webhook``, so the
+    response does not wait on the database upsert or any GoHighLevel lookups.
+    Requests without a valid ``x-wh-signature`` are rejected before anything
+    is stored.
+    """
+    if not verify_signature(request.body, request.headers.get("x-wh-signature")):
+        return JsonResponse({"error": "Invalid signature"}, status=401)
+
+    try:
+        payload = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({"error": "Invalid JSON"}, status=400)
+    if not isinstance(payload, dict) or not payload.get("type"):
+        return JsonResponse({"error": "Missing event type"}, status=400)
+
+    webhook = Webhook.objects.create(
+        event=payload["type"],
+        company_id=payload.get("companyId") or "",
+        location_id=payload.get("locationId"),
+        payload=payload,
+    )
+    queued = webhook.event in SUPPORTED_EVENTS
+    if queued:
+        transaction.on_commit(lambda: process_ghl_webhook.delay(webhook.id))
+
+    return JsonResponse({"received": True, "webhook_id": webhook.id, "queued": queued})
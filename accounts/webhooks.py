@@ -0,0 +1,239 @@
+# webhooks.py
+"""
+Apply GoHighLevel webhook events to the local Contact and Opportunity tables.
+
+Each event becomes a single-row upsert or delete through the same code paths
+as the syncs (fingerprints, ``bulk.upsert``). Rows are stamped with a fresh
+generation, so a full sync that is already running does not sweep them.
+GoHighLevel does not guarantee delivery order: an upsert never overwrites a
+row updated later upstream, and deletes leave a ``Tombstone`` so a late
+create/update is dropped. The affected pipeline summary groups are adjusted
+in the same transaction and the location's dashboard cache is bumped.
+"""
+import base64
+import binascii
+import datetime
+import functools
+import logging
+
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from accounts.dashboard import apply_summary_delta, bump_dashboard_version, lock_pipeline_summaries
+from accounts.directory import invalidate_pipelines
+from accounts.ghl_tokens import GHLTokenError, token_manager
+from accounts.models import Contact, Opportunity, Tombstone
+from accounts.services import GHLOpportunityFetcher, next_sync_generation, upsert_contacts
+
+logger = logging.getLogger(__name__)
+
+OPPORTUNITY_UPSERT_EVENTS = {'OpportunityCreate', 'OpportunityUpdate', 'OpportunityStageUpdate'}
+CONTACT_UPSERT_EVENTS = {'ContactCreate', 'ContactUpdate'}
+DELETE_EVENTS = {'OpportunityDelete', 'ContactDelete'}
+CONTACT_EVENTS = CONTACT_UPSERT_EVENTS | {'ContactDelete'}
+SUPPORTED_EVENTS = OPPORTUNITY_UPSERT_EVENTS | CONTACT_UPSERT_EVENTS | DELETE_EVENTS
+
+
+class WebhookError(Exception):
+    """An event that cannot be applied (unknown location, missing IDs)"""
+
+
+@functools.lru_cache(maxsize=1)
+def _public_key():
+    return serialization.load_pem_public_key(settings.GHL_WEBHOOK_PUBLIC_KEY.encode())
+
+
+def verify_signature(body, signature):
+    """
+    True if ``signature`` (the base64 ``x-wh-signature`` header) is GoHighLevel's
+    RSA-SHA256 signature of the raw request ``body``.
+    """
+    if not signature:
+        return False
+    if not settings.GHL_WEBHOOK_PUBLIC_KEY:
+        logger.error("GHL_WEBHOOK_PUBLIC_KEY is not set, rejecting webhook")
+        return False
+    try:
+        _public_key().verify(base64.b64decode(signature), body, padding.PKCS1v15(), hashes.SHA256())
+    except (InvalidSignature, binascii.Error, ValueError):
+        return False
+    return True
+
+
+def apply_webhook(webhook):
+    """
+    Apply one stored Webhook and record the outcome on it.
+
+    Returns:
+        str: What was done (``"created"``, ``"updated"``, ``"skipped"``,
+        ``"deleted"`` or ``"ignored"``).
+    """
+    try:
+        outcome = apply_event(webhook.event, webhook.payload, webhook.received_at)
+        webhook.error = ''
+    except Exception as e:
+        logger.error(f"Failed to apply webhook {webhook.id} ({webhook.event}): {e}", exc_info=True)
+        webhook.error = str(e)
+        outcome = 'failed'
+    webhook.processed_at = timezone.now()
+    webhook.save(update_fields=['processed_at', 'error'])
+    return outcome
+
+
+def apply_event(event, payload, received_at=None):
+    if event not in SUPPORTED_EVENTS:
+        return 'ignored'
+
+    location_id = payload.get('locationId')
+    record_id = payload.get('id')
+    if not location_id or not record_id:
+        raise WebhookError(f"{event} payload without locationId/id")
+
+    kind = Tombstone.CONTACT if event in CONTACT_EVENTS else Tombstone.OPPORTUNITY
+    existing = Opportunity.objects.filter(id=record_id).first() if kind == Tombstone.OPPORTUNITY else None
+    if event in OPPORTUNITY_UPSERT_EVENTS:
+        # GoHighLevel lookups happen before the transaction, which only writes
+        fetcher, opp_data, pipeline_name = _prepare_opportunity(location_id, payload, existing, received_at)
+
+    with transaction.atomic():
+        # Events of one record are applied one at a time, so a delete and a
+        # create racing in two workers cannot interleave
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", [f"webhook:{kind}:{record_id}"])
+        if kind == Tombstone.OPPORTUNITY:
+            # A stage/pipeline move changes the groups of both the old and the new pipeline
+            pipeline_ids = {payload.get('pipelineId'), existing.pipeline_id if existing else None}
+            lock_pipeline_summaries(location_id, pipeline_ids)
+            before = Opportunity.objects.select_for_update().filter(id=record_id).first()
+            if before is not None and before.pipeline_id not in pipeline_ids:
+                # Moved by a sync since it was read above
+                lock_pipeline_summaries(location_id, [before.pipeline_id])
+
+        if event in DELETE_EVENTS:
+            outcome = _delete(kind, location_id, record_id, payload, received_at)
+        elif Tombstone.objects.filter(kind=kind, record_id=record_id).exists():
+            # Deleted upstream; a late create/update must not bring the row back
+            outcome = 'skipped'
+        elif kind == Tombstone.CONTACT:
+            outcome = _outcome(upsert_contacts([payload], next_sync_generation()))
+        else:
+            outcome = _outcome(fetcher.upsert_opportunities([opp_data], pipeline_name, next_sync_generation()))
+
+        if kind == Tombstone.OPPORTUNITY and outcome != 'skipped':
+            apply_summary_delta(before, Opportunity.objects.filter(id=record_id).first())
+
+    if outcome != 'skipped':
+        bump_dashboard_version(location_id)
+    logger.info(f"Applied {event} for {record_id}: {outcome}")
+    return outcome
+
+
+def _outcome(report):
+    for outcome in ('created', 'updated'):
+        if report[outcome]:
+            return outcome
+    return 'skipped'
+
+
+def _delete(kind, location_id, record_id, payload, received_at):
+    """Delete the record and leave a Tombstone for late create/update events"""
+    deleted_at = parse_datetime(payload['dateUpdated']) if payload.get('dateUpdated') else None
+    Tombstone.objects.update_or_create(
+        kind=kind, record_id=record_id,
+        defaults={'location_id': location_id, 'deleted_at': deleted_at or received_at or timezone.now()},
+    )
+    if kind == Tombstone.CONTACT:
+        deleted, _ = Contact.objects.filter(contact_id=record_id).delete()
+    else:
+        deleted, _ = Opportunity.objects.filter(id=record_id).delete()
+    return 'deleted' if deleted else 'skipped'
+
+
+def prune_tombstones():
+    """Drop the tombstones older than ``GHL_WEBHOOK_TOMBSTONE_TTL``"""
+    ttl = getattr(settings, 'GHL_WEBHOOK_TOMBSTONE_TTL', datetime.timedelta(days=7))
+    deleted, _ = Tombstone.objects.filter(deleted_at__lt=timezone.now() - ttl).delete()
+    logger.info(f"Pruned {deleted} webhook tombstones")
+    return deleted
+
+
+def _prepare_opportunity(location_id, payload, existing, received_at):
+    """
+    Build the opportunity dict of a webhook payload, filling what the event
+    does not carry. Pipeline metadata and the assignee are resolved here so
+    the write itself makes no GoHighLevel requests.
+
+    Returns:
+        tuple: ``(fetcher, opp_data, pipeline_name)``.
+    """
+    try:
+        access_token = token_manager.get_access_token(location_id)
+    except GHLTokenError as e:
+        raise WebhookError(str(e))
+
+    fetcher = GHLOpportunityFetcher(access_token, location_id)
+    fetcher.fetch_pipeline_data()
+    pipeline_id = payload.get('pipelineId', '')
+    stage_id = payload.get('pipelineStageId')
+    known = fetcher.pipeline_cache.get(pipeline_id)
+    if pipeline_id and (known is None or (stage_id and stage_id not in known['stages'])):
+        # Pipeline or stage created upstream since the metadata was cached
+        invalidate_pipelines(location_id)
+        fetcher.fetch_pipeline_data()
+    pipeline_name = fetcher.pipeline_cache.get(pipeline_id, {}).get('name') or (existing.pipeline_name if existing else '')
+    fetcher.users.prefetch({payload.get('assignedTo')})
+
+    # Opportunity events carry no dateUpdated. The receive time is later than
+    # GoHighLevel's own updatedAt and would block every sync of the row (see
+    # bulk.upsert's newer_field), so fall back to a time that is never after
+    # it: the stored updated_at, else the creation time (the receive time only
+    # for a new row whose event carries neither).
+    updated_at = payload.get('dateUpdated') or (
+        existing.updated_at.isoformat() if existing else payload.get('dateAdded') or (received_at or timezone.now()).isoformat()
+    )
+    opp_data = {
+        'id': payload['id'],
+        'name': payload.get('name', ''),
+        'monetaryValue': payload.get('monetaryValue') or 0,
+        'pipelineId': pipeline_id,
+        'pipelineStageId': payload.get('pipelineStageId', ''),
+        'assignedTo': payload.get('assignedTo', ''),
+        'status': payload.get('status', ''),
+        'locationId': location_id,
+        'createdAt': payload.get('dateAdded') or (existing.created_at.isoformat() if existing else None),
+        'updatedAt': updated_at,
+        'contact': _webhook_contact(payload.get('contactId'), existing),
+    }
+    return fetcher, opp_data, pipeline_name
+
+
+def _webhook_contact(contact_id, existing):
+    """
+    Contact details for an opportunity event, which only carries the contact ID.
+    Taken from the Contact table, falling back to the values already on the row.
+    """
+    contact = Contact.objects.filter(contact_id=contact_id).first() if contact_id else None
+    if contact is not None:
+        return {
+            'id': contact_id,
+            'name': f"{contact.first_name or ''} {contact.last_name or ''}".strip(),
+            'companyName': existing.contact_company_name if existing else '',
+            'email': contact.email or '',
+            'phone': contact.phone or '',
+            'tags': contact.tags or [],
+        }
+    if existing is not None:
+        return {
+            'id': contact_id or existing.contact_id,
+            'name': existing.contact_name,
+            'companyName': existing.contact_company_name,
+            'email': existing.contact_email,
+            'phone': existing.contact_phone,
+            'tags': existing.contact_tags,
+        }
+    return {'id': contact_id or ''}
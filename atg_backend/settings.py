@@ -11,7 +11,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 from pathlib import Path
-from decouple import config
+from decouple import config, Csv
 import os
 from datetime import timedelta
 
@@ -136,6 +136,18 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': config("REDIS_CACHE_URL", default='redis://localhost:6379/1'),
+    }
+}
+
+
+# Coordination state shared by all workers (rate limits, locks)
+REDIS_URL = config("REDIS_URL", default='redis://localhost:6379/2')
+
+
 CELERY_BROKER_URL = 'redis://localhost:6379/0'
 CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'
 CELERY_ACCEPT_CONTENT = ['json']
@@ -144,10 +156,54 @@ CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
 
 
+# Outbound HTTP (accounts/http_client.py)
+HTTP_CLIENT_TIMEOUT = (5, 30)  # (connect, read) seconds
+HTTP_CLIENT_POOL_MAXSIZE = config("HTTP_CLIENT_POOL_MAXSIZE", default=10, cast=int)  # keep-alive connections per host
+HTTP_CLIENT_MAX_RETRIES = 5  # retries on 429/5xx/connection errors for rate-limited calls
+
+
+# GoHighLevel sync
+GHL_SYNC_MAX_WORKERS = config("GHL_SYNC_MAX_WORKERS", default=3, cast=int)  # pipelines fetched in parallel
+GHL_SYNC_CHUNK_SIZE = config("GHL_SYNC_CHUNK_SIZE", default=500, cast=int)  # rows written per transaction
+GHL_BULK_LOAD_CHUNK_SIZE = config("GHL_BULK_LOAD_CHUNK_SIZE", default=5000, cast=int)  # rows per COPY on full syncs
+GHL_FULL_SYNC_INTERVAL = timedelta(days=7)  # full reconciliation (with deletions) between incremental runs
+GHL_INCREMENTAL_OVERLAP = timedelta(minutes=5)  # re-read window before the stored high-water mark
+GHL_SYNC_RESUME_MAX_AGE = timedelta(hours=24)  # interrupted runs younger than this resume from their checkpoint
+GHL_USER_CACHE_TTL = timedelta(hours=24)  # how long GHLUser rows are trusted before refetching
+GHL_PIPELINE_CACHE_TTL = 6 * 60 * 60  # seconds pipeline/stage metadata stays in the cache
+GHL_RATE_LIMIT_PER_SECOND = 10  # default refill rate until X-RateLimit-* headers are seen
+GHL_RATE_LIMIT_BURST = 100
+GHL_TOKEN_CACHE_TTL = 60  # seconds a process reuses its in-memory access token
+GHL_TOKEN_REFRESH_AHEAD = timedelta(minutes=30)  # refresh tokens this long before updated_at + expires_in
+GHL_SYNC_LEASE_TTL = 5 * 60  # seconds a sync lease outlives its last heartbeat before another worker may take it
+GHL_SYNC_WORKFLOW_LEASE_TTL = 60 * 60  # seconds a location sync stays locked without a piece starting, running or ending
+GHL_SYNC_TASK_MAX_RETRIES = 3  # retries of each contacts/pipeline piece of a location sync
+GHL_SYNC_PIPELINES = config("GHL_SYNC_PIPELINES", default='', cast=Csv())  # pipeline names or IDs to sync; empty = all
+
+# GoHighLevel webhooks (accounts/webhooks.py)
+# PEM public key GoHighLevel signs x-wh-signature with (newlines may be written as \n);
+# webhooks are rejected while it is not set
+GHL_WEBHOOK_PUBLIC_KEY = config("GHL_WEBHOOK_PUBLIC_KEY", default='').replace('\\n', '\n')
+GHL_WEBHOOK_TOMBSTONE_TTL = timedelta(days=7)  # how long a delete event blocks late create/update events of the record
+
+# SmartVault (accounts/smartvault.py)
+SMARTVAULT_ACCOUNT_ID = config("SMARTVAULT_ACCOUNT_ID", default="mwdDxuks8kGhPsVdxb7U9A")
+SMARTVAULT_CLIENT_MAX_RETRIES = 3  # Celery retries of a client creation on 429/5xx/connection errors
+SMARTVAULT_TOKEN_CACHE_TTL = 60  # seconds a process reuses its in-memory access token
+SMARTVAULT_TOKEN_REFRESH_AHEAD = timedelta(minutes=10)  # refresh in the background this long before expires_at
+SMARTVAULT_BATCH_MAX_ITEMS = 1000
+SMARTVAULT_RATE_LIMIT_PER_SECOND = 5
+SMARTVAULT_RATE_LIMIT_BURST = 10
+
+# Dashboard read endpoints (accounts/dashboard.py)
+DASHBOARD_CACHE_TTL = 60 * 60  # seconds; entries are also invalidated by sync version bumps
+DASHBOARD_API_KEYS = config("DASHBOARD_API_KEYS", default='', cast=Csv())  # keys accepted besides a logged-in session
+
+
 CELERY_BEAT_SCHEDULE = {
     'make-api-call-every-minute': {
         'task': 'accounts.tasks.make_api_call',
-        'schedule': timedelta(hours=20),
+        'schedule': timedelta(minutes=15),
     },
     'sync_opportunity_and_call': {
         'task': 'accounts.tasks.contact_and_opportunity_sync_task',
@@ -157,4 +213,8 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'accounts.tasks.refresh_smartvault_token',
         'schedule': timedelta(hours=21),
     },
+    'prune_webhook_tombstones': {
+        'task': 'accounts.tasks.prune_webhook_tombstones',
+        'schedule': timedelta(days=1),
+    },
 }
\ No newline at end of file